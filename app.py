@@ -1,15 +1,75 @@
 import streamlit as st
 import json
+import shutil
+import sys
 import cv2
 import numpy as np
 
-from modules.opencv_processing import find_blocks_and_build_tree
-from modules.color_processing import detect_colors
-from modules.text_recognition_processing import extract_text
-from modules.render_bboxes import annotate_image
-from modules.html_processing import generate_html
+from modules import instrumentation
+from modules.color_processing import color_path_counts, reset_color_path_counts
+from modules.pipeline import analyze_blocks
+from modules.ndjson_stream import iter_block_records, dumps_record, TreeBuilder
+from modules.result_cache import ResultCache, make_cache_key
+from modules.roi_store import RoiStore
+from modules.segmentation_dag import SegmentationMemo
+from modules.render_bboxes import render_annotations
+from modules.tile_pyramid import write_tile_pyramid, read_viewport, level_shape
+from modules.html_processing import generate_html_pages
 from ui_panel import render_control_panel
 
+RESULT_CACHE_DIR = ".layout_cache"
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+ROI_STORE_PATH = ".roi_store.sqlite"
+ROI_STORE_MAX_BYTES = 256 * 1024 * 1024
+SEGMENTATION_MEMO_ENTRIES = 4
+METRICS_BASE_PATH = "output-metrics"
+NDJSON_PATH = "output-blocks.ndjson"
+STREAM_CHUNK_SIZE = 16
+HTML_OUTPUT_PATH = "blocks.html"
+HTML_PAGE_SIZE = 200
+TILES_DIR = "annotated_tiles"
+TILE_SIZE = 512
+VIEWPORT_WIDTH, VIEWPORT_HEIGHT = 1280, 960
+
+@st.cache_resource
+def get_result_cache():
+    # Один экземпляр кеша на процесс Streamlit (переживает перезапуски скрипта)
+    return ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_roi_store():
+    # Цвета и текст повторяющихся фрагментов (шапки, меню, кнопки) между запусками
+    return RoiStore(ROI_STORE_PATH, ROI_STORE_MAX_BYTES)
+
+@st.cache_resource
+def warm_models():
+    # Загрузка и самопроверка моделей один раз на процесс Streamlit
+    from modules.warmup import warmup
+    return warmup()
+
+def save_metrics():
+    # Метрики сохраняются рядом с output-coordinates.json
+    if instrumentation.is_enabled():
+        st.session_state.metrics = instrumentation.snapshot()
+        instrumentation.write_metrics(METRICS_BASE_PATH, st.session_state.metrics)
+
+def process_streaming(image, params, roi_store):
+    # Блоки пишутся в NDJSON по мере анализа, частичное дерево показывается сразу
+    table = st.session_state.segmentation_memo.run_table(params)
+    progress = st.progress(0.0, text="Анализ блоков...")
+    partial_view = st.empty()
+    builder = TreeBuilder()
+    with open(NDJSON_PATH, "w", encoding="utf-8") as f:
+        for record in iter_block_records(image, params, STREAM_CHUNK_SIZE, table=table, roi_store=roi_store):
+            f.write(dumps_record(record) + "\n")
+            f.flush()
+            builder.add(record)
+            if builder.n_blocks % STREAM_CHUNK_SIZE == 0 or builder.n_blocks == len(table):
+                progress.progress(builder.n_blocks / len(table), text=f"Блоков готово: {builder.n_blocks} из {len(table)}")
+                partial_view.json(builder.tree, expanded=False)
+    partial_view.empty()
+    return builder.tree
+
 def main():
     
     # Если ещё нет ключей для хранения результата, создадим
@@ -17,6 +77,21 @@ def main():
         st.session_state.result_json = None
     if "original_image" not in st.session_state:
         st.session_state.original_image = None
+    if "original_image_bytes" not in st.session_state:
+        st.session_state.original_image_bytes = None
+    if "segmentation_memo" not in st.session_state:
+        st.session_state.segmentation_memo = None
+    if "metrics" not in st.session_state:
+        st.session_state.metrics = None
+    if "html_pages" not in st.session_state:
+        st.session_state.html_pages = None
+    if "tiles_meta" not in st.session_state:
+        st.session_state.tiles_meta = None
+
+    # Прогрев моделей: streamlit run app.py -- --warmup или кнопка в боковой панели
+    if "--warmup" in sys.argv[1:] or st.sidebar.button("Прогреть модели"):
+        with st.spinner("Загрузка и самопроверка моделей..."):
+            st.sidebar.json(warm_models())
 
     st.title("Layout Mapper")
     st.subheader("Based on: OpenCV, EasyOSR, Scikit-learn")
@@ -24,10 +99,17 @@ def main():
     # 1. Загрузка изображения
     uploaded_img = st.file_uploader("Загрузите изображение", type=["png", "jpg", "jpeg"])
     if uploaded_img is not None:
-        uploaded_img_uint8 = np.frombuffer(uploaded_img.getvalue(), np.uint8)
-        uploaded_img_rgb = cv2.imdecode(uploaded_img_uint8, cv2.IMREAD_COLOR)
-        st.session_state.original_image = uploaded_img_rgb
-        st.image(cv2.cvtColor(uploaded_img_rgb, cv2.COLOR_BGR2RGB), caption="Uploaded image", use_container_width=True)
+        if uploaded_img.getvalue() != st.session_state.original_image_bytes:
+            uploaded_img_uint8 = np.frombuffer(uploaded_img.getvalue(), np.uint8)
+            uploaded_img_rgb = cv2.imdecode(uploaded_img_uint8, cv2.IMREAD_COLOR)
+            st.session_state.original_image = uploaded_img_rgb
+            st.session_state.original_image_bytes = uploaded_img.getvalue()
+            # Новое изображение - промежуточные результаты сегментации старого не нужны.
+            # Пока изображение то же, при смене параметров пересчитываются только
+            # стадии, зависящие от изменённых параметров (см. segmentation_dag)
+            st.session_state.segmentation_memo = SegmentationMemo(uploaded_img_rgb, SEGMENTATION_MEMO_ENTRIES)
+        st.image(cv2.cvtColor(st.session_state.original_image, cv2.COLOR_BGR2RGB), caption="Uploaded image",
+                 use_container_width=True)
 
     # 2. Отрисовка панели настроек и выгрузка параметров из панели управления (через форму)
     render_control_panel()
@@ -38,33 +120,65 @@ def main():
 
     # 4. Кнопка "Process Image"
     if st.session_state.original_image is not None:
+        collect_metrics = st.checkbox("Собирать метрики (время стадий, счётчики)", value=False)
+        instrumentation.enable(collect_metrics)
+        streaming = st.checkbox(f"Потоковый вывод блоков ({NDJSON_PATH})", value=False)
         if st.button("Process Image"):
 
-            def extract_text_and_color(block, image, parent_key=""):
-                for key, data in block.items():
-                    # Определяем фон
-                    bg_info = detect_colors(data, image)
-                    data.update(bg_info)
-                    
-                    # Распознаем текст
-                    text_info = extract_text(data, image)
-                    data.update(text_info)
-                    
-                    # Обрабатываем детей
-                    if data["children"]:
-                        extract_text_and_color(data["children"], image, f"{parent_key}_{key}")
-
-            # Считываем изображение и идентифицируем структурные блоки
-            result_json = find_blocks_and_build_tree(st.session_state.original_image, get_params())
-            # Для каждого блока - определяем фон, распознаём текст
-            extract_text_and_color(result_json["block_00"]["children"], st.session_state.original_image)
+            params = get_params()
+            instrumentation.reset()
+
+            # Если это изображение уже обрабатывалось с теми же параметрами - берём результат из кеша
+            result_cache = get_result_cache()
+            cache_key = make_cache_key(st.session_state.original_image_bytes, params)
+            result_json = result_cache.get(cache_key)
+
+            if result_json is None:
+                reset_color_path_counts()
+                roi_store = get_roi_store()
+                roi_store.reset_stats()
+                if streaming:
+                    result_json = process_streaming(st.session_state.original_image, params, roi_store)
+                else:
+                    # Идентифицируем структурные блоки (стадии сегментации - из кеша изображения)
+                    result_json = st.session_state.segmentation_memo.run(params)
+                    # Для каждого блока - определяем фон, распознаём текст (повторяющиеся фрагменты - из хранилища)
+                    analyze_blocks(result_json, st.session_state.original_image, params, roi_store)
+                st.info(f"Определение цветов, блоков по веткам: {color_path_counts()}")
+                st.caption(f"Хранилище фрагментов ({ROI_STORE_PATH}): {roi_store.stats()}")
+                st.caption(f"Кеш стадий сегментации: {st.session_state.segmentation_memo.stats()}")
+                result_cache.put(cache_key, result_json)
+
+                save_metrics()
+            st.caption(f"Кеш результатов: {result_cache.stats()}")
             st.session_state.result_json = result_json
+            st.session_state.html_pages = None
+            st.session_state.tiles_meta = None
 
             # Сохраняем JSON локально
             with open("output-coordinates.json", "w", encoding="utf-8") as f:
                 json.dump(result_json, f, ensure_ascii=False, indent=2)
             st.success("JSON успешно сохранён в output-coordinates.json")
 
+    # Разбивка времени по стадиям (последняя обработка с включёнными метриками)
+    if st.session_state.metrics is not None:
+        with st.expander("Время стадий"):
+            timings = st.session_state.metrics["timings"]
+            st.table([
+                {
+                    "stage": stage,
+                    "calls": t["calls"],
+                    "wall, ms": round(t["wall_s"] * 1000, 1),
+                    "cpu, ms": round(t["cpu_s"] * 1000, 1),
+                }
+                for stage, t in timings.items()
+            ])
+            st.table([
+                {"metric": item["name"], "labels": str(item["labels"] or ""), "value": item["value"]}
+                for item in st.session_state.metrics["counters"] + st.session_state.metrics["gauges"]
+            ])
+            st.caption(f"Сохранено в {METRICS_BASE_PATH}.json и {METRICS_BASE_PATH}.prom")
+
     # 5. Вывод JSON
     if st.session_state.result_json is not None:
         st.subheader("Сгенерированный JSON")
@@ -72,38 +186,67 @@ def main():
 
     # 6. Кнопка Render Bboxes
     if st.session_state.result_json is not None:
+        tiled = st.checkbox(f"Тайлы вместо одного PNG ({TILES_DIR}/, для очень высоких страниц)", value=False)
         if st.button("Render Bboxes"):
             if st.session_state.original_image is None:
                 st.warning("Нет исходного изображения в session_state.original_image")
             else:
-                # Аннотируем
-                annotated_img = annotate_image(st.session_state.original_image, st.session_state.result_json, (255, 0, 127), 1) # BGR
-                cv2.imwrite("annotated_result.png", annotated_img)
-                st.success("Результат сохранён в файл annotated_result.png")
-
-                st.image(
-                    cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB),
-                    caption="Annotated image",
-                    use_container_width=True
-                )
+                # Аннотируем: цвет контура - по глубине блока, подписи не перекрываются
+                annotated_img = render_annotations(st.session_state.original_image, st.session_state.result_json)
+                if tiled:
+                    shutil.rmtree(TILES_DIR, ignore_errors=True)
+                    st.session_state.tiles_meta = write_tile_pyramid(annotated_img, TILES_DIR, TILE_SIZE)
+                    save_metrics()
+                    st.success(f"Пирамида тайлов сохранена в {TILES_DIR}/")
+                else:
+                    cv2.imwrite("annotated_result.png", annotated_img)
+                    st.session_state.tiles_meta = None
+                    save_metrics()
+                    st.success("Результат сохранён в файл annotated_result.png")
+
+                    st.image(
+                        cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB),
+                        caption="Annotated image",
+                        use_container_width=True
+                    )
+
+    # Просмотр пирамиды тайлов: читаются только тайлы видимой области
+    if st.session_state.tiles_meta is not None:
+        meta = st.session_state.tiles_meta
+        level = st.slider("Уменьшение (уровень пирамиды, 0 - исходный размер)", 0, meta["levels"] - 1, 0)
+        level_h, level_w = level_shape(meta["height"], meta["width"], level)
+        x = st.slider("Сдвиг по горизонтали, px", 0, max(0, level_w - VIEWPORT_WIDTH), 0, step=TILE_SIZE // 4) \
+            if level_w > VIEWPORT_WIDTH else 0
+        y = st.slider("Сдвиг по вертикали, px", 0, max(0, level_h - VIEWPORT_HEIGHT), 0, step=TILE_SIZE // 4) \
+            if level_h > VIEWPORT_HEIGHT else 0
+        viewport = read_viewport(TILES_DIR, level, x, y, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, meta)
+        if viewport is not None:
+            st.image(cv2.cvtColor(viewport, cv2.COLOR_BGR2RGB), caption=f"Уровень {level}: x={x}, y={y}")
 
     # 7. Кнопка "Generate HTML Collection"
     if st.session_state.result_json is not None:
         if st.button("Generate HTML Collection"):
             if 'result_json' in st.session_state:
-                # Генерируем HTML файл
-                generate_html(st.session_state.result_json)
-                
-                # Показываем превью
-                st.success("HTML файл успешно сгенерирован!")
-                st.subheader("Preview blocks.html")
-                
-                # Читаем и отображаем содержимое файла
-                with open("blocks.html", "r", encoding="utf-8") as f:
-                    html_content = f.read()
-                    st.html(html_content)
+                # Генерируем HTML: оглавление blocks.html и страницы по HTML_PAGE_SIZE блоков
+                st.session_state.html_pages = generate_html_pages(
+                    st.session_state.result_json, HTML_OUTPUT_PATH, HTML_PAGE_SIZE
+                )
+                save_metrics()
+                st.success(f"HTML файл успешно сгенерирован! Страниц: {len(st.session_state.html_pages)}")
             else:
                 st.warning("Сначала обработайте изображение через 'Process Image'!")
 
+    # Превью: в сессию читается только выбранная страница
+    if st.session_state.html_pages:
+        st.subheader(f"Preview {HTML_OUTPUT_PATH}")
+        pages = st.session_state.html_pages
+        page = st.selectbox(
+            "Страница",
+            range(len(pages)),
+            format_func=lambda k: f"{k + 1}: {pages[k]['first']} … {pages[k]['last']} ({pages[k]['blocks']} блоков)",
+        )
+        with open(pages[page]["path"], "r", encoding="utf-8") as f:
+            st.html(f.read())
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,308 @@
+"""
+batch_cli.py
+Пакетная обработка каталога (или glob-шаблона) скриншотов без Streamlit.
+
+Пример:
+    python batch_cli.py assets/ --output-dir batch_output --workers 4 --annotate --html
+
+Для каждого входного файла выполняется тот же конвейер, что и в app.py
+(find_blocks_and_build_tree -> цвета и текст), результат пишется в
+<output-dir>/<имя>.json. Опционально сохраняются аннотированное изображение
+(annotate_image) и HTML-коллекция блоков (generate_html).
+
+Прогресс ведётся в <output-dir>/progress.jsonl: при повторном запуске
+уже обработанные файлы пропускаются (если не указан --force).
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+PROGRESS_FILE = "progress.jsonl"
+DEFAULTS_FILE = "defaults.json"
+
+# Кеш результатов и хранилище фрагментов процесса-обработчика (см. _init_worker)
+_result_cache = None
+_roi_store = None
+
+
+def collect_inputs(patterns):
+    """Разворачивает список каталогов / файлов / glob-шаблонов в отсортированный список изображений."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in os.listdir(pattern):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    found.add(os.path.abspath(os.path.join(pattern, name)))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                    found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def output_names(inputs):
+    """
+    Имена результатов: имя файла без расширения. Если несколько входов
+    из разных каталогов дают одинаковое имя, к нему добавляется хеш пути.
+    """
+    stems = {}
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        stems.setdefault(stem, []).append(path)
+
+    names = {}
+    for stem, paths in stems.items():
+        for path in paths:
+            if len(paths) == 1:
+                names[path] = stem
+            else:
+                names[path] = f"{stem}-{hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]}"
+    return names
+
+
+def load_progress(output_dir):
+    """Множество входных файлов, успешно обработанных в предыдущих запусках."""
+    done = set()
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Недописанная строка после аварийного завершения
+                continue
+            if record.get("status") == "ok":
+                done.add(record["input"])
+    return done
+
+
+def _write_json_atomic(data, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(threads_per_worker, cache_dir=None, cache_max_bytes=None, warmup=False,
+                 roi_store_path=None, roi_store_max_bytes=None):
+    """
+    Инициализация процесса-обработчика: ограничение потоков OpenCV/torch,
+    открытие кеша результатов и хранилища фрагментов (одна база на все
+    процессы) и загрузка модели EasyOCR один раз на процесс.
+    С warmup=True дополнительно выполняется самопроверка (modules.warmup).
+
+    Без EasyOCR / torch модель не загружается: файлы, которым OCR не нужен
+    (результат в кеше), обрабатываются, остальные завершатся ошибкой
+    импорта при первом распознавании.
+    """
+    global _result_cache, _roi_store
+    cv2.setNumThreads(threads_per_worker)
+
+    if cache_dir:
+        from modules.result_cache import ResultCache
+        _result_cache = ResultCache(cache_dir, cache_max_bytes)
+    if roi_store_path:
+        from modules.roi_store import RoiStore
+        _roi_store = RoiStore(roi_store_path, roi_store_max_bytes)
+
+    if warmup:
+        # Явно запрошенная самопроверка: отсутствие моделей - ошибка
+        import torch
+        from modules.warmup import warmup as warmup_models
+        torch.set_num_threads(threads_per_worker)
+        warmup_models()
+        return
+
+    try:
+        import torch
+        from modules.text_recognition_processing import init_reader
+        torch.set_num_threads(threads_per_worker)
+        init_reader()
+    except ImportError:
+        pass
+
+
+def process_file(input_path, output_dir, name, params, annotate, html):
+    """Обрабатывает один файл в процессе-обработчике. Возвращает запись прогресса."""
+    from modules.pipeline import process_image
+    from modules.render_bboxes import annotate_image
+    from modules.html_processing import generate_html
+
+    started = time.perf_counter()
+    with open(input_path, "rb") as f:
+        image_bytes = f.read()
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Не удалось открыть изображение {input_path}")
+
+    result_json = None
+    if _result_cache is not None:
+        from modules.result_cache import make_cache_key
+        cache_key = make_cache_key(image_bytes, params)
+        result_json = _result_cache.get(cache_key)
+
+    roi_stats = None
+    if result_json is None:
+        if _roi_store is not None:
+            _roi_store.reset_stats()
+        result_json = process_image(image, params, roi_store=_roi_store)
+        if _roi_store is not None:
+            stats = _roi_store.stats()
+            roi_stats = {"hits": stats["hits"], "misses": stats["misses"], "hit_rate": stats["hit_rate"]}
+        if _result_cache is not None:
+            _result_cache.put(cache_key, result_json)
+
+    if annotate:
+        annotated = annotate_image(image, result_json, (255, 0, 127), 1)
+        cv2.imwrite(os.path.join(output_dir, f"{name}.annotated.png"), annotated)
+    if html:
+        generate_html(result_json, os.path.join(output_dir, f"{name}.html"))
+
+    # JSON пишется последним: его наличие означает, что файл обработан полностью
+    output_path = os.path.join(output_dir, f"{name}.json")
+    _write_json_atomic(result_json, output_path)
+
+    record = {
+        "input": input_path,
+        "output": output_path,
+        "status": "ok",
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if roi_stats is not None:
+        record["roi_store"] = roi_stats
+    return record
+
+
+def run_batch(inputs, output_dir, params, workers=1, annotate=False, html=False,
+              force=False, threads_per_worker=None, cache_dir=None,
+              cache_max_bytes=512 * 1024 * 1024, warmup=False,
+              roi_store_path=None, roi_store_max_bytes=256 * 1024 * 1024):
+    """
+    Обрабатывает список файлов пулом из 'workers' процессов.
+    Если задан cache_dir, результаты берутся из / сохраняются в ResultCache.
+    Если задан roi_store_path, цвета и текст повторяющихся фрагментов
+    берутся из общего для всех процессов RoiStore.
+    warmup=True - самопроверка моделей в каждом процессе перед обработкой.
+    Возвращает (кол-во успешных, кол-во ошибок, кол-во пропущенных).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    names = output_names(inputs)
+
+    done = set() if force else load_progress(output_dir)
+    pending = [path for path in inputs if path not in done]
+    skipped = len(inputs) - len(pending)
+    if skipped:
+        print(f"Пропущено уже обработанных файлов: {skipped}")
+    if not pending:
+        return 0, 0, skipped
+
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    ok, failed = 0, 0
+    roi_hits, roi_lookups = 0, 0
+    progress_path = os.path.join(output_dir, PROGRESS_FILE)
+    with open(progress_path, "a", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(threads_per_worker, cache_dir, cache_max_bytes, warmup,
+                                          roi_store_path, roi_store_max_bytes)) as pool:
+        futures = {
+            pool.submit(process_file, path, output_dir, names[path], params, annotate, html): path
+            for path in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                record = future.result()
+                ok += 1
+            except Exception as e:
+                record = {"input": path, "status": "error", "error": repr(e)}
+                failed += 1
+            progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.flush()
+            roi = record.get("roi_store")
+            if roi:
+                roi_hits += roi["hits"]
+                roi_lookups += roi["hits"] + roi["misses"]
+            print(f"[{ok + failed}/{len(pending)}] {record['status']}: {path}"
+                  + (f" (фрагменты из хранилища: {roi['hit_rate']:.0%})" if roi else ""))
+
+    if roi_lookups:
+        print(f"Хранилище фрагментов: найдено {roi_hits} из {roi_lookups} ({roi_hits / roi_lookups:.0%})")
+
+    return ok, failed, skipped
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная обработка скриншотов веб-макетов (Layout Mapper)")
+    parser.add_argument("inputs", nargs="+", help="каталоги, файлы или glob-шаблоны изображений")
+    parser.add_argument("--output-dir", default="batch_output", help="каталог для результатов")
+    parser.add_argument("--params", default=DEFAULTS_FILE, help="JSON с параметрами (как defaults.json)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="кол-во процессов")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="потоков OpenCV/torch на процесс (по умолчанию ядра / процессы)")
+    parser.add_argument("--annotate", action="store_true", help="сохранять аннотированные изображения")
+    parser.add_argument("--html", action="store_true", help="генерировать HTML-коллекцию блоков")
+    parser.add_argument("--force", action="store_true", help="обработать заново уже обработанные файлы")
+    parser.add_argument("--cache-dir", default=None, help="каталог кеша результатов (по умолчанию кеш не используется)")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="максимальный размер кеша результатов, МБ")
+    parser.add_argument("--roi-store", default=None,
+                        help="файл SQLite хранилища цветов и текста фрагментов (по умолчанию не используется)")
+    parser.add_argument("--roi-store-max-mb", type=int, default=256, help="максимальный размер хранилища фрагментов, МБ")
+    parser.add_argument("--warmup", action="store_true",
+                        help="прогреть и проверить модели в каждом процессе до первого файла")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Без defaults.json - параметры по умолчанию модулей; явно указанный
+    # --params должен существовать
+    params = {}
+    if os.path.exists(args.params):
+        with open(args.params, "r", encoding="utf-8") as f:
+            params = json.load(f)
+    elif args.params != DEFAULTS_FILE:
+        print(f"Файл параметров не найден: {args.params}")
+        return 1
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("Не найдено входных изображений")
+        return 1
+
+    ok, failed, skipped = run_batch(
+        inputs, args.output_dir, params,
+        workers=max(1, args.workers),
+        annotate=args.annotate,
+        html=args.html,
+        force=args.force,
+        threads_per_worker=args.threads_per_worker,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        warmup=args.warmup,
+        roi_store_path=args.roi_store,
+        roi_store_max_bytes=args.roi_store_max_mb * 1024 * 1024,
+    )
+    print(f"Готово: успешно {ok}, с ошибкой {failed}, пропущено {skipped}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+bench_parallel.py
+Ускорение анализа блоков одной страницы пулом потоков (analysis_workers).
+
+Страница - шаблоны из assets/ (или --images), склеенные по вертикали
+--stack раз: так получается одна большая страница с тысячами блоков.
+Блоки находятся один раз (find_blocks_table с параметрами --preset), затем
+для каждого числа потоков --workers замеряется медиана времени (--repeat
+прогонов) стадий:
+  - colors: цвета всех блоков (color_mode = kmeans, solid_fast_path из
+    параметров);
+  - ocr: текст всех блоков (ocr_mode из параметров, кроме 'page'); нужен
+    EasyOCR, без него или с --skip-ocr стадия пропускается.
+Для каждой стадии выводятся время, ускорение относительно одного потока и
+совпадение результата с однопоточным (он не должен зависеть от числа
+потоков).
+
+Ускорение ограничено числом ядер машины (os.cpu_count()).
+
+Примеры:
+    python benchmarks/bench_parallel.py --skip-ocr
+    python benchmarks/bench_parallel.py --stack 8 --workers 1 2 4 8 16 --output parallel.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from modules.opencv_processing import find_blocks_table
+from modules.pipeline import detect_block_colors, read_block_texts
+
+IMAGES = ("website_template.png", "website_template_2.png", "website_template_3.png")
+
+
+def _median_time(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def stack_images(paths, times):
+    """Изображения paths, склеенные по вертикали times раз (ширина - по самому узкому)."""
+    images = [cv2.imread(path) for path in paths]
+    width = min(image.shape[1] for image in images)
+    return np.vstack([image[:, :width] for image in images] * times)
+
+
+def run_stage(name, analyze, workers_list, repeat):
+    rows = []
+    reference = None
+    base_s = None
+    for workers in workers_list:
+        seconds, result = _median_time(lambda: analyze(workers), repeat)
+        if reference is None:
+            reference, base_s = result, seconds
+        rows.append({
+            "stage": name,
+            "workers": workers,
+            "time_s": round(seconds, 3),
+            "speedup": round(base_s / seconds, 2),
+            "identical": result == reference,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ускорение анализа блоков по числу потоков (analysis_workers)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="проверяемые значения analysis_workers (первое - база для ускорения)")
+    parser.add_argument("--images", nargs="+", help="страницы (по умолчанию assets/website_template*.png)")
+    parser.add_argument("--stack", type=int, default=4, help="сколько раз склеить страницы по вертикали")
+    parser.add_argument("--preset", default="defaults_atomic-noise.json", help="файл параметров")
+    parser.add_argument("--max-inflight", type=int, default=0, help="analysis_max_inflight")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-ocr", action="store_true", help="замерять только цвета")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(ROOT, args.preset), "r", encoding="utf-8") as f:
+        params = json.load(f)
+    params.update(color_mode="kmeans", analysis_max_inflight=args.max_inflight)
+
+    image = stack_images(args.images or [os.path.join(ROOT, "assets", name) for name in IMAGES], args.stack)
+    table = find_blocks_table(image, params)
+    rects = [table.bounds(i) for i in range(len(table)) if table.parent[i] != -1]
+    print(f"Страница {image.shape[1]}x{image.shape[0]}, блоков {len(rects)}, ядер {os.cpu_count()}")
+
+    rows = run_stage("colors", lambda workers: detect_block_colors(rects, image, dict(params, analysis_workers=workers)),
+                     args.workers, args.repeat)
+
+    skip_ocr = args.skip_ocr or params.get("ocr_mode", "batched") == "page"
+    if not skip_ocr:
+        try:
+            from modules.text_recognition_processing import init_reader
+            init_reader()
+        except ImportError:
+            print("EasyOCR не установлен - замеряются только цвета")
+            skip_ocr = True
+    if not skip_ocr:
+        rows += run_stage("ocr", lambda workers: read_block_texts(rects, image, dict(params, analysis_workers=workers)),
+                          args.workers, args.repeat)
+
+    print(f"\n{'stage':>7} {'workers':>8} {'time, s':>9} {'speedup':>8} {'identical':>10}")
+    for row in rows:
+        print(f"{row['stage']:>7} {row['workers']:>8} {row['time_s']:>9} {row['speedup']:>8} "
+              f"{str(row['identical']):>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "image": [image.shape[1], image.shape[0]],
+                "blocks": len(rects),
+                "cpu_count": os.cpu_count(),
+                "preset": args.preset,
+                "results": rows,
+            }, f, indent=2)
+    return 0 if all(row["identical"] for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
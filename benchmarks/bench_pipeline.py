@@ -0,0 +1,221 @@
+"""
+bench_pipeline.py
+Бенчмарк конвейера по стадиям на шаблонах из assets/.
+
+Для каждого изображения (website_template.png, _2, _3) и каждого набора
+параметров (defaults.json, defaults_atomic-noise.json) стадии
+decode -> threshold_morphology -> find_contours -> tree_build ->
+detect_colors -> extract_text -> annotate_image -> generate_html
+выполняются --repeat раз, в отчёт попадает медиана времени каждой стадии.
+Каждый случай запускается в отдельном процессе, поэтому пиковый RSS
+(ru_maxrss) относится именно к нему.
+
+Примеры:
+    # Сохранить базовую линию на своей машине
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+
+    # Сравнить с базовой линией: код возврата 1, если какая-либо стадия
+    # (или пиковый RSS) стала хуже больше чем на --threshold
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json
+
+Базовая линия зависит от машины, поэтому в репозиторий не добавляется.
+Если EasyOCR не установлен (или указан --skip-ocr), стадия extract_text
+пропускается.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMAGES = ("website_template.png", "website_template_2.png", "website_template_3.png")
+PRESETS = ("defaults.json", "defaults_atomic-noise.json")
+STAGES = (
+    "decode", "threshold_morphology", "find_contours", "tree_build",
+    "detect_colors", "extract_text", "annotate_image", "generate_html",
+)
+
+
+def run_case(image_path, params_path, repeat, skip_ocr):
+    """
+    Прогоняет один случай (изображение + параметры) repeat раз.
+    Выполняется в отдельном процессе. Возвращает словарь с временем стадий (мс).
+    """
+    import cv2
+    import numpy as np
+    from modules.opencv_processing import build_mask, find_contours, build_block_tree
+    from modules.block_tree import iter_blocks, block_bounds
+    from modules.render_bboxes import annotate_image
+    from modules.html_processing import generate_html
+    from modules.pipeline import detect_block_colors, read_block_texts
+
+    with open(params_path, "r", encoding="utf-8") as f:
+        params = json.load(f)
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    # Причина пропуска стадии extract_text (None - стадия измеряется)
+    ocr_skipped = "--skip-ocr" if skip_ocr else None
+    if ocr_skipped is None:
+        try:
+            from modules.text_recognition_processing import init_reader
+            init_reader()
+        except ImportError as e:
+            ocr_skipped = str(e)
+
+    timings = {stage: [] for stage in STAGES}
+    blocks = 0
+    def timed(stage, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings[stage].append((time.perf_counter() - started) * 1000.0)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        html_path = os.path.join(tmp, "blocks.html")
+        for _ in range(repeat):
+            image = timed("decode", cv2.imdecode, np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            thresh = timed("threshold_morphology", build_mask, image, params)
+            contours, hierarchy = timed("find_contours", find_contours, thresh, params)
+            tree = timed("tree_build", build_block_tree, contours, hierarchy, image.shape, params)
+
+            entries = [data for _, data in iter_blocks(tree["block_00"]["children"])]
+            rects = [block_bounds(data) for data in entries]
+            blocks = len(entries)
+
+            colors = timed("detect_colors", detect_block_colors, rects, image, params)
+            texts = [""] * len(rects)
+            if ocr_skipped is None:
+                texts = timed("extract_text", read_block_texts, rects, image, params)
+            for data, block_colors, text in zip(entries, colors, texts):
+                data["colors"] = block_colors
+                data["text"] = text
+
+            timed("annotate_image", annotate_image, image, tree, (255, 0, 127), 1)
+            timed("generate_html", generate_html, tree, html_path)
+
+    # ru_maxrss на Linux - в килобайтах, на macOS - в байтах
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    return {
+        "blocks": blocks,
+        "stages_ms": {stage: round(statistics.median(values), 3) for stage, values in timings.items() if values},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "ocr_skipped": ocr_skipped,
+    }
+
+
+def run_benchmark(images, presets, repeat=3, skip_ocr=False):
+    """Запускает все случаи, каждый в свежем процессе. Возвращает отчёт."""
+    ctx = get_context("spawn")
+    cases = {}
+    for image_name in images:
+        for preset in presets:
+            case = f"{os.path.splitext(image_name)[0]}/{os.path.splitext(preset)[0]}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                cases[case] = pool.submit(
+                    run_case, os.path.join(ROOT, "assets", image_name),
+                    os.path.join(ROOT, preset), repeat, skip_ocr
+                ).result()
+            print(f"{case}: {cases[case]['blocks']} блоков, "
+                  f"пиковый RSS {cases[case]['peak_rss_mb']} МБ", flush=True)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "cases": cases,
+    }
+
+
+def compare(report, baseline, threshold, min_delta_ms):
+    """
+    Сравнивает отчёт с базовой линией. Регрессия - медиана стадии (или
+    пиковый RSS) больше базовой более чем в (1 + threshold) раз; для времени
+    дополнительно требуется абсолютная разница не меньше min_delta_ms,
+    чтобы не реагировать на шум коротких стадий.
+    Возвращает список строк с описанием регрессий.
+    """
+    regressions = []
+    for case, result in report["cases"].items():
+        base = baseline.get("cases", {}).get(case)
+        if base is None:
+            continue
+        for stage, value in result["stages_ms"].items():
+            old = base.get("stages_ms", {}).get(stage)
+            if old is None:
+                continue
+            if value > old * (1 + threshold) and value - old >= min_delta_ms:
+                regressions.append(f"{case} {stage}: {old:.1f} -> {value:.1f} мс")
+        old_rss = base.get("peak_rss_mb")
+        if old_rss and result["peak_rss_mb"] > old_rss * (1 + threshold):
+            regressions.append(f"{case} peak_rss: {old_rss:.1f} -> {result['peak_rss_mb']:.1f} МБ")
+    return regressions
+
+
+def print_table(report):
+    stages = [s for s in STAGES if any(s in c["stages_ms"] for c in report["cases"].values())]
+    header = f"{'case':<42}" + "".join(f"{s[:12]:>13}" for s in stages) + f"{'rss, MB':>10}"
+    print(header)
+    for case, result in report["cases"].items():
+        row = f"{case:<42}" + "".join(
+            f"{result['stages_ms'][s]:>13.1f}" if s in result["stages_ms"] else f"{'-':>13}" for s in stages
+        )
+        print(row + f"{result['peak_rss_mb']:>10.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк стадий конвейера Layout Mapper")
+    parser.add_argument("--repeat", type=int, default=3, help="кол-во прогонов каждого случая (медиана)")
+    parser.add_argument("--images", nargs="+", default=list(IMAGES), help="изображения из assets/")
+    parser.add_argument("--presets", nargs="+", default=list(PRESETS), help="файлы параметров")
+    parser.add_argument("--skip-ocr", action="store_true", help="не измерять extract_text")
+    parser.add_argument("--output", default=None, help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", default=None, help="JSON базовой линии для сравнения")
+    parser.add_argument("--save-baseline", default=None, help="сохранить отчёт как базовую линию")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="допустимое относительное ухудшение (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="минимальная абсолютная разница времени стадии для регрессии, мс")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args.images, args.presets, max(1, args.repeat), args.skip_ocr)
+    print_table(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("Регрессии относительно базовой линии:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Регрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+bench_pyramid.py
+Сегментация от грубого к точному (pyramid_cell) в сравнении с обработкой
+всего изображения в одном разрешении.
+
+Страницы - шаблоны из assets/ (или --images) и синтетическая высокая
+страница с крупными однотонными панелями (--flat-height, 0 - без неё):
+на ней режим и должен давать выигрыш. Для каждой страницы и каждого
+набора параметров (defaults.json, defaults_atomic-noise.json)
+замеряется медиана времени (--repeat прогонов) построения маски
+(build_mask) и всей сегментации (find_blocks_table) без pyramid_cell и
+с каждым размером ячейки --cells. Маска должна совпадать с маской
+обработки в одном разрешении (столбец identical).
+
+Примеры:
+    python benchmarks/bench_pyramid.py
+    python benchmarks/bench_pyramid.py --cells 8 16 --flat-height 60000 --output pyramid.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from modules.opencv_processing import build_mask, find_blocks_table
+
+IMAGES = ("website_template.png", "website_template_2.png", "website_template_3.png")
+PRESETS = ("defaults.json", "defaults_atomic-noise.json")
+
+
+def _median_time(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def flat_page(height, width=1850, seed=0):
+    """
+    Синтетическая высокая страница: крупные однотонные панели с несколькими
+    строками текста и кнопкой, между ними - светлый фон.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+    y = 0
+    while y < height - 400:
+        panel_h = int(rng.integers(200, 900))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(image, (40, y), (width - 40, y + panel_h), color, -1)
+        for line in range(int(rng.integers(1, 4))):
+            cv2.putText(image, "Lorem ipsum dolor sit amet", (80, y + 60 + 40 * line),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (20, 20, 20), 2)
+        cv2.rectangle(image, (width - 300, y + panel_h - 80), (width - 80, y + panel_h - 30), (200, 80, 40), -1)
+        y += panel_h + int(rng.integers(40, 200))
+    return image
+
+
+def run_case(image, params, cells, repeat):
+    base_mask_s, base_mask = _median_time(lambda: build_mask(image, params), repeat)
+    base_total_s, base_table = _median_time(lambda: find_blocks_table(image, params), repeat)
+
+    rows = [{"cell": 0, "mask_ms": round(base_mask_s * 1000, 1), "total_ms": round(base_total_s * 1000, 1),
+             "speedup": 1.0, "blocks": len(base_table), "identical": True}]
+    for cell in cells:
+        pyramid_params = {**params, "pyramid_cell": cell}
+        mask_s, mask = _median_time(lambda: build_mask(image, pyramid_params), repeat)
+        total_s, table = _median_time(lambda: find_blocks_table(image, pyramid_params), repeat)
+        rows.append({
+            "cell": cell,
+            "mask_ms": round(mask_s * 1000, 1),
+            "total_ms": round(total_s * 1000, 1),
+            "speedup": round(base_total_s / total_s, 2),
+            "blocks": len(table),
+            "identical": bool(np.array_equal(mask, base_mask)),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк сегментации от грубого к точному (pyramid_cell)")
+    parser.add_argument("--cells", type=int, nargs="+", default=[8, 16, 32], help="размеры ячейки грубого уровня")
+    parser.add_argument("--images", nargs="+", help="страницы (по умолчанию assets/website_template*.png)")
+    parser.add_argument("--flat-height", type=int, default=30000,
+                        help="высота синтетической страницы с однотонными панелями (0 - не использовать)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    pages = [(os.path.basename(path), cv2.imread(path))
+             for path in args.images or [os.path.join(ROOT, "assets", name) for name in IMAGES]]
+    if args.flat_height:
+        pages.append((f"flat_page_{args.flat_height}", flat_page(args.flat_height)))
+
+    report = []
+    for preset in PRESETS:
+        with open(os.path.join(ROOT, preset), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        for name, image in pages:
+            rows = run_case(image, params, args.cells, args.repeat)
+            print(f"\n{preset} / {name} ({image.shape[1]}x{image.shape[0]})")
+            print(f"{'cell':>5} {'mask, ms':>9} {'total, ms':>10} {'speedup':>8} {'blocks':>7} {'identical':>10}")
+            for row in rows:
+                print(f"{row['cell'] or '-':>5} {row['mask_ms']:>9} {row['total_ms']:>10} {row['speedup']:>8} "
+                      f"{row['blocks']:>7} {str(row['identical']):>10}")
+                report.append({"preset": preset, "image": name, **row})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": report}, f, indent=2)
+    return 0 if all(row["identical"] for row in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+bench_result_format.py
+Сравнение форматов результата: JSON (indent=2, как output-coordinates.json),
+компактный JSON и двоичный .npz (modules/result_binary.py, со сжатием и без).
+
+Для каждого результата измеряются размер файла, время загрузки
+(медиана --repeat прогонов) и время annotate_image / generate_html
+при чтении прямо из файла. Перед замерами проверяется, что преобразование
+JSON -> .npz -> JSON выполняется без потерь.
+
+Результаты берутся из --results (файлы output-coordinates.json), иначе
+строятся по шаблонам из assets/ (сегментация + цвета по палитре, без OCR).
+--synthetic N добавляет случайное дерево из N блоков с коротким текстом.
+
+Примеры:
+    python benchmarks/bench_result_format.py
+    python benchmarks/bench_result_format.py --results output-coordinates.json --synthetic 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from modules.block_tree import iter_blocks, block_bounds
+from modules.color_processing import PaletteIndex, detect_colors_palette_rect
+from modules.html_processing import generate_html
+from modules.opencv_processing import find_blocks_and_build_tree
+from modules.render_bboxes import annotate_image
+from modules.result_binary import save_tree, load_table, load_tree
+
+IMAGES = ("website_template.png", "website_template_2.png", "website_template_3.png")
+
+
+def template_results():
+    """(имя, JSON-дерево, изображение) по шаблонам из assets/."""
+    with open(os.path.join(ROOT, "defaults.json"), "r", encoding="utf-8") as f:
+        params = json.load(f)
+    for name in IMAGES:
+        image = cv2.imread(os.path.join(ROOT, "assets", name))
+        tree = find_blocks_and_build_tree(image, params)
+        palette = PaletteIndex(image)
+        for _, data in iter_blocks(tree["block_00"]["children"]):
+            data["colors"] = detect_colors_palette_rect(*block_bounds(data), palette)["colors"]
+            data["text"] = ""
+        yield name, tree, image
+
+
+def synthetic_result(n_blocks, seed=0):
+    """Случайное дерево из n_blocks блоков на странице 1920 x (n_blocks * 4)."""
+    rng = random.Random(seed)
+    width, height = 1920, max(1080, n_blocks * 4)
+    root = {"coordinatesXY": [[0, 0], [width, 0], [width, height], [0, height]], "children": {}}
+    nodes = [("block_00", root, (0, 0, width, height))]
+    words = ("Главная", "Каталог", "Contact us", "Подробнее", "Sign in", "Цена: 1 990 ₽")
+    for _ in range(n_blocks):
+        name, parent, (px1, py1, px2, py2) = nodes[rng.randrange(len(nodes))]
+        x1, y1 = rng.randint(px1, max(px1, px2 - 2)), rng.randint(py1, max(py1, py2 - 2))
+        x2, y2 = rng.randint(x1 + 1, max(x1 + 1, px2)), rng.randint(y1 + 1, max(y1 + 1, py2))
+        child_name = f"{name}_{len(parent['children']):02d}"
+        child = {
+            "coordinatesXY": [[x1, y1], [x2, y1], [x2, y2], [x1, y2]],
+            "children": {},
+            "colors": [f"#{rng.randrange(1 << 24):06X}" for _ in range(3)],
+            "text": " ".join(rng.sample(words, rng.randint(0, 3))),
+        }
+        parent["children"][child_name] = child
+        nodes.append((child_name, child, (x1, y1, x2, y2)))
+    image = np.full((min(height, 8192), width, 3), 255, dtype=np.uint8)
+    return {"block_00": root}, image
+
+
+def _median_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bench_result(name, tree, image, repeat, tmp_dir):
+    paths = {
+        "json_indent": os.path.join(tmp_dir, "result.json"),
+        "json_compact": os.path.join(tmp_dir, "result.min.json"),
+        "npz": os.path.join(tmp_dir, "result.npz"),
+        "npz_compressed": os.path.join(tmp_dir, "result.c.npz"),
+    }
+    with open(paths["json_indent"], "w", encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False, indent=2)
+    with open(paths["json_compact"], "w", encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False, separators=(",", ":"))
+    save_tree(tree, paths["npz"], compressed=False)
+    save_tree(tree, paths["npz_compressed"], compressed=True)
+
+    # Без потерь: JSON -> .npz -> JSON
+    for key in ("npz", "npz_compressed"):
+        if load_tree(paths[key]) != tree:
+            raise AssertionError(f"{name}: {key} не совпадает с исходным JSON")
+
+    n_blocks = sum(1 for _ in iter_blocks(tree))
+    html_path = os.path.join(tmp_dir, "blocks.html")
+    report = {"result": name, "blocks": n_blocks, "formats": {}}
+    for key, path in paths.items():
+        load = _load_json if key.startswith("json") else load_table
+        report["formats"][key] = {
+            "size_bytes": os.path.getsize(path),
+            "load_ms": round(_median_time(lambda: load(path), repeat) * 1000, 2),
+            "annotate_ms": round(_median_time(lambda: annotate_image(image, load(path), (255, 0, 127), 1), repeat) * 1000, 2),
+            "html_ms": round(_median_time(lambda: generate_html(load(path), html_path), repeat) * 1000, 2),
+        }
+    return report
+
+
+def print_report(report):
+    base = report["formats"]["json_indent"]
+    print(f"\n{report['result']} ({report['blocks']} блоков)")
+    print(f"  {'format':<16}{'size, KB':>12}{'x size':>9}{'load, ms':>11}{'x load':>9}{'annotate, ms':>15}{'html, ms':>11}")
+    for key, r in report["formats"].items():
+        print(
+            f"  {key:<16}{r['size_bytes'] / 1024:>12.1f}{base['size_bytes'] / r['size_bytes']:>9.1f}"
+            f"{r['load_ms']:>11.2f}{base['load_ms'] / max(r['load_ms'], 1e-6):>9.1f}"
+            f"{r['annotate_ms']:>15.2f}{r['html_ms']:>11.2f}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Размер и время загрузки результата: JSON и .npz")
+    parser.add_argument("--results", nargs="*", default=None, help="JSON-результаты (иначе - шаблоны из assets/)")
+    parser.add_argument("--image", default=None, help="изображение для annotate_image при --results")
+    parser.add_argument("--synthetic", type=int, default=0, help="добавить случайное дерево из N блоков")
+    parser.add_argument("--repeat", type=int, default=5, help="кол-во прогонов (медиана)")
+    parser.add_argument("--output", default=None, help="сохранить отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.results:
+        image = cv2.imread(args.image) if args.image else None
+        sources = []
+        for path in args.results:
+            tree = _load_json(path)
+            if image is None:
+                x1, y1, x2, y2 = block_bounds(tree["block_00"])
+                sources.append((path, tree, np.full((y2 + 1, x2 + 1, 3), 255, dtype=np.uint8)))
+            else:
+                sources.append((path, tree, image))
+    else:
+        sources = list(template_results())
+    if args.synthetic:
+        tree, image = synthetic_result(args.synthetic)
+        sources.append((f"synthetic_{args.synthetic}", tree, image))
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, tree, image in sources:
+            report = bench_result(name, tree, image, args.repeat, tmp_dir)
+            print_report(report)
+            reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
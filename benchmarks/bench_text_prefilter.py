@@ -0,0 +1,129 @@
+"""
+bench_text_prefilter.py
+Полнота префильтра текста (text_prefilter, modules/text_presence.py)
+относительно полного OCR.
+
+Для каждой страницы (по умолчанию шаблоны из assets/) и каждого набора
+параметров (defaults.json, defaults_atomic-noise.json) все блоки
+распознаются пакетным OCR - это эталон: блок "с текстом", если OCR вернул
+непустую строку. Затем для каждого порога --thresholds считается:
+  - recall: доля блоков с текстом, которые префильтр отправил бы в OCR;
+  - char_recall: то же, в символах распознанного текста;
+  - skipped: доля блоков, пропущенных префильтром;
+  - missed: примеры текста пропущенных блоков.
+Для порога --threshold дополнительно замеряется время OCR только
+отобранных блоков (вместе с построением индекса) против полного OCR.
+
+Нужен установленный EasyOCR (модели скачиваются при первом запуске).
+
+Примеры:
+    python benchmarks/bench_text_prefilter.py
+    python benchmarks/bench_text_prefilter.py --images page1.png page2.png --thresholds 10 20 40 --output prefilter.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+
+from modules.opencv_processing import find_blocks_table
+from modules.text_presence import TextPresenceIndex
+
+IMAGES = ("website_template.png", "website_template_2.png", "website_template_3.png")
+PRESETS = ("defaults.json", "defaults_atomic-noise.json")
+
+
+def run_case(image, params, thresholds, threshold):
+    from modules.text_recognition_processing import read_text_batched
+
+    table = find_blocks_table(image, params)
+    rects = [table.bounds(i) for i in range(len(table)) if table.parent[i] != -1]
+
+    started = time.perf_counter()
+    reference = read_text_batched(rects, image)
+    full_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = TextPresenceIndex(image)
+    index_s = time.perf_counter() - started
+    scores = [index.score(*rect) for rect in rects]
+
+    with_text = [i for i, text in enumerate(reference) if text]
+    total_chars = sum(len(reference[i]) for i in with_text)
+    rows = []
+    for t in thresholds:
+        passed = [score >= t for score in scores]
+        kept = [i for i in with_text if passed[i]]
+        missed = [reference[i] for i in with_text if not passed[i]]
+        rows.append({
+            "threshold": t,
+            "recall": round(len(kept) / len(with_text), 4) if with_text else 1.0,
+            "char_recall": round(sum(len(reference[i]) for i in kept) / total_chars, 4) if total_chars else 1.0,
+            "skipped": round(passed.count(False) / len(rects), 4) if rects else 0.0,
+            "missed": missed[:3],
+        })
+
+    # Время OCR только отобранных блоков при рабочем пороге
+    selected = [rect for rect, score in zip(rects, scores) if score >= threshold]
+    started = time.perf_counter()
+    read_text_batched(selected, image)
+    prefiltered_s = index_s + time.perf_counter() - started
+
+    return {
+        "blocks": len(rects),
+        "with_text": len(with_text),
+        "index_ms": round(index_s * 1000, 1),
+        "ocr_full_s": round(full_s, 2),
+        "ocr_prefiltered_s": round(prefiltered_s, 2),
+        "thresholds": rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Полнота префильтра текста относительно полного OCR")
+    parser.add_argument("--images", nargs="+", help="страницы (по умолчанию assets/website_template*.png)")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[0, 10, 20, 40, 80, 160],
+                        help="проверяемые значения text_prefilter_threshold")
+    parser.add_argument("--threshold", type=int, default=40,
+                        help="порог, для которого замеряется время OCR")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        from modules.text_recognition_processing import init_reader
+        init_reader()
+    except ImportError:
+        print("Для эталона нужен EasyOCR: pip install easyocr")
+        return 1
+
+    images = args.images or [os.path.join(ROOT, "assets", name) for name in IMAGES]
+    report = []
+    for preset in PRESETS:
+        with open(os.path.join(ROOT, preset), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        for path in images:
+            image = cv2.imread(path)
+            case = run_case(image, params, args.thresholds, args.threshold)
+            print(f"\n{preset} / {os.path.basename(path)}: блоков {case['blocks']}, с текстом {case['with_text']}, "
+                  f"индекс {case['index_ms']} ms, OCR {case['ocr_full_s']} s -> {case['ocr_prefiltered_s']} s "
+                  f"(порог {args.threshold})")
+            print(f"{'threshold':>10} {'recall':>8} {'char_recall':>12} {'skipped':>8}  missed")
+            for row in case["thresholds"]:
+                print(f"{row['threshold']:>10} {row['recall']:>8} {row['char_recall']:>12} {row['skipped']:>8}  "
+                      f"{'; '.join(repr(text[:30]) for text in row['missed'])}")
+            report.append({"preset": preset, "image": os.path.basename(path), **case})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"threshold": args.threshold, "results": report}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# block_table.py
+"""
+Компактное (колоночное) представление дерева блоков.
+
+Вместо вложенных словарей дерево хранится в массивах NumPy:
+координаты x, y, w, h и связи parent / first_child / next_sibling
+(индексы строк, -1 - нет). Строка 0 - корневой блок block_00.
+Имена блоков, цвета, текст и прочие поля блока хранятся в списках той же длины.
+
+Преобразование в привычный JSON-словарь ({"block_00": {...}}) выполняется
+лениво - только при вызове to_tree().
+"""
+
+import numpy as np
+
+from modules.block_tree import block_bounds
+
+
+# Поля блока, которые хранятся в отдельных столбцах (остальные - в extras)
+_TREE_KEYS = ("coordinatesXY", "children", "colors", "text")
+
+
+class BlockTable:
+    """
+    Дерево блоков в виде столбцов.
+
+    Атрибуты:
+    - names: список имён блоков ("block_00", "block_00_00", ...)
+    - x, y, w, h: int32-массивы ограничивающих прямоугольников
+    - parent, first_child, next_sibling: int32-массивы индексов строк (-1 - нет)
+    - colors: список списков HEX-цветов (None - цвета не определялись)
+    - text: список строк (None - текст не распознавался)
+    - extras: список словарей с прочими полями блока (None - нет),
+      например "detection" после слияния с детекциями YOLO (modules/fusion.py)
+
+    Строки упорядочены в порядке обхода в глубину (родитель раньше детей,
+    дети - в порядке их имён), поэтому родитель всегда имеет меньший индекс.
+    """
+
+    def __init__(self, names, x, y, w, h, parent, first_child, next_sibling, colors=None, text=None,
+                 extras=None):
+        n = len(names)
+        self.names = list(names)
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.w = np.asarray(w, dtype=np.int32)
+        self.h = np.asarray(h, dtype=np.int32)
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.first_child = np.asarray(first_child, dtype=np.int32)
+        self.next_sibling = np.asarray(next_sibling, dtype=np.int32)
+        self.colors = list(colors) if colors is not None else [None] * n
+        self.text = list(text) if text is not None else [None] * n
+        self.extras = list(extras) if extras is not None else [None] * n
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_parents(cls, names, boxes, parent):
+        """
+        Строит таблицу по именам, прямоугольникам (N, 4) [x, y, w, h] и
+        индексам родителей. Строки должны идти в порядке обхода в глубину.
+        """
+        n = len(names)
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(n, 4)
+        parent = np.asarray(parent, dtype=np.int32)
+        first_child = np.full(n, -1, dtype=np.int32)
+        next_sibling = np.full(n, -1, dtype=np.int32)
+
+        # Обратный проход: каждый узел становится первым ребёнком своего
+        # родителя, а прежний первый ребёнок - его следующим братом
+        # (корни - строки с parent == -1 - ни к кому не привязываются)
+        for i in range(n - 1, 0, -1):
+            p = parent[i]
+            if p < 0:
+                continue
+            next_sibling[i] = first_child[p]
+            first_child[p] = i
+
+        return cls(names, boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3],
+                   parent, first_child, next_sibling)
+
+    @classmethod
+    def from_tree(cls, tree):
+        """
+        Преобразует JSON-дерево {"block_00": {...}} в таблицу.
+        Координаты блока сводятся к ограничивающему прямоугольнику.
+        """
+        names, boxes, parent, colors, text, extras = [], [], [], [], [], []
+
+        stack = [(-1, name, data) for name, data in reversed(list(tree.items()))]
+        while stack:
+            p, name, data = stack.pop()
+            i = len(names)
+            x1, y1, x2, y2 = block_bounds(data)
+            names.append(name)
+            boxes.append((x1, y1, x2 - x1, y2 - y1))
+            parent.append(p)
+            colors.append(data.get("colors"))
+            text.append(data.get("text"))
+            extra = {k: v for k, v in data.items() if k not in _TREE_KEYS}
+            extras.append(extra or None)
+            children = data.get("children") or {}
+            stack.extend((i, c_name, c_data) for c_name, c_data in reversed(list(children.items())))
+
+        table = cls.from_parents(names, boxes, parent)
+        table.colors = colors
+        table.text = text
+        table.extras = extras
+        return table
+
+    def with_rows_added(self, names, boxes, parent, extras=None):
+        """
+        Новая таблица с добавленными строками (имена, [x, y, w, h], индексы
+        родителей в текущей таблице). Новые дети идут после существующих
+        детей родителя; строки снова упорядочиваются в порядке обхода в глубину.
+        """
+        n_old, n_new = len(self), len(names)
+        all_parent = np.concatenate([self.parent, np.asarray(parent, dtype=np.int32).reshape(n_new)])
+        all_boxes = np.concatenate([
+            np.stack([self.x, self.y, self.w, self.h], axis=1),
+            np.asarray(boxes, dtype=np.int32).reshape(n_new, 4),
+        ])
+        all_names = self.names + list(names)
+        all_colors = self.colors + [None] * n_new
+        all_text = self.text + [None] * n_new
+        all_extras = self.extras + (list(extras) if extras is not None else [None] * n_new)
+
+        # Порядок обхода в глубину: дети каждого узла - по возрастанию номера строки
+        children = [[] for _ in range(n_old + n_new)]
+        for i in range(n_old + n_new):
+            if all_parent[i] != -1:
+                children[all_parent[i]].append(i)
+        order = []
+        stack = [i for i in reversed(range(n_old + n_new)) if all_parent[i] == -1]
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            stack.extend(reversed(children[i]))
+
+        new_index = np.empty(len(order), dtype=np.int32)
+        new_index[order] = np.arange(len(order), dtype=np.int32)
+        order_parent = all_parent[order]
+        new_parent = np.where(order_parent == -1, -1, new_index[np.maximum(order_parent, 0)])
+
+        table = BlockTable.from_parents([all_names[i] for i in order], all_boxes[order], new_parent)
+        table.colors = [all_colors[i] for i in order]
+        table.text = [all_text[i] for i in order]
+        table.extras = [all_extras[i] for i in order]
+        return table
+
+    def bounds(self, i):
+        """Ограничивающий прямоугольник строки i: (x1, y1, x2, y2)."""
+        x, y = int(self.x[i]), int(self.y[i])
+        return x, y, x + int(self.w[i]), y + int(self.h[i])
+
+    def coordinates(self, i):
+        """Углы блока в формате "coordinatesXY"."""
+        x1, y1, x2, y2 = self.bounds(i)
+        return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+    def children(self, i):
+        """Индексы детей строки i по порядку."""
+        c = self.first_child[i]
+        while c != -1:
+            yield int(c)
+            c = self.next_sibling[c]
+
+    def depth(self):
+        """Глубина вложенности каждой строки (у корней, например block_00, - 0)."""
+        depth = np.zeros(len(self), dtype=np.int32)
+        for i in range(1, len(self)):
+            p = self.parent[i]
+            if p >= 0:
+                depth[i] = depth[p] + 1
+        return depth
+
+    def to_tree(self):
+        """Ленивое преобразование в JSON-дерево {"block_00": {...}}."""
+        nodes = []
+        for i in range(len(self)):
+            node = {"coordinatesXY": self.coordinates(i), "children": {}}
+            if self.colors[i] is not None:
+                node["colors"] = self.colors[i]
+            if self.text[i] is not None:
+                node["text"] = self.text[i]
+            if self.extras[i]:
+                node.update(self.extras[i])
+            nodes.append(node)
+            p = self.parent[i]
+            if p != -1:
+                nodes[p]["children"][self.names[i]] = node
+
+        roots = np.flatnonzero(self.parent == -1)
+        return {self.names[i]: nodes[i] for i in roots}
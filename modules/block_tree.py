@@ -0,0 +1,37 @@
+# block_tree.py
+"""
+Вспомогательные функции для обхода JSON-дерева блоков вида
+{"block_00": {"coordinatesXY": [...], "children": {...}}}.
+"""
+
+
+def iter_blocks(blocks):
+    """
+    Обходит словарь блоков (и всех вложенных детей) в глубину, в порядке
+    ключей. Возвращает пары (block_id, block_dict).
+
+    Обход итеративный, поэтому глубина вложенности не ограничена
+    лимитом рекурсии Python.
+    """
+    stack = [iter(blocks.items())]
+    while stack:
+        try:
+            key, data = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        yield key, data
+        children = data.get("children")
+        if children:
+            stack.append(iter(children.items()))
+
+
+def block_bounds(block_dict):
+    """
+    Возвращает ограничивающий прямоугольник блока (x1, y1, x2, y2)
+    по его "coordinatesXY".
+    """
+    coords = block_dict["coordinatesXY"]
+    x_values = [p[0] for p in coords]
+    y_values = [p[1] for p in coords]
+    return int(min(x_values)), int(min(y_values)), int(max(x_values)), int(max(y_values))
@@ -1,9 +1,52 @@
 # color_processing.py
+import threading
+from collections import Counter
+
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
 
-def detect_colors(block_dict, image, max_colors=3, sample_size=100):
+from modules import instrumentation
+from modules.block_tree import block_bounds
+
+# Счётчик того, какой веткой были обработаны блоки:
+# "solid" - быстрый путь для однотонных блоков, "kmeans", "palette",
+# "empty" - блок слишком мал для анализа
+_path_counts = Counter()
+_path_lock = threading.Lock()
+
+def _count_path(path):
+    with _path_lock:
+        _path_counts[path] += 1
+    instrumentation.count("color_path", path=path)
+
+def color_path_counts():
+    """Возвращает копию счётчика веток detect_colors / detect_colors_palette."""
+    with _path_lock:
+        return dict(_path_counts)
+
+def reset_color_path_counts():
+    with _path_lock:
+        _path_counts.clear()
+
+
+def _to_hex(bgr):
+    b, g, r = (int(v) for v in bgr)
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+def _cell_rect(x1, y1, x2, y2, cell_size, cells_h, cells_w):
+    """
+    Переводит прямоугольник в пикселях в прямоугольник в ячейках
+    (границы округляются до ближайших границ ячеек, минимум одна ячейка).
+    """
+    cs = cell_size
+    cx1 = min(max((x1 + cs // 2) // cs, 0), cells_w - 1)
+    cy1 = min(max((y1 + cs // 2) // cs, 0), cells_h - 1)
+    cx2 = min(max((x2 + cs // 2) // cs, cx1 + 1), cells_w)
+    cy2 = min(max((y2 + cs // 2) // cs, cy1 + 1), cells_h)
+    return cx1, cy1, cx2, cy2
+
+def detect_colors(block_dict, image, max_colors=3, sample_size=100, stats=None, solid_threshold=6.0,
+                  solid_inset=2, seed=None):
     """
     Определяет доминирующие цвета в блоке и возвращает их в HEX-формате.
     
@@ -12,42 +55,71 @@ def detect_colors(block_dict, image, max_colors=3, sample_size=100):
     - image: исходное изображение в BGR
     - max_colors: максимальное количество определяемых цветов
     - sample_size: размер выборки для анализа
+    - stats: ColorStatsIndex изображения (необязательно). Если задан, почти
+      однотонные блоки определяются за O(1) без кластеризации
+    - solid_threshold: максимальное СКО по каналам, при котором блок
+      считается однотонным
+    - solid_inset: отступ внутрь блока (px) при проверке однотонности,
+      чтобы не учитывать контур, по которому блок был найден
+    - seed: seed выборки пикселей и KMeans блока. Если задан, результат
+      воспроизводим и не зависит от других потоков; None - глобальный
+      генератор NumPy. Может быть функцией без аргументов, возвращающей
+      seed: она вызывается, только если блок кластеризуется
     
     Возвращает: словарь с массивом цветов {"colors": ["#HEX1", "#HEX2"]}
     """
-    
-    # Извлечение координат блока
-    coords = block_dict["coordinatesXY"]
-    x_values = [p[0] for p in coords]
-    y_values = [p[1] for p in coords]
-    
-    x1, x2 = int(min(x_values)), int(max(x_values))
-    y1, y2 = int(min(y_values)), int(max(y_values))
+    return detect_colors_rect(*block_bounds(block_dict), image, max_colors, sample_size,
+                              stats, solid_threshold, solid_inset, seed)
+
+def detect_colors_rect(x1, y1, x2, y2, image, max_colors=3, sample_size=100, stats=None,
+                       solid_threshold=6.0, solid_inset=2, seed=None):
+    """
+    То же, что detect_colors, но для прямоугольника (x1, y1, x2, y2)
+    (используется с BlockTable, где координаты хранятся в массивах).
+    """
     w, h = x2 - x1, y2 - y1
     
     if w <= 10 or h <= 10:
+        _count_path("empty")
         return {"colors": []}
 
+    # Быстрый путь: однотонный блок (фон, кнопка, разделитель)
+    if stats is not None:
+        mean, std = stats.mean_std(x1 + solid_inset, y1 + solid_inset, x2 - solid_inset, y2 - solid_inset)
+        if std.max() <= solid_threshold:
+            _count_path("solid")
+            return {"colors": [_to_hex(np.rint(mean))]}
+
     # Вырезаем область интереса
     roi = image[y1:y2, x1:x2]
     
     if roi.size == 0 or roi.shape[0] < 5 or roi.shape[1] < 5:
+        _count_path("empty")
         return {"colors": []}
 
+    _count_path("kmeans")
+    if callable(seed):
+        seed = seed()
+
     # Предобработка изображения
     roi_filtered = cv2.medianBlur(roi, 3)
     pixels = roi_filtered.reshape(-1, 3)
     
     # Уменьшаем выборку для производительности
     if len(pixels) > sample_size:
-        pixels = pixels[np.random.choice(pixels.shape[0], sample_size, replace=False)]
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        pixels = pixels[rng.choice(pixels.shape[0], sample_size, replace=False)]
 
     # Кластеризация цветов
     n_clusters = min(max_colors, len(pixels))
     if n_clusters < 1:
         return {"colors": []}
 
-    kmeans = KMeans(n_clusters=n_clusters, n_init=10)
+    # scikit-learn импортируется только когда нужна кластеризация
+    from sklearn.cluster import KMeans
+
+    instrumentation.count("kmeans_invocations")
+    kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=seed)
     labels = kmeans.fit_predict(pixels)
     
     # Получаем доминирующие цвета
@@ -60,4 +132,203 @@ def detect_colors(block_dict, image, max_colors=3, sample_size=100):
     unique_colors, counts = np.unique(colors, return_counts=True)
     sorted_colors = [color for _, color in sorted(zip(counts, unique_colors), reverse=True)]
     
-    return {"colors": sorted_colors[:max_colors]}
\ No newline at end of file
+    return {"colors": sorted_colors[:max_colors]}
+
+class PaletteIndex:
+    """
+    Палитра всего изображения + интегральные гистограммы меток.
+
+    Изображение один раз квантуется в фиксированную палитру (KMeans по
+    выборке пикселей с фиксированным seed), затем для каждой метки строится
+    интегральное изображение количества её пикселей. Гистограмма меток
+    любого прямоугольника считается за O(n_colors) независимо от его размера.
+
+    Для экономии памяти интегралы строятся по ячейкам cell_size x cell_size
+    (память ~ n_colors * H * W / cell_size^2 * 4 байт); границы блока при
+    поиске округляются до ближайших границ ячеек. cell_size=1 - точный режим.
+    """
+
+    def __init__(self, image, n_colors=16, sample_size=20000, seed=0, cell_size=4, chunk_rows=512):
+        """
+        :param image: исходное изображение в BGR.
+        :param n_colors: размер палитры (не больше 255).
+        :param sample_size: кол-во пикселей для обучения KMeans.
+        :param seed: seed выборки и KMeans (воспроизводимый результат).
+        :param cell_size: размер ячейки интегральных гистограмм (px).
+        :param chunk_rows: кол-во строк изображения, обрабатываемых за раз.
+        """
+        self.cell_size = cell_size
+        h, w = image.shape[:2]
+
+        # Та же предобработка, что и в detect_colors, но один раз на всё изображение
+        filtered = cv2.medianBlur(image, 3)
+        pixels = filtered.reshape(-1, 3)
+
+        rng = np.random.default_rng(seed)
+        if len(pixels) > sample_size:
+            sample = pixels[rng.choice(pixels.shape[0], sample_size, replace=False)]
+        else:
+            sample = pixels
+        n_colors = max(1, min(n_colors, len(np.unique(sample, axis=0))))
+
+        from sklearn.cluster import KMeans
+
+        instrumentation.count("kmeans_invocations")
+        kmeans = KMeans(n_clusters=n_colors, n_init=4, random_state=seed)
+        kmeans.fit(sample.astype(np.float32))
+        centers = kmeans.cluster_centers_.astype(np.float32)
+        self.palette = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+        self.hex_palette = [_to_hex(c) for c in self.palette]
+
+        # Квантование всех пикселей в метки палитры через таблицу поиска:
+        # цвет огрубляется до 6 бит на канал (262144 записей), для каждой
+        # записи заранее найден ближайший центр палитры.
+        levels = (np.arange(64, dtype=np.float32) * 4 + 2)
+        grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 1, 3)
+        lut = np.empty(len(grid), dtype=np.uint8)
+        for start in range(0, len(grid), 1 << 15):
+            dist = ((grid[start:start + (1 << 15)] - centers[None, :, :]) ** 2).sum(axis=2)
+            lut[start:start + (1 << 15)] = dist.argmin(axis=1)
+
+        hc, wc = -(-h // cell_size), -(-w // cell_size)
+        cell_rows = (np.arange(h) // cell_size).astype(np.int64) * wc
+        cell_cols = (np.arange(w) // cell_size).astype(np.int64)
+        counts = np.zeros(hc * wc * n_colors, dtype=np.int32)
+        for top in range(0, h, chunk_rows):
+            bottom = min(h, top + chunk_rows)
+            q = filtered[top:bottom] >> 2
+            idx = (q[..., 0].astype(np.int32) << 12) | (q[..., 1].astype(np.int32) << 6) | q[..., 2]
+            labels = lut[idx]
+            # Ячейки куска занимают непрерывный диапазон - считаем только его
+            first = cell_rows[top] * n_colors
+            last = (cell_rows[bottom - 1] + wc) * n_colors
+            cell_ids = cell_rows[top:bottom, None] + cell_cols[None, :]
+            counts[first:last] += np.bincount(
+                (cell_ids * n_colors + labels).ravel() - first, minlength=last - first
+            )
+
+        # Интегральные гистограммы по ячейкам: (n_colors, hc + 1, wc + 1)
+        counts = counts.reshape(hc, wc, n_colors).transpose(2, 0, 1)
+        self.integral = np.zeros((n_colors, hc + 1, wc + 1), dtype=np.int32)
+        self.integral[:, 1:, 1:] = counts.cumsum(axis=1, dtype=np.int32).cumsum(axis=2, dtype=np.int32)
+
+    def histogram(self, x1, y1, x2, y2):
+        """Кол-во пикселей каждой метки палитры в прямоугольнике (x1, y1, x2, y2)."""
+        _, hc1, wc1 = self.integral.shape
+        cx1, cy1, cx2, cy2 = _cell_rect(x1, y1, x2, y2, self.cell_size, hc1 - 1, wc1 - 1)
+        integral = self.integral
+        return (integral[:, cy2, cx2] - integral[:, cy1, cx2]
+                - integral[:, cy2, cx1] + integral[:, cy1, cx1])
+
+    def dominant_colors(self, x1, y1, x2, y2, max_colors=3, min_share=0.01):
+        """
+        Доминирующие цвета палитры в прямоугольнике, по убыванию доли.
+        Цвета с долей меньше min_share отбрасываются.
+        """
+        counts = self.histogram(x1, y1, x2, y2)
+        total = counts.sum()
+        if total == 0:
+            return []
+        order = np.argsort(-counts, kind="stable")[:max_colors]
+        return [self.hex_palette[k] for k in order if counts[k] > 0 and counts[k] >= min_share * total]
+
+
+def detect_colors_palette(block_dict, palette_index, max_colors=3, min_share=0.01,
+                          stats=None, solid_threshold=6.0, solid_inset=2):
+    """
+    Определяет доминирующие цвета блока по палитре всего изображения
+    (см. PaletteIndex). Формат результата совпадает с detect_colors:
+    {"colors": ["#HEX1", "#HEX2"]}
+
+    stats / solid_threshold / solid_inset - быстрый путь для однотонных блоков,
+    как в detect_colors.
+    """
+    return detect_colors_palette_rect(*block_bounds(block_dict), palette_index, max_colors, min_share,
+                                      stats, solid_threshold, solid_inset)
+
+
+def detect_colors_palette_rect(x1, y1, x2, y2, palette_index, max_colors=3, min_share=0.01,
+                               stats=None, solid_threshold=6.0, solid_inset=2):
+    """То же, что detect_colors_palette, но для прямоугольника (x1, y1, x2, y2)."""
+    if x2 - x1 <= 10 or y2 - y1 <= 10:
+        _count_path("empty")
+        return {"colors": []}
+
+    if stats is not None:
+        mean, std = stats.mean_std(x1 + solid_inset, y1 + solid_inset, x2 - solid_inset, y2 - solid_inset)
+        if std.max() <= solid_threshold:
+            _count_path("solid")
+            return {"colors": [_to_hex(np.rint(mean))]}
+
+    _count_path("palette")
+    return {"colors": palette_index.dominant_colors(x1, y1, x2, y2, max_colors, min_share)}
+
+
+class ColorStatsIndex:
+    """
+    Таблицы сумм (summed-area tables) по каналам изображения: сумма и сумма
+    квадратов. Строятся один раз на изображение, после чего точные среднее
+    и СКО любого прямоугольника считаются за O(1).
+
+    Таблицы точные (по каждому пикселю) и хранятся в два уровня, чтобы
+    обойтись int32 (24 байта на пиксель вместо 48 для int64):
+      - суммы от начала горизонтальной полосы (cv2.integral2 по полосе);
+        высота полосы подобрана так, чтобы сумма квадратов полосы
+        помещалась в int32;
+      - суммы всех строк выше начала каждой полосы (int64, по столбцам).
+    """
+
+    def __init__(self, image, max_band=64):
+        """
+        :param image: исходное изображение в BGR.
+        :param max_band: максимальная высота полосы (строк).
+        """
+        self.h, self.w = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+
+        # Высота полосы: 255^2 * высота * ширина должно помещаться в int32
+        band = (2 ** 31 - 1) // (255 * 255 * max(1, self.w))
+        sq_depth, sq_dtype = cv2.CV_32S, np.int32
+        if band < 1:  # изображение шире ~33000 px - суммы квадратов в float64 (точно до 2^53)
+            band, sq_depth, sq_dtype = max_band, cv2.CV_64F, np.float64
+        self.band = band = min(band, max_band)
+        n_bands = -(-self.h // band)
+
+        # Суммы от начала полосы: [полоса, строка в полосе (0 - нулевая), столбец (0 - нулевой), канал]
+        self.local_sum = np.zeros((n_bands, band + 1, self.w + 1, channels), dtype=np.int32)
+        self.local_sq = np.zeros((n_bands, band + 1, self.w + 1, channels), dtype=sq_dtype)
+        for b in range(n_bands):
+            rows = image[b * band:(b + 1) * band]
+            n = rows.shape[0]
+            cv2.integral2(rows, self.local_sum[b, :n + 1], self.local_sq[b, :n + 1],
+                          sdepth=cv2.CV_32S, sqdepth=sq_depth)
+
+        # Суммы всех строк выше начала полосы: [полоса, столбец, канал]
+        self.band_sum = np.zeros((n_bands, self.w + 1, channels), dtype=np.int64)
+        self.band_sq = np.zeros((n_bands, self.w + 1, channels), dtype=np.int64 if sq_dtype is np.int32 else np.float64)
+        self.band_sum[1:] = self.local_sum[:-1, band].cumsum(axis=0, dtype=np.int64)
+        self.band_sq[1:] = self.local_sq[:-1, band].cumsum(axis=0, dtype=self.band_sq.dtype)
+
+    def _prefix(self, y, x):
+        """(сумма, сумма квадратов) по строкам [0, y) и столбцам [0, x)."""
+        b = min(y // self.band, len(self.band_sum) - 1)
+        r = y - b * self.band
+        return (self.band_sum[b, x] + self.local_sum[b, r, x],
+                self.band_sq[b, x] + self.local_sq[b, r, x])
+
+    def mean_std(self, x1, y1, x2, y2):
+        """
+        Среднее и СКО по каналам (BGR) в прямоугольнике (x1, y1, x2, y2).
+        Для пустого прямоугольника СКО - бесконечность (блок не однотонный).
+        """
+        x1, x2 = max(0, x1), min(self.w, x2)
+        y1, y2 = max(0, y1), min(self.h, y2)
+        if x2 <= x1 or y2 <= y1:
+            return np.zeros(3), np.full(3, np.inf)
+
+        (s22, q22), (s12, q12) = self._prefix(y2, x2), self._prefix(y1, x2)
+        (s21, q21), (s11, q11) = self._prefix(y2, x1), self._prefix(y1, x1)
+        n = (x2 - x1) * (y2 - y1)
+        mean = (s22 - s12 - s21 + s11) / n
+        var = np.maximum((q22 - q12 - q21 + q11) / n - mean ** 2, 0.0)
+        return mean, np.sqrt(var)
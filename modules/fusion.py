@@ -0,0 +1,127 @@
+# fusion.py
+"""
+Слияние детекций YOLO (modules/yolo_processing.py) с деревом блоков OpenCV.
+
+Для каждой детекции через пространственный индекс (GridIndex) по блокам
+находятся пересекающиеся блоки и выбирается блок с наибольшим IoU. Если
+IoU не меньше порога, блок получает поле
+    "detection": {"class_id", "class_name", "confidence", "iou"}
+(блоку достаётся детекция с наибольшим IoU). Детекции без подходящего
+блока добавляются новыми листьями в самый маленький блок, который их
+содержит (или в block_00), с тем же полем "detection".
+"""
+
+import numpy as np
+
+from modules.block_table import BlockTable
+from modules.spatial_index import GridIndex
+
+
+def _detections_as_arrays(detections):
+    """
+    Детекции в виде (boxes (N, 4) xyxy, scores, class_ids, names).
+    Принимает словарь массивов (detect_elements_batch / detect_elements_tiled)
+    или список словарей detect_elements_with_yolo ("bbox": [x, y, w, h]).
+    """
+    if isinstance(detections, dict):
+        return (np.asarray(detections["boxes"], dtype=np.float64).reshape(-1, 4),
+                np.asarray(detections["scores"], dtype=np.float64),
+                np.asarray(detections["class_ids"], dtype=np.int64),
+                dict(detections.get("names", {})))
+
+    boxes = np.array([d["bbox"] for d in detections], dtype=np.float64).reshape(-1, 4)
+    boxes[:, 2:] += boxes[:, :2]
+    scores = np.array([d["confidence"] for d in detections], dtype=np.float64)
+    class_ids = np.array([d["class_id"] for d in detections], dtype=np.int64)
+    names = {d["class_id"]: d["class_name"] for d in detections}
+    return boxes, scores, class_ids, names
+
+
+def fuse_table(table, detections, iou_threshold=0.5, cell_size=256):
+    """
+    Слияние детекций с BlockTable (см. описание модуля).
+    Возвращает (новая BlockTable, статистика {"matched": n, "added": n}).
+    """
+    det_boxes, scores, class_ids, names = _detections_as_arrays(detections)
+
+    # Индекс строится по всем блокам, кроме корневого block_00
+    rows = np.flatnonzero(table.parent != -1)
+    block_boxes = np.stack([table.x, table.y, table.x + table.w, table.y + table.h], axis=1)[rows].astype(np.float64)
+    block_area = (block_boxes[:, 2] - block_boxes[:, 0]) * (block_boxes[:, 3] - block_boxes[:, 1])
+    index = GridIndex(block_boxes, cell_size=cell_size)
+
+    def detection_info(k, iou=None):
+        cls_id = int(class_ids[k])
+        info = {
+            "class_id": cls_id,
+            "class_name": names.get(cls_id, f"class_{cls_id}"),
+            "confidence": round(float(scores[k]), 4),
+        }
+        if iou is not None:
+            info["iou"] = round(float(iou), 4)
+        return info
+
+    best_for_block = {}  # строка блока -> (iou, индекс детекции)
+    unmatched = []       # индексы детекций без блока
+    for k, (x1, y1, x2, y2) in enumerate(det_boxes.tolist()):
+        cand = index.query_box(x1, y1, x2, y2)
+        if len(cand):
+            b = block_boxes[cand]
+            iw = np.minimum(b[:, 2], x2) - np.maximum(b[:, 0], x1)
+            ih = np.minimum(b[:, 3], y2) - np.maximum(b[:, 1], y1)
+            inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+            iou = inter / (block_area[cand] + (x2 - x1) * (y2 - y1) - inter)
+            j = int(np.argmax(iou))
+            if iou[j] >= iou_threshold:
+                row = int(rows[cand[j]])
+                # Блоку достаётся детекция с наибольшим IoU, уступившая - становится листом
+                if row not in best_for_block:
+                    best_for_block[row] = (float(iou[j]), k)
+                    continue
+                if iou[j] > best_for_block[row][0]:
+                    best_for_block[row], k = (float(iou[j]), k), best_for_block[row][1]
+        unmatched.append(k)
+
+    extras = list(table.extras)
+    for row, (iou, k) in best_for_block.items():
+        extras[row] = {**(extras[row] or {}), "detection": detection_info(k, iou)}
+    fused = BlockTable(table.names, table.x, table.y, table.w, table.h, table.parent,
+                       table.first_child, table.next_sibling, table.colors, table.text, extras)
+    if not unmatched:
+        return fused, {"matched": len(best_for_block), "added": 0}
+
+    # Новые листья - в самый маленький блок, целиком содержащий детекцию
+    child_counts = np.bincount(table.parent[table.parent != -1], minlength=len(table))
+    new_names, new_boxes, new_parents, new_extras = [], [], [], []
+    for k in sorted(unmatched):
+        x1, y1, x2, y2 = det_boxes[k]
+        parent_row = _smallest_container(index, rows, block_boxes, block_area, x1, y1, x2, y2)
+        new_names.append(f"{table.names[parent_row]}_{child_counts[parent_row]:02d}")
+        child_counts[parent_row] += 1
+        new_boxes.append((int(x1), int(y1), int(round(x2 - x1)), int(round(y2 - y1))))
+        new_parents.append(parent_row)
+        new_extras.append({"detection": detection_info(k)})
+
+    fused = fused.with_rows_added(new_names, new_boxes, new_parents, new_extras)
+    return fused, {"matched": len(best_for_block), "added": len(new_names)}
+
+
+def _smallest_container(index, rows, block_boxes, block_area, x1, y1, x2, y2):
+    """Строка самого маленького блока, целиком содержащего прямоугольник (0 - block_00)."""
+    cand = index.query_box(x1, y1, x2, y2)
+    if len(cand):
+        b = block_boxes[cand]
+        inside = (b[:, 0] <= x1) & (b[:, 1] <= y1) & (b[:, 2] >= x2) & (b[:, 3] >= y2)
+        if inside.any():
+            containing = cand[inside]
+            return int(rows[containing[np.argmin(block_area[containing])]])
+    return 0
+
+
+def fuse_detections(result_json, detections, iou_threshold=0.5, cell_size=256):
+    """
+    То же, что fuse_table, для JSON-дерева {"block_00": {...}}.
+    Возвращает (новое JSON-дерево, статистика).
+    """
+    table, stats = fuse_table(BlockTable.from_tree(result_json), detections, iou_threshold, cell_size)
+    return table.to_tree(), stats
@@ -1,15 +1,24 @@
+import html
 import os
 
-def generate_html(json_data, output_file="blocks.html"):
-    html_template = """<!DOCTYPE html>
+from modules import instrumentation
+from modules.block_table import BlockTable
+from modules.result_binary import load_result
+
+# Блок, который не виден на экране, браузер не отрисовывает (content-visibility),
+# поэтому страницы с тысячами блоков открываются и прокручиваются быстро
+HTML_HEAD = """<!DOCTYPE html>
 <html>
 <head>
-    <title>Blocks Collection</title>
+    <meta charset="utf-8">
+    <title>{title}</title>
     <style>
         fieldset {{
             margin: 20px;
             border: 2px solid #ccc;
             padding: 10px;
+            content-visibility: auto;
+            contain-intrinsic-size: auto 300px;
         }}
         .color-box {{
             width: 100px;
@@ -22,58 +31,200 @@ def generate_html(json_data, output_file="blocks.html"):
             border: 1px solid #000;
             margin-top: 10px;
         }}
+        .pages td {{
+            padding: 2px 10px;
+        }}
     </style>
 </head>
 <body>
-{content}
+"""
+
+HTML_TAIL = """
 </body>
 </html>"""
 
-    blocks_content = []
-
-    def process_block(block_id, block_data):
-        # Calculate block dimensions
-        coords = block_data.get('coordinatesXY', [])
-        if len(coords) < 4:
-            return ""
-            
-        x_values = [p[0] for p in coords]
-        y_values = [p[1] for p in coords]
-        width = max(x_values) - min(x_values)
-        height = max(y_values) - min(y_values)
-        
-        # Get colors and text
-        colors = block_data.get('colors', [])
-        text = block_data.get('text', '')
-        
-        # Generate color boxes with hex codes
-        colors_html = "".join(
-            f'<div class="color-box" style="background-color: {color};">{color}</div>\n'
-            for color in colors
-        )
-        
-        # Generate block HTML
-        return f"""
+
+def render_block(block_id, width, height, colors, text):
+    # Generate color boxes with hex codes
+    colors_html = "".join(
+        f'<div class="color-box" style="background-color: {html.escape(str(color))};">{html.escape(str(color))}</div>\n'
+        for color in colors
+    )
+
+    # Generate block HTML
+    return f"""
         <fieldset>
-            <legend>{block_id}</legend>
+            <legend>{html.escape(block_id)}</legend>
             <div class="colors">{colors_html}</div>
             <div class="block" style="width: {width}px; height: {height}px;">
-                {text}
+                {html.escape(text)}
             </div>
         </fieldset>
         """
 
-    def traverse_blocks(blocks, parent_id=""):
-        for block_id, block_data in blocks.items():
-            full_id = f"{parent_id}_{block_id}" if parent_id else block_id
-            blocks_content.append(process_block(full_id, block_data))
-            
-            if block_data.get('children'):
-                traverse_blocks(block_data['children'], full_id)
-
-    traverse_blocks(json_data['block_00']['children'])
-    
-    with open("blocks.html", 'w', encoding='utf-8') as f:
-        f.write(html_template.format(content="\n".join(blocks_content)))
-    
-    return "blocks.html"
\ No newline at end of file
+
+def iter_blocks_html(json_data):
+    """
+    HTML-фрагменты блоков в порядке обхода: пары (составной id, html).
+    Принимает JSON-дерево или BlockTable.
+    """
+    if isinstance(json_data, BlockTable):
+        return _iter_table_html(json_data)
+    return _iter_tree_html(json_data['block_00']['children'])
+
+
+def _iter_tree_html(blocks):
+    # Итеративный обход в глубину (глубокие деревья не упираются в предел рекурсии)
+    iterators = [iter(blocks.items())]
+    parents = [""]
+    while iterators:
+        item = next(iterators[-1], None)
+        if item is None:
+            iterators.pop()
+            parents.pop()
+            continue
+        block_id, block_data = item
+        full_id = f"{parents[-1]}_{block_id}" if parents[-1] else block_id
+        yield full_id, _process_block(full_id, block_data)
+
+        if block_data.get('children'):
+            iterators.append(iter(block_data['children'].items()))
+            parents.append(full_id)
+
+
+def _process_block(block_id, block_data):
+    # Calculate block dimensions
+    coords = block_data.get('coordinatesXY', [])
+    if len(coords) < 4:
+        return ""
+
+    x_values = [p[0] for p in coords]
+    y_values = [p[1] for p in coords]
+    width = max(x_values) - min(x_values)
+    height = max(y_values) - min(y_values)
+
+    # Get colors and text
+    colors = block_data.get('colors', [])
+    text = block_data.get('text', '')
+    return render_block(block_id, width, height, colors, text)
+
+
+def _iter_table_html(table):
+    # Тот же порядок и те же составные id, что и при обходе JSON-дерева
+    full_ids = {}
+    for i in range(len(table)):
+        p = int(table.parent[i])
+        if p == -1:
+            continue
+        name = table.names[i]
+        full_id = f"{full_ids[p]}_{name}" if p in full_ids else name
+        full_ids[i] = full_id
+        yield full_id, render_block(
+            full_id, int(table.w[i]), int(table.h[i]),
+            table.colors[i] or [], table.text[i] or ''
+        )
+
+
+def page_path(output_file, page):
+    """Путь к странице номер page (с 1): blocks.html -> blocks_001.html."""
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}_{page:03d}{ext or '.html'}"
+
+
+def _page_nav(output_file, page, n_pages):
+    links = [f'<a href="{html.escape(os.path.basename(output_file))}">Оглавление</a>']
+    if page > 1:
+        links.append(f'<a href="{html.escape(os.path.basename(page_path(output_file, page - 1)))}">&larr; {page - 1}</a>')
+    if page < n_pages:
+        links.append(f'<a href="{html.escape(os.path.basename(page_path(output_file, page + 1)))}">{page + 1} &rarr;</a>')
+    return f'<nav>Страница {page} из {n_pages}: {" | ".join(links)}</nav>\n'
+
+
+def generate_html(json_data, output_file="blocks.html", page_size=None):
+    """
+    Записывает HTML-коллекцию блоков в output_file. Блоки пишутся в файл
+    по одному, без сборки всего документа в памяти.
+
+    Если задан page_size, блоки разбиваются на страницы по page_size
+    (blocks_001.html, blocks_002.html, ... рядом с output_file), а в
+    output_file записывается оглавление (см. generate_html_pages).
+
+    json_data - JSON-дерево, BlockTable или путь к файлу результата (.json / .npz).
+    """
+    if page_size:
+        generate_html_pages(json_data, output_file, page_size)
+        return output_file
+
+    with instrumentation.timer("html"):
+        # Путь к файлу результата (.npz читается сразу в BlockTable)
+        json_data = load_result(json_data)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(HTML_HEAD.format(title="Blocks Collection"))
+            for _, fragment in iter_blocks_html(json_data):
+                f.write(fragment)
+                f.write("\n")
+            f.write(HTML_TAIL)
+
+    return output_file
+
+
+def generate_html_pages(json_data, output_file="blocks.html", page_size=500):
+    """
+    Постраничная HTML-коллекция: страницы по page_size блоков пишутся
+    потоково, в output_file - оглавление со ссылками на страницы.
+
+    Возвращает список страниц:
+    [{"path": "blocks_001.html", "first": id, "last": id, "blocks": n}, ...]
+    """
+    pages = []
+    with instrumentation.timer("html"):
+        json_data = load_result(json_data)
+        # Число страниц нужно для навигации, поэтому блоки считаются заранее
+        n_blocks = len(json_data) - 1 if isinstance(json_data, BlockTable) else _count_blocks(json_data)
+        n_pages = max(1, -(-n_blocks // page_size))
+        fragments = iter_blocks_html(json_data)
+
+        for page in range(1, n_pages + 1):
+            info = {"path": page_path(output_file, page), "first": None, "last": None, "blocks": 0}
+            nav = _page_nav(output_file, page, n_pages)
+            with open(info["path"], 'w', encoding='utf-8') as f:
+                f.write(HTML_HEAD.format(title=f"Blocks Collection - {page}/{n_pages}"))
+                f.write(nav)
+                for full_id, fragment in fragments:
+                    f.write(fragment)
+                    f.write("\n")
+                    if info["first"] is None:
+                        info["first"] = full_id
+                    info["last"] = full_id
+                    info["blocks"] += 1
+                    if info["blocks"] == page_size:
+                        break
+                f.write(nav)
+                f.write(HTML_TAIL)
+            pages.append(info)
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(HTML_HEAD.format(title="Blocks Collection"))
+            f.write(f"<h1>Blocks Collection</h1>\n<p>Блоков: {n_blocks}, страниц: {n_pages}</p>\n")
+            f.write('<table class="pages">\n')
+            for page, info in enumerate(pages, start=1):
+                f.write(
+                    f'<tr><td><a href="{html.escape(os.path.basename(info["path"]))}">{page}</a></td>'
+                    f'<td>{html.escape(info["first"] or "")} &hellip; {html.escape(info["last"] or "")}</td>'
+                    f'<td>{info["blocks"]}</td></tr>\n'
+                )
+            f.write("</table>")
+            f.write(HTML_TAIL)
+
+    return pages
+
+
+def _count_blocks(tree):
+    """Число блоков JSON-дерева (без block_00)."""
+    n = 0
+    stack = [tree['block_00'].get('children') or {}]
+    while stack:
+        children = stack.pop()
+        n += len(children)
+        stack.extend(data.get('children') or {} for data in children.values())
+    return n
@@ -0,0 +1,146 @@
+# incremental.py
+"""
+Инкрементальная обработка новой версии скриншота по результату предыдущей.
+
+1. Изображения сравниваются по ячейкам cell_size x cell_size: ячейка
+   считается изменённой, если хоть один пиксель отличается больше чем на
+   diff_threshold. Если изменений нет, возвращается копия старого результата.
+2. Сегментация выполняется заново для всей страницы: она в десятки раз
+   дешевле определения цветов и OCR и только так даёт те же id и иерархию
+   блоков, что и полная обработка.
+3. Блок, прямоугольник которого совпадает с блоком старого результата и не
+   задевает изменённых ячеек, получает старые "colors" и "text" без
+   пересчёта. Цвета и текст пересчитываются только для остальных блоков.
+
+Параметры обработки должны совпадать с параметрами предыдущего результата.
+В режиме color_mode = 'palette' переиспользованные блоки сохраняют цвета
+старой палитры, поэтому могут немного отличаться от полного пересчёта.
+"""
+
+import copy
+
+import cv2
+import numpy as np
+
+from modules import instrumentation
+from modules.block_table import BlockTable
+from modules.opencv_processing import find_blocks_table
+from modules.pipeline import analyze_rects, with_ocr_skipped
+
+
+def changed_cells(prev_image, image, cell_size=32, diff_threshold=0):
+    """
+    Маска изменённых ячеек (hc, wc) для изображений одинакового размера:
+    True, если в ячейке есть пиксель с разницей больше diff_threshold.
+    """
+    h, w = image.shape[:2]
+    hc, wc = -(-h // cell_size), -(-w // cell_size)
+    diff = cv2.absdiff(prev_image, image)
+    channels = diff.shape[2] if diff.ndim == 3 else 1
+    diff = cv2.copyMakeBorder(diff, 0, hc * cell_size - h, 0, wc * cell_size - w, cv2.BORDER_CONSTANT, value=0)
+    # Каналы пикселя идут подряд в строке, поэтому максимум по ячейке берётся сразу по всем каналам
+    cells = diff.reshape(hc, cell_size, wc, cell_size * channels).max(axis=(1, 3))
+    return cells > diff_threshold
+
+
+def changed_regions(cells, cell_size=32):
+    """Ограничивающие прямоугольники (x1, y1, x2, y2) связных областей изменённых ячеек."""
+    n, _, stats, _ = cv2.connectedComponentsWithStats(cells.astype(np.uint8), connectivity=8)
+    return [
+        [int(x * cell_size), int(y * cell_size), int((x + w) * cell_size), int((y + h) * cell_size)]
+        for x, y, w, h, _ in stats[1:n].tolist()
+    ]
+
+
+def process_incremental(prev_image, prev_result, image, params=None, cell_size=32, diff_threshold=0):
+    """
+    Обрабатывает 'image', переиспользуя цвета и текст блоков из 'prev_result'
+    (результат обработки 'prev_image' с теми же параметрами).
+
+    Возвращает (JSON-дерево, отчёт):
+    {
+      "full": bool - старый результат не использовался (другой размер изображения),
+      "changed_regions": [[x1, y1, x2, y2], ...],
+      "reused": [id блоков с цветами и текстом из старого результата],
+      "recomputed": [id блоков, для которых цвета и текст посчитаны заново]
+    }
+    """
+    if prev_image is None or prev_image.shape != image.shape:
+        table = find_blocks_table(image, params)
+        rows = [i for i in range(len(table)) if table.parent[i] != -1]
+        _analyze_rows(table, rows, image, params)
+        return table.to_tree(), {
+            "full": True,
+            "changed_regions": [[0, 0, image.shape[1], image.shape[0]]],
+            "reused": [],
+            "recomputed": [table.names[i] for i in rows],
+        }
+
+    with instrumentation.timer("incremental_diff"):
+        cells = changed_cells(prev_image, image, cell_size, diff_threshold)
+        regions = changed_regions(cells, cell_size)
+    if not regions:
+        result_json = copy.deepcopy(prev_result)
+        prev_table = BlockTable.from_tree(result_json)
+        return result_json, {
+            "full": False,
+            "changed_regions": [],
+            "reused": [name for i, name in enumerate(prev_table.names) if prev_table.parent[i] != -1],
+            "recomputed": [],
+        }
+
+    table = find_blocks_table(image, params)
+    prev_table = BlockTable.from_tree(prev_result)
+
+    # Старые блоки по прямоугольнику (x, y, w, h)
+    prev_by_box = {}
+    for i in range(len(prev_table)):
+        if prev_table.parent[i] != -1:
+            key = (int(prev_table.x[i]), int(prev_table.y[i]), int(prev_table.w[i]), int(prev_table.h[i]))
+            prev_by_box.setdefault(key, []).append(i)
+
+    # Интеграл по маске изменённых ячеек: задет ли блок изменениями - за O(1)
+    integral = cv2.integral(cells.astype(np.uint8))
+    hc, wc = cells.shape
+
+    def touches_change(i):
+        x1, y1, x2, y2 = table.bounds(i)
+        cx1, cy1 = min(max(x1 // cell_size, 0), wc), min(max(y1 // cell_size, 0), hc)
+        cx2, cy2 = min(max(-(-x2 // cell_size), cx1), wc), min(max(-(-y2 // cell_size), cy1), hc)
+        return (integral[cy2, cx2] - integral[cy1, cx2] - integral[cy2, cx1] + integral[cy1, cx1]) > 0
+
+    reused, recompute = [], []
+    for i in range(1, len(table)):
+        if table.parent[i] == -1:
+            continue
+        key = (int(table.x[i]), int(table.y[i]), int(table.w[i]), int(table.h[i]))
+        candidates = prev_by_box.get(key)
+        if candidates and not touches_change(i):
+            j = candidates.pop(0)
+            table.colors[i] = prev_table.colors[j]
+            table.text[i] = prev_table.text[j]
+            table.extras[i] = prev_table.extras[j]
+            reused.append(i)
+        else:
+            recompute.append(i)
+
+    instrumentation.count("blocks_reused", len(reused))
+    instrumentation.count("blocks_recomputed", len(recompute))
+    _analyze_rows(table, recompute, image, params)
+    return table.to_tree(), {
+        "full": False,
+        "changed_regions": regions,
+        "reused": [table.names[i] for i in reused],
+        "recomputed": [table.names[i] for i in recompute],
+    }
+
+
+def _analyze_rows(table, rows, image, params):
+    """Цвета и текст для выбранных строк таблицы (см. pipeline.analyze_rects)."""
+    if not rows:
+        return
+    colors, texts, skipped = analyze_rects([table.bounds(i) for i in rows], image, params)
+    for i, block_colors, text, skip in zip(rows, colors, texts, skipped):
+        table.colors[i] = block_colors
+        table.text[i] = text
+        table.extras[i] = with_ocr_skipped(table.extras[i], skip)
@@ -0,0 +1,213 @@
+# instrumentation.py
+"""
+Встроенные метрики конвейера: время стадий (wall и CPU), счётчики и
+текущие значения (gauges). Экспорт в JSON и в текстовый формат Prometheus.
+
+По умолчанию сбор выключен: timer() возвращает общий пустой контекстный
+менеджер, count() / gauge() сразу выходят, поэтому в горячих участках
+кода инструментирование почти ничего не стоит. Включается через enable().
+
+Пример:
+    from modules import instrumentation
+
+    instrumentation.enable()
+    instrumentation.reset()
+    result_json = process_image(image, params)
+    instrumentation.write_metrics("output-metrics")  # .json и .prom
+
+Все метрики хранятся в одном реестре процесса и защищены блокировкой,
+поэтому их можно обновлять из нескольких потоков. CPU-время считается
+по процессу (time.process_time), т.е. включает потоки OpenCV / torch.
+"""
+
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_lock = threading.Lock()
+
+# stage -> {"calls": int, "wall_s": float, "cpu_s": float}
+_timings = {}
+# (name, ((label, value), ...)) -> число
+_counters = {}
+_gauges = {}
+# Однократные метрики запуска процесса (импорт, загрузка моделей, первый запрос)
+_startup = {}
+
+
+def enable(flag=True):
+    """Включает (или выключает) сбор метрик."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Очищает все накопленные метрики (кроме метрик запуска, см. startup_gauge)."""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+class _NullTimer:
+    """Пустой контекстный менеджер для выключенного сбора метрик."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        with _lock:
+            entry = _timings.setdefault(self.stage, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            entry["calls"] += 1
+            entry["wall_s"] += wall
+            entry["cpu_s"] += cpu
+        return False
+
+
+def timer(stage):
+    """
+    Контекстный менеджер, накапливающий время стадии 'stage':
+        with instrumentation.timer("segmentation_mask"):
+            ...
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def count(name, value=1, **labels):
+    """Увеличивает счётчик name{labels} на value."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    """Устанавливает текущее значение name{labels}."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+
+def startup_gauge(name, value, **labels):
+    """
+    Метрика запуска процесса (время импорта, загрузки модели, первого
+    запроса). Такие события однократные, поэтому записываются всегда,
+    даже при выключенном сборе, и не очищаются reset().
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _startup[key] = value
+
+
+def snapshot():
+    """
+    Копия всех метрик в виде словаря, пригодного для JSON:
+    {"timings": {stage: {...}}, "counters": [...], "gauges": [...], "startup": [...]}
+    """
+    def series(table):
+        return [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(table.items(), key=lambda item: (item[0][0], item[0][1]))
+        ]
+
+    with _lock:
+        return {
+            "timings": {
+                stage: {"calls": t["calls"], "wall_s": round(t["wall_s"], 6), "cpu_s": round(t["cpu_s"], 6)}
+                for stage, t in _timings.items()
+            },
+            "counters": series(_counters),
+            "gauges": series(_gauges),
+            "startup": series(_startup),
+        }
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def to_prometheus(data=None, prefix="layout"):
+    """Метрики в текстовом формате Prometheus (exposition format)."""
+    if data is None:
+        data = snapshot()
+
+    lines = []
+    if data["timings"]:
+        for metric, field, help_text in (
+            (f"{prefix}_stage_calls_total", "calls", "Number of stage executions"),
+            (f"{prefix}_stage_wall_seconds_total", "wall_s", "Stage wall-clock time"),
+            (f"{prefix}_stage_cpu_seconds_total", "cpu_s", "Stage process CPU time"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for stage, t in data["timings"].items():
+                lines.append(f"{metric}{_prom_labels({'stage': stage})} {t[field]}")
+
+    for kind, suffix, items in (
+        ("counter", "_total", data["counters"]),
+        ("gauge", "", data["gauges"] + data.get("startup", [])),
+    ):
+        declared = set()
+        for item in items:
+            metric = f"{prefix}_{item['name']}{suffix}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric}{_prom_labels(item['labels'])} {item['value']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(base_path, data=None):
+    """
+    Сохраняет метрики в base_path + ".json" и base_path + ".prom".
+    Возвращает пути к обоим файлам.
+    """
+    if data is None:
+        data = snapshot()
+
+    json_path, prom_path = f"{base_path}.json", f"{base_path}.prom"
+    for path, content in (
+        (json_path, json.dumps(data, ensure_ascii=False, indent=2)),
+        (prom_path, to_prometheus(data)),
+    ):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return json_path, prom_path
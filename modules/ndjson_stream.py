@@ -0,0 +1,150 @@
+# ndjson_stream.py
+"""
+Потоковый вывод результата в формате NDJSON: одна строка JSON на блок,
+строка пишется сразу после того, как блок проанализирован.
+
+Формат строки:
+    {"id": "block_00_01", "parent": "block_00", "coordinatesXY": [[x, y], ...],
+     "colors": [...], "text": "..."}
+Первой идёт строка корневого блока block_00 ("parent": null, без цветов
+и текста). Блоки выводятся в порядке обхода в глубину, поэтому родитель
+всегда появляется раньше своих детей. Дополнительные поля блока (например,
+"detection") записываются в строку как есть.
+
+Дерево из строк собирает TreeBuilder (в том числе по частично записанному
+файлу - так приложение показывает результат по мере обработки).
+"""
+
+import json
+
+from modules.opencv_processing import find_blocks_table
+from modules.block_table import BlockTable
+from modules.pipeline import iter_analyzed_rects, with_ocr_skipped
+
+# Служебные поля строки (всё остальное - поля блока)
+_RECORD_KEYS = ("id", "parent")
+
+
+def block_record(table, i):
+    """Строка NDJSON (словарь) для строки i таблицы блоков."""
+    p = table.parent[i]
+    record = {
+        "id": table.names[i],
+        "parent": table.names[p] if p != -1 else None,
+        "coordinatesXY": table.coordinates(i),
+    }
+    if table.colors[i] is not None:
+        record["colors"] = table.colors[i]
+    if table.text[i] is not None:
+        record["text"] = table.text[i]
+    if table.extras[i]:
+        record.update(table.extras[i])
+    return record
+
+
+def dumps_record(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+def iter_block_records(image, params=None, chunk_size=16, table=None, roi_store=None):
+    """
+    Сегментирует изображение (если table не передана) и выдаёт строки
+    блоков по мере анализа: сначала корневые блоки, затем каждый блок,
+    как только для его группы из chunk_size блоков посчитаны цвета и текст.
+    roi_store - хранилище результатов по фрагментам (см. pipeline.analyze_rects).
+    """
+    if table is None:
+        table = find_blocks_table(image, params)
+
+    rows = []
+    for i in range(len(table)):
+        if table.parent[i] == -1:
+            yield block_record(table, i)
+        else:
+            rows.append(i)
+
+    rects = [table.bounds(i) for i in rows]
+    for k, block_colors, text, skipped in iter_analyzed_rects(rects, image, params, chunk_size, roi_store):
+        i = rows[k]
+        table.colors[i] = block_colors
+        table.text[i] = text
+        table.extras[i] = with_ocr_skipped(table.extras[i], skipped)
+        yield block_record(table, i)
+
+
+def stream_blocks(image, out_file, params=None, chunk_size=16):
+    """
+    Пишет строки блоков в открытый текстовый файл 'out_file' по мере
+    анализа (после каждой строки - flush). Возвращает число строк.
+    """
+    n = 0
+    for record in iter_block_records(image, params, chunk_size):
+        out_file.write(dumps_record(record) + "\n")
+        out_file.flush()
+        n += 1
+    return n
+
+
+def write_ndjson(tree, out_file):
+    """Записывает готовое JSON-дерево {"block_00": {...}} в формате NDJSON."""
+    table = tree if isinstance(tree, BlockTable) else BlockTable.from_tree(tree)
+    for i in range(len(table)):
+        out_file.write(dumps_record(block_record(table, i)) + "\n")
+
+
+class TreeBuilder:
+    """
+    Собирает вложенное JSON-дерево из строк NDJSON по мере их поступления.
+    Строки, родитель которых ещё не встречался, откладываются до его появления.
+    """
+
+    def __init__(self):
+        self.tree = {}
+        self.n_blocks = 0
+        self._nodes = {}
+        self._pending = {}  # id родителя -> отложенные строки
+
+    def add(self, record):
+        node = {"coordinatesXY": record["coordinatesXY"], "children": {}}
+        node.update((k, v) for k, v in record.items() if k not in _RECORD_KEYS and k != "coordinatesXY")
+
+        parent_id = record.get("parent")
+        if parent_id is None:
+            self.tree[record["id"]] = node
+        elif parent_id in self._nodes:
+            self._nodes[parent_id]["children"][record["id"]] = node
+        else:
+            self._pending.setdefault(parent_id, []).append(record)
+            return
+        self._nodes[record["id"]] = node
+        self.n_blocks += 1
+
+        for child in self._pending.pop(record["id"], []):
+            self.add(child)
+
+    def add_line(self, line):
+        """Добавляет строку NDJSON; пустые и оборванные (недописанные) строки пропускаются."""
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        self.add(record)
+
+
+def read_ndjson(lines):
+    """
+    Собирает вложенное JSON-дерево из строк NDJSON (итерируемый объект
+    строк, например открытый файл).
+    """
+    builder = TreeBuilder()
+    for line in lines:
+        builder.add_line(line)
+    return builder.tree
+
+
+def load_ndjson(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return read_ndjson(f)
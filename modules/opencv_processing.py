@@ -1,6 +1,405 @@
 import cv2
 import numpy as np
 
+from modules import instrumentation
+from modules.block_table import BlockTable
+
+# Значения параметров по умолчанию (если параметр не передан в 'params')
+DEFAULT_PARAMS = {
+    "threshold_method": "fixed",
+    "threshold_value": 127,
+    "max_value": 255,
+    "adaptive_block_size": 11,
+    "adaptive_C": 2,
+    "morphology_kernel_size": 3,
+    "morphology_iterations": 1,
+    "min_block_width": 20,
+    "min_block_height": 20,
+    "retrieval_mode": "RETR_EXTERNAL",
+    "approx_method": "CHAIN_APPROX_SIMPLE",
+    "min_area": 0,
+    "max_area": 999999,
+    "approx_polygons": False,
+    "tile_height": 0,
+    "pyramid_cell": 0,
+}
+
+# Параметры, от которых зависит каждая стадия сегментации (без учёта предыдущих стадий)
+STAGE_PARAMS = {
+    "grayscale": (),
+    "threshold": ("threshold_method", "threshold_value", "max_value", "adaptive_block_size", "adaptive_C"),
+    "morphology": ("morphology_kernel_size", "morphology_iterations"),
+    "contours": ("retrieval_mode", "approx_method"),
+    "tree": ("approx_polygons", "min_block_width", "min_block_height", "min_area", "max_area"),
+}
+STAGES = ("grayscale", "threshold", "morphology", "contours", "tree")
+
+
+def _param(params, name):
+    return params.get(name, DEFAULT_PARAMS[name])
+
+
+def stage_params(stage, params):
+    """
+    Параметры, от которых реально зависит результат стадии. Для бинаризации
+    учитывается метод: например, при "otsu" порог threshold_value не важен.
+    """
+    names = STAGE_PARAMS[stage]
+    if stage == "threshold":
+        method = _param(params, "threshold_method")
+        if method in ("otsu", "triangle"):
+            names = ("threshold_method", "max_value")
+        elif method in ("adaptive_mean", "adaptive_gaussian"):
+            names = ("threshold_method", "max_value", "adaptive_block_size", "adaptive_C")
+        else:
+            names = ("threshold_method", "threshold_value", "max_value")
+    return tuple((name, _param(params, name)) for name in names)
+
+
+def to_grayscale(image):
+    """Стадия 1: перевод в grayscale."""
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def threshold_image(gray, params):
+    """Стадия 2: бинаризация (threshold_method, threshold_value, max_value, adaptive_*)."""
+    threshold_method      = _param(params, "threshold_method")
+    threshold_value       = _param(params, "threshold_value")
+    max_value             = _param(params, "max_value")
+    adaptive_block_size   = _param(params, "adaptive_block_size")
+    adaptive_C            = _param(params, "adaptive_C")
+
+    if threshold_method == "fixed":
+        # Простой фиксированный порог
+        _, thresh = cv2.threshold(gray, threshold_value, max_value, cv2.THRESH_BINARY_INV)
+
+    elif threshold_method == "otsu":
+        # OTSU автоматически определяет оптимальный порог
+        _, thresh = cv2.threshold(gray, 0, max_value, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    elif threshold_method == "triangle":
+        # Автоматический порог методом треугольника
+        _, thresh = cv2.threshold(gray, 0, max_value, cv2.THRESH_BINARY_INV | cv2.THRESH_TRIANGLE)
+
+    elif threshold_method == "adaptive_mean":
+        thresh = cv2.adaptiveThreshold(
+            gray,
+            max_value,
+            cv2.ADAPTIVE_THRESH_MEAN_C,
+            cv2.THRESH_BINARY_INV,
+            adaptive_block_size,
+            adaptive_C
+        )
+
+    elif threshold_method == "adaptive_gaussian":
+        thresh = cv2.adaptiveThreshold(
+            gray,
+            max_value,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV,
+            adaptive_block_size,
+            adaptive_C
+        )
+    else:
+        # Fallback (на всякий случай)
+        _, thresh = cv2.threshold(gray, threshold_value, max_value, cv2.THRESH_BINARY_INV)
+
+    return thresh
+
+
+def apply_morphology(thresh, params):
+    """Стадия 3: морфологическое закрытие (morphology_kernel_size, morphology_iterations)."""
+    morphology_kernel_size = _param(params, "morphology_kernel_size")
+    morphology_iterations  = _param(params, "morphology_iterations")
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (morphology_kernel_size, morphology_kernel_size))
+    for _ in range(morphology_iterations):
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    return thresh
+
+
+def find_contours(thresh, params):
+    """Стадия 4: findContours с иерархией (retrieval_mode, approx_method)."""
+    retrieval_mode_str    = _param(params, "retrieval_mode")
+    approx_method_str     = _param(params, "approx_method")
+
+    # Конвертация retrieval_mode_str в константу OpenCV
+    if retrieval_mode_str == "RETR_EXTERNAL":
+        retrieval_mode = cv2.RETR_EXTERNAL
+    elif retrieval_mode_str == "RETR_TREE":
+        retrieval_mode = cv2.RETR_TREE
+    elif retrieval_mode_str == "RETR_CCOMP":
+        retrieval_mode = cv2.RETR_CCOMP
+    else:
+        retrieval_mode = cv2.RETR_LIST
+
+    # Конвертация approx_method_str в константу OpenCV
+    if approx_method_str == "CHAIN_APPROX_NONE":
+        approx_method = cv2.CHAIN_APPROX_NONE
+    elif approx_method_str == "CHAIN_APPROX_TC89_L1":
+        approx_method = cv2.CHAIN_APPROX_TC89_L1
+    elif approx_method_str == "CHAIN_APPROX_TC89_KCOS":
+        approx_method = cv2.CHAIN_APPROX_TC89_KCOS
+    else:
+        approx_method = cv2.CHAIN_APPROX_SIMPLE
+
+    return cv2.findContours(thresh, retrieval_mode, approx_method)
+
+
+def _otsu_threshold(hist):
+    """Порог Оцу по гистограмме (повторяет getThreshVal_Otsu_8u из OpenCV)."""
+    total = hist.sum()
+    mu = (np.arange(256) * hist).sum() / total
+    eps = np.finfo(np.float32).eps
+    q1, mu1, max_sigma, max_val = 0.0, 0.0, 0.0, 0
+    for i in range(256):
+        p_i = hist[i] / total
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+        if sigma > max_sigma:
+            max_sigma, max_val = sigma, i
+    return max_val
+
+
+def _triangle_threshold(hist):
+    """Порог методом треугольника по гистограмме (повторяет getThreshVal_Triangle_8u из OpenCV)."""
+    hist = [int(v) for v in hist]
+    n = len(hist)
+    nonzero = [i for i, v in enumerate(hist) if v > 0]
+    left_bound = max(nonzero[0] - 1, 0)
+    right_bound = nonzero[-1] if nonzero[-1] > 0 else 0
+    if right_bound < n - 1:
+        right_bound += 1
+    max_ind = int(np.argmax(hist))
+
+    flipped = max_ind - left_bound < right_bound - max_ind
+    if flipped:
+        hist = hist[::-1]
+        left_bound, max_ind = n - 1 - right_bound, n - 1 - max_ind
+
+    thresh = left_bound
+    a, b, dist = hist[max_ind], left_bound - max_ind, 0
+    for i in range(left_bound + 1, max_ind + 1):
+        temp_dist = a * i + b * hist[i]
+        if temp_dist > dist:
+            dist, thresh = temp_dist, i
+    thresh -= 1
+
+    return n - 1 - thresh if flipped else thresh
+
+
+def tile_guard(params):
+    """
+    Кол-во строк у края полосы, на которые влияет граница полосы:
+    окно adaptiveThreshold + радиус морфологического закрытия
+    (дилатация и эрозия на каждой итерации).
+    """
+    guard = 0
+    if _param(params, "threshold_method") in ("adaptive_mean", "adaptive_gaussian"):
+        guard += _param(params, "adaptive_block_size") // 2
+    guard += 2 * (_param(params, "morphology_kernel_size") // 2) * _param(params, "morphology_iterations")
+    return guard
+
+
+def build_mask_tiled(image, params, tile_height):
+    """
+    Стадии 1-3 (grayscale, бинаризация, морфология) по горизонтальным полосам.
+
+    Каждая полоса обрабатывается с перекрытием tile_guard(params) строк
+    сверху и снизу, а в итоговую бинарную маску копируются только её
+    "точные" строки, на которые граница полосы не влияет. Поэтому маска
+    совпадает с маской, полученной на всём изображении, а контуры блоков,
+    пересекающих границы полос, прослеживаются целиком.
+
+    Для "otsu" / "triangle" порог считается по гистограмме всего изображения
+    (накапливается по полосам), затем применяется как фиксированный.
+
+    Промежуточные буферы (grayscale, бинаризация, морфология) занимают
+    память порядка полосы; на всю высоту страницы - только маска (1 байт/px).
+    """
+    h, w = image.shape[:2]
+    guard = tile_guard(params)
+
+    method = _param(params, "threshold_method")
+    if method in ("otsu", "triangle"):
+        hist = np.zeros(256, dtype=np.int64)
+        for top in range(0, h, tile_height):
+            gray = to_grayscale(image[top:top + tile_height])
+            hist += np.bincount(gray.ravel(), minlength=256)
+        value = _otsu_threshold(hist) if method == "otsu" else _triangle_threshold(hist)
+        params = {**params, "threshold_method": "fixed", "threshold_value": value}
+
+    mask = np.empty((h, w), dtype=np.uint8)
+    for top in range(0, h, tile_height):
+        bottom = min(h, top + tile_height)
+        window_top, window_bottom = max(0, top - guard), min(h, bottom + guard)
+
+        gray = to_grayscale(image[window_top:window_bottom])
+        thresh = apply_morphology(threshold_image(gray, params), params)
+        mask[top:bottom] = thresh[top - window_top:bottom - window_top]
+
+    return mask
+
+
+def _global_threshold_params(gray, params):
+    """Для "otsu" / "triangle" - порог по гистограмме всего изображения как фиксированный."""
+    method = _param(params, "threshold_method")
+    if method not in ("otsu", "triangle"):
+        return params
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    value = _otsu_threshold(hist) if method == "otsu" else _triangle_threshold(hist)
+    return {**params, "threshold_method": "fixed", "threshold_value": value}
+
+
+def flat_cells(gray, cell):
+    """
+    Грубый уровень: изображение делится на ячейки cell x cell, для каждой
+    считаются минимум и максимум яркости. Возвращает (маска однотонных ячеек
+    (max == min), яркость ячейки (минимум)), обе формы (hc, wc).
+    """
+    # Эрозия / дилатация окном cell x cell с якорем в левом верхнем углу -
+    # минимум / максимум ячейки в её левом верхнем пикселе (пиксели за краем
+    # изображения не учитываются)
+    kernel = np.ones((cell, cell), dtype=np.uint8)
+    cell_min = cv2.erode(gray, kernel, anchor=(0, 0))[::cell, ::cell]
+    cell_max = cv2.dilate(gray, kernel, anchor=(0, 0))[::cell, ::cell]
+    return cell_max == cell_min, np.ascontiguousarray(cell_min)
+
+
+def _flat_value_lut(params, values, guard):
+    """
+    Значение маски для однотонной области яркости v (бинаризация и морфология
+    однотонного участка дают однотонный результат) - для каждого v из values.
+    """
+    lut = np.zeros(256, dtype=np.uint8)
+    size = 2 * guard + 3
+    for v in values.tolist():
+        patch = np.full((size, size), v, dtype=np.uint8)
+        lut[v] = apply_morphology(threshold_image(patch, params), params)[size // 2, size // 2]
+    return lut
+
+
+def _detail_windows(detail, cell, w, h, strip_px=128):
+    """
+    Прямоугольники (в пикселях) для уточнения ячеек detail: полосы высотой
+    около strip_px, в каждой - отрезки подряд идущих столбцов с уточняемыми
+    ячейками, по высоте обрезанные до строк с такими ячейками. В отличие от
+    прямоугольников связных областей, рамка большой панели не тянет за собой
+    её однотонную середину.
+    """
+    strip = max(1, strip_px // cell)
+    for r0 in range(0, detail.shape[0], strip):
+        band = detail[r0:r0 + strip]
+        cols = np.flatnonzero(band.any(axis=0))
+        if not len(cols):
+            continue
+        # Границы отрезков подряд идущих столбцов
+        breaks = np.flatnonzero(np.diff(cols) > 1)
+        for c0, c1 in zip(cols[np.r_[0, breaks + 1]].tolist(), cols[np.r_[breaks, len(cols) - 1]].tolist()):
+            rows = np.flatnonzero(band[:, c0:c1 + 1].any(axis=1))
+            yield (c0 * cell, (r0 + rows[0]) * cell,
+                   min(w, (c1 + 1) * cell), min(h, (r0 + rows[-1] + 1) * cell))
+
+
+def build_mask_pyramid(image, params, cell):
+    """
+    Стадии 1-3 (grayscale, бинаризация, морфология) от грубого к точному.
+
+    На грубом уровне (ячейки cell x cell, минимум и максимум яркости)
+    находятся однотонные ячейки: в них маска заранее известна (см.
+    _flat_value_lut). Остальные ячейки - границы блоков и мелкие элементы -
+    вместе с соседями на расстоянии tile_guard(params) пикселей
+    обрабатываются в исходном разрешении (см. _detail_windows).
+
+    Маска совпадает с маской всего изображения. Выигрыш - на высоких
+    страницах с крупными однотонными областями; если границ и мелких
+    элементов много, уточняется почти всё изображение и режим медленнее
+    обычной обработки.
+    """
+    gray = to_grayscale(image)
+    h, w = gray.shape
+    params = _global_threshold_params(gray, params)
+    guard = tile_guard(params)
+
+    flat, cell_value = flat_cells(gray, cell)
+
+    # Однотонные ячейки: значение маски по таблице
+    lut = _flat_value_lut(params, np.unique(cell_value[flat]), guard)
+    coarse = lut[cell_value]
+    hc, wc = coarse.shape
+    mask = cv2.resize(coarse, (wc * cell, hc * cell), interpolation=cv2.INTER_NEAREST)[:h, :w].copy()
+
+    # Ячейки для уточнения: неоднотонные, граничащие с ячейкой другой яркости
+    # (граница проходит по краю ячейки) и те, до которых от них достаёт окно
+    # бинаризации/морфологии
+    square = np.ones((3, 3), dtype=np.uint8)
+    value_step = cv2.dilate(cell_value, square).astype(np.int16) - cv2.erode(cell_value, square)
+    detail = ((~flat) | (value_step > 0)).astype(np.uint8)
+    radius = -(-guard // cell)
+    if radius:
+        detail = cv2.dilate(detail, np.ones((2 * radius + 1, 2 * radius + 1), dtype=np.uint8))
+
+    instrumentation.count("pyramid_detail_cells", int(detail.sum()))
+    instrumentation.count("pyramid_cells", int(detail.size))
+    for x1, y1, x2, y2 in _detail_windows(detail, cell, w, h):
+        wx1, wy1 = max(0, x1 - guard), max(0, y1 - guard)
+        wx2, wy2 = min(w, x2 + guard), min(h, y2 + guard)
+
+        window = apply_morphology(threshold_image(gray[wy1:wy2, wx1:wx2], params), params)
+        mask[y1:y2, x1:x2] = window[y1 - wy1:y2 - wy1, x1 - wx1:x2 - wx1]
+
+    return mask
+
+
+def mask_in_one_pass(image, params):
+    """
+    True, если build_mask строит маску стадиями 1-3 по всему изображению
+    сразу (без полос tile_height и без режима pyramid_cell).
+    """
+    pyramid_cell = _param(params, "pyramid_cell")
+    tile_height = _param(params, "tile_height")
+    return not (pyramid_cell and pyramid_cell > 1) and not (tile_height and image.shape[0] > tile_height)
+
+
+def build_mask(image, params):
+    """
+    Стадии 1-3 (grayscale, бинаризация, морфология) для всего изображения.
+    Очень высокие изображения (tile_height) обрабатываются по полосам,
+    в режиме pyramid_cell - от грубого к точному (build_mask_pyramid).
+    """
+    pyramid_cell = _param(params, "pyramid_cell")
+    if pyramid_cell and pyramid_cell > 1:
+        return build_mask_pyramid(image, params, pyramid_cell)
+
+    tile_height = _param(params, "tile_height")
+    if tile_height and image.shape[0] > tile_height:
+        # ==============================
+        # 1-3) То же самое по горизонтальным полосам с перекрытием
+        # ==============================
+        return build_mask_tiled(image, params, tile_height)
+
+    # ==============================
+    # 1) Перевод в grayscale
+    # ==============================
+    gray = to_grayscale(image)
+
+    # ==============================
+    # 2) Бинаризация
+    # ==============================
+    thresh = threshold_image(gray, params)
+
+    # ==============================
+    # 3) Морфологическая обработка
+    # ==============================
+    return apply_morphology(thresh, params)
+
+
 def find_blocks_and_build_tree(image, params=None):
     """
     Функция учитывает параметры из 'params' (dict):
@@ -16,6 +415,10 @@ def find_blocks_and_build_tree(image, params=None):
       - approx_method: 'CHAIN_APPROX_SIMPLE' / 'CHAIN_APPROX_NONE' / ...
       - min_area, max_area
       - approx_polygons: (bool) аппроксимация контуров cv2.approxPolyDP
+      - tile_height: (int) высота полосы для обработки очень высоких
+        изображений по частям (0 - без разбиения), см. build_mask_tiled
+      - pyramid_cell: (int) размер ячейки грубого уровня для обработки от
+        грубого к точному (0 - выключено), см. build_mask_pyramid
 
     Возвращает dict с иерархией найденных блоков:
     {
@@ -53,121 +456,86 @@ def find_blocks_and_build_tree(image, params=None):
     }
     """
 
-    if params is None:
-        params = {}
+    return find_blocks_table(image, params).to_tree()
 
-    # Извлекаем параметры
-    threshold_method      = params.get("threshold_method", "fixed")
-    threshold_value       = params.get("threshold_value", 127)
-    max_value             = params.get("max_value", 255)
-    adaptive_block_size   = params.get("adaptive_block_size", 11)
-    adaptive_C            = params.get("adaptive_C", 2)
-    morphology_kernel_size = params.get("morphology_kernel_size", 3)
-    morphology_iterations  = params.get("morphology_iterations", 1)
-    min_block_width       = params.get("min_block_width", 20)
-    min_block_height      = params.get("min_block_height", 20)
-    retrieval_mode_str    = params.get("retrieval_mode", "RETR_EXTERNAL")
-    approx_method_str     = params.get("approx_method", "CHAIN_APPROX_SIMPLE")
-    min_area              = params.get("min_area", 0)
-    max_area              = params.get("max_area", 999999)
-    approx_polygons       = params.get("approx_polygons", False)
 
-    # Конвертация retrieval_mode_str в константу OpenCV
-    if retrieval_mode_str == "RETR_EXTERNAL":
-        retrieval_mode = cv2.RETR_EXTERNAL
-    elif retrieval_mode_str == "RETR_TREE":
-        retrieval_mode = cv2.RETR_TREE
-    elif retrieval_mode_str == "RETR_CCOMP":
-        retrieval_mode = cv2.RETR_CCOMP
-    else:
-        retrieval_mode = cv2.RETR_LIST
+def find_blocks_table(image, params=None):
+    """
+    То же, что find_blocks_and_build_tree, но возвращает дерево блоков
+    в колоночном виде (BlockTable), без промежуточных словарей.
+    """
+    if params is None:
+        params = {}
 
-    # Конвертация approx_method_str в константу OpenCV
-    if approx_method_str == "CHAIN_APPROX_NONE":
-        approx_method = cv2.CHAIN_APPROX_NONE
-    elif approx_method_str == "CHAIN_APPROX_TC89_L1":
-        approx_method = cv2.CHAIN_APPROX_TC89_L1
-    elif approx_method_str == "CHAIN_APPROX_TC89_KCOS":
-        approx_method = cv2.CHAIN_APPROX_TC89_KCOS
-    else:
-        approx_method = cv2.CHAIN_APPROX_SIMPLE
+    # ==============================
+    # 1-3) grayscale, бинаризация, морфология
+    # ==============================
+    with instrumentation.timer("segmentation_mask"):
+        thresh = build_mask(image, params)
 
     # ==============================
-    # 1) Перевод в grayscale
+    # 4) findContours (с иерархией)
     # ==============================
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    with instrumentation.timer("segmentation_contours"):
+        contours, hierarchy = find_contours(thresh, params)
 
     # ==============================
-    # 2) Бинаризация
+    # 5-7) Фильтрация блоков и построение дерева
     # ==============================
-    if threshold_method == "fixed":
-        # Простой фиксированный порог
-        _, thresh = cv2.threshold(gray, threshold_value, max_value, cv2.THRESH_BINARY_INV)
+    with instrumentation.timer("segmentation_tree"):
+        return build_block_table(contours, hierarchy, image.shape, params)
 
-    elif threshold_method == "otsu":
-        # OTSU автоматически определяет оптимальный порог
-        _, thresh = cv2.threshold(gray, 0, max_value, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
 
-    elif threshold_method == "triangle":
-        # Автоматический порог методом треугольника
-        _, thresh = cv2.threshold(gray, 0, max_value, cv2.THRESH_BINARY_INV | cv2.THRESH_TRIANGLE)
+def build_block_tree(contours, hierarchy, image_shape, params=None):
+    """
+    Стадия 5: фильтрация контуров по размеру/площади и построение иерархии
+    блоков (approx_polygons, min_block_width, min_block_height, min_area, max_area).
+    Возвращает JSON-дерево {"block_00": {...}}, см. build_block_table.
 
-    elif threshold_method == "adaptive_mean":
-        thresh = cv2.adaptiveThreshold(
-            gray,
-            max_value,
-            cv2.ADAPTIVE_THRESH_MEAN_C,
-            cv2.THRESH_BINARY_INV,
-            adaptive_block_size,
-            adaptive_C
-        )
+    :param contours, hierarchy: результат cv2.findContours.
+    :param image_shape: shape исходного изображения (для block_00).
+    """
+    return build_block_table(contours, hierarchy, image_shape, params).to_tree()
 
-    elif threshold_method == "adaptive_gaussian":
-        thresh = cv2.adaptiveThreshold(
-            gray,
-            max_value,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV,
-            adaptive_block_size,
-            adaptive_C
-        )
-    else:
-        # Fallback (на всякий случай)
-        _, thresh = cv2.threshold(gray, threshold_value, max_value, cv2.THRESH_BINARY_INV)
 
-    # ==============================
-    # 3) Морфологическая обработка
-    # ==============================
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (morphology_kernel_size, morphology_kernel_size))
-    for _ in range(morphology_iterations):
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+def build_block_table(contours, hierarchy, image_shape, params=None):
+    """
+    То же, что build_block_tree, но результат - BlockTable.
 
-    # ==============================
-    # 4) findContours (с иерархией)
-    # ==============================
-    contours, hierarchy = cv2.findContours(thresh, retrieval_mode, approx_method)
+    Иерархия строится итеративным обходом в глубину по массиву hierarchy
+    (next, prev, child, parent), каждый контур посещается один раз - O(N)
+    без рекурсии. Дети отфильтрованного контура переходят к ближайшему
+    сохранённому предку (или к block_00), поэтому поддеревья не теряются.
+
+    Имена блоков: block_00 -> block_00_00, block_00_01, ... ; ребёнок
+    блока получает имя родителя + "_NN", где NN - номер среди детей.
+    """
+    if params is None:
+        params = {}
+
+    min_block_width       = _param(params, "min_block_width")
+    min_block_height      = _param(params, "min_block_height")
+    min_area              = _param(params, "min_area")
+    max_area              = _param(params, "max_area")
+    approx_polygons       = _param(params, "approx_polygons")
+
+    # Строка 0 - block_00 (всё изображение)
+    h_img, w_img = image_shape[:2]
+    names = ["block_00"]
+    boxes = [(0, 0, w_img, h_img)]
+    parents = [-1]
 
     # Если нет контуров или нет иерархии, возвращаем пустой block_00
     if not contours or hierarchy is None:
-        h_img, w_img = image.shape[:2]
-        block_00_corners = [[0, 0], [w_img, 0], [w_img, h_img], [0, h_img]]
-        return {
-            "block_00": {
-                "coordinatesXY": block_00_corners,
-                "children": {}
-            }
-        }
+        return BlockTable.from_parents(names, boxes, parents)
 
     # hierarchy.shape = (1, N, 4) => берем [0], чтобы получить (N, 4)
     hierarchy = hierarchy[0]
 
     # ==============================
-    # 5) Сбор данных о блоках
+    # 5) Фильтрация контуров
     # ==============================
-    # Для каждого контура проверим размер, получим boundingRect, сохраним в структуре
-    # + запишем parent, child, next, prev (из hierarchy).
-    blocks_info = []
-
+    rects = [None] * len(contours)
     for i, c in enumerate(contours):
         if approx_polygons:
             epsilon = 0.01 * cv2.arcLength(c, True)
@@ -179,104 +547,43 @@ def find_blocks_and_build_tree(image, params=None):
         area = w * h
         if area < min_area or area > max_area:
             continue
+        rects[i] = (x, y, w, h)
 
-        # corners = boundingRect (для упрощения, как раньше)
-        corners = [
-            [x,       y],
-            [x + w,   y],
-            [x + w,   y + h],
-            [x,       y + h]
-        ]
-
-        next_i, prev_i, child_i, parent_i = hierarchy[i]
-
-        block_data = {
-            "index": i,
-            "coordinatesXY": corners,
-            "next_idx":   next_i,
-            "prev_idx":   prev_i,
-            "child_idx":  child_i,
-            "parent_idx": parent_i,
-        }
-        blocks_info.append(block_data)
-
-    # Превращаем список в словарь { i: block_data }
-    # Но учтите, что не все контуры попали в blocks_info (из-за фильтра размеров).
-    # Значит, доступ по child_i/parent_i может указывать на несуществующий индекс.
-    blocks_by_index = { b["index"]: b for b in blocks_info }
+    instrumentation.count("contours_found", len(contours))
+    instrumentation.count("contours_kept", sum(r is not None for r in rects))
 
     # ==============================
-    # 6) Строим иерархию контуров
+    # 6-7) Обход иерархии в глубину
     # ==============================
-    debug_counter = 0
-
-    def build_subtree(idx, parent_id, level):
-        nonlocal debug_counter
-        current_debug_id = debug_counter
-        debug_counter += 1
-
-        if idx not in blocks_by_index:
-            return ("missing_block", {})
-
-        node = blocks_by_index[idx]
-        children_map = {}
-
-        # Генерация уникального ID на основе parent_id и уровня вложенности
-        if "_" in parent_id:
-            parts = parent_id.split("_")
-            base_id = "_".join(parts[:-1])
-            sibling_num = int(parts[-1])
-            block_id = f"{base_id}_{sibling_num:02d}"
-        else:
-            block_id = f"{parent_id}_00"
-
-        sibling_counter = 0  # Локальный счетчик для детей текущего узла
-
-        def traverse_siblings(child_idx, base_id):
-            nonlocal sibling_counter
-            while child_idx != -1:
-                if child_idx not in blocks_by_index:
-                    break
-                
-                child_node = blocks_by_index[child_idx]
-                child_unique_id = f"{base_id}_{sibling_counter:02d}"
-                
-                c_name, c_dict = build_subtree(child_idx, child_unique_id, level+1)
-                children_map[c_name] = c_dict
-                
-                child_idx = child_node["next_idx"]
-                sibling_counter += 1
-
-        # Обработка дочерних элементов
-        first_child_idx = node["child_idx"]
-        if first_child_idx != -1:
-            traverse_siblings(first_child_idx, block_id)
-
-        return (f"block_{block_id}", {
-            "coordinatesXY": node["coordinatesXY"],
-            "children": children_map
-        })
-
-    # ==============================
-    # 7) Формируем block_00 + children
-    # ==============================
-    h_img, w_img = image.shape[:2]
-    debug_counter = 0
-
-    root_block = {
-        "block_00": {
-            "coordinatesXY": [[0, 0], [w_img, 0], [w_img, h_img], [0, h_img]],
-            "children": {}
-        }
-    }
-
-    root_counter = 0
-    for b in blocks_info:
-        if b["parent_idx"] == -1:
-            root_child_id = f"00_{root_counter:02d}"
-            idx_ = b["index"]
-            block_name, block_data = build_subtree(idx_, root_child_id, 0)
-            root_block["block_00"]["children"][block_name] = block_data
-            root_counter += 1
-    
-    return root_block
\ No newline at end of file
+    # Стек: (индекс контура, строка ближайшего сохранённого предка)
+    next_idx = hierarchy[:, 0].tolist()
+    child_idx = hierarchy[:, 2].tolist()
+    roots = np.flatnonzero(hierarchy[:, 3] == -1).tolist()
+    stack = [(i, 0) for i in reversed(roots)]
+    child_counts = [0]
+
+    while stack:
+        i, ancestor = stack.pop()
+
+        if rects[i] is not None:
+            row = len(names)
+            names.append(f"{names[ancestor]}_{child_counts[ancestor]:02d}")
+            child_counts[ancestor] += 1
+            child_counts.append(0)
+            boxes.append(rects[i])
+            parents.append(ancestor)
+            ancestor = row
+
+        # Дети контура - по цепочке next, в стек в обратном порядке
+        children = []
+        c = child_idx[i]
+        while c != -1:
+            children.append(c)
+            c = next_idx[c]
+        stack.extend((c, ancestor) for c in reversed(children))
+
+    table = BlockTable.from_parents(names, boxes, parents)
+    if instrumentation.is_enabled():
+        for depth, n in enumerate(np.bincount(table.depth())):
+            instrumentation.gauge("blocks", int(n), depth=depth)
+    return table
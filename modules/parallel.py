@@ -0,0 +1,57 @@
+# parallel.py
+"""
+Параллельная обработка блоков пулом потоков с сохранением порядка.
+
+OpenCV, вычислительные ядра NumPy / scikit-learn и инференс torch
+большую часть времени работают без GIL, поэтому анализ блоков одной
+страницы масштабируется потоками, без копирования изображения в процессы.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+
+def ordered_map(fn, items, workers=1, max_inflight=None):
+    """
+    fn(item) для каждого элемента items в пуле из workers потоков.
+
+    Результаты выдаются строго в порядке items, независимо от того, какой
+    поток закончил раньше. Одновременно в работе (или в ожидании выдачи)
+    не больше max_inflight элементов (по умолчанию 2 * workers): память
+    под ROI и промежуточные результаты ограничена, а items может быть
+    ленивым генератором. Исключение fn пробрасывается при выдаче результата
+    соответствующего элемента. workers <= 1 - обычный последовательный map.
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+
+    max_inflight = max(workers, max_inflight or 2 * workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            if len(pending) >= max_inflight:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+@contextmanager
+def single_threaded_kernels(workers):
+    """
+    При workers > 1 ограничивает пулы OpenMP / BLAS (scikit-learn, NumPy)
+    одним потоком: параллельность даёт пул блоков, а вложенные пулы в
+    каждом потоке только перегружали бы ядра. threadpoolctl - зависимость
+    scikit-learn; если его нет, ограничение не применяется.
+    """
+    limits = nullcontext()
+    if workers > 1:
+        try:
+            from threadpoolctl import threadpool_limits
+            limits = threadpool_limits(limits=1)
+        except ImportError:
+            pass
+    with limits:
+        yield
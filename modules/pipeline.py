@@ -0,0 +1,367 @@
+# pipeline.py
+"""
+Полный конвейер обработки одного изображения: сегментация (OpenCV),
+определение цветов и распознавание текста для каждого блока.
+Используется Streamlit-приложением (app.py) и пакетным режимом (batch_cli.py).
+"""
+
+import time
+
+import numpy as np
+
+from modules import instrumentation
+from modules.opencv_processing import find_blocks_and_build_tree, find_blocks_table
+from modules.block_tree import iter_blocks, block_bounds
+from modules.color_processing import (
+    detect_colors_rect, detect_colors_palette_rect, PaletteIndex, ColorStatsIndex
+)
+from modules.text_recognition_processing import extract_text_rect, read_text_batched, read_text_page
+from modules.text_presence import TextPresenceIndex
+from modules.roi_store import crop_digest, text_crop_digest
+from modules.parallel import ordered_map, single_threaded_kernels
+
+# Записано ли уже время первого запроса (см. _record_first_request)
+_first_request_done = False
+
+
+def analyze_rects(rects, image, params=None, roi_store=None):
+    """
+    Определяет цвета и распознаёт текст для списка прямоугольников
+    (x1, y1, x2, y2). Общая часть analyze_blocks и analyze_table.
+
+    Используемые параметры из 'params':
+      - ocr_mode: 'batched' / 'per_block' / 'page'
+      - color_mode: 'kmeans' / 'palette'
+      - palette_size, color_seed (для color_mode = 'palette')
+      - solid_fast_path, solid_std_threshold
+      - analysis_workers, analysis_max_inflight: анализ блоков (цвета, OCR
+        по блокам или пакетам) пулом из analysis_workers потоков, не больше
+        analysis_max_inflight блоков / пакетов в работе (0 - 2 * workers).
+        Результат не зависит от числа потоков: seed KMeans блока зависит
+        только от color_seed и содержимого блока (block_seed), результаты
+        собираются в порядке rects
+      - text_prefilter, text_prefilter_threshold: блоки, в которых по
+        оценке TextPresenceIndex нет текста, в OCR не отправляются
+        (текст "", кроме ocr_mode = 'page')
+
+    roi_store - хранилище результатов по хешам фрагментов (RoiStore) или
+    None: цвета и текст фрагментов, уже встречавшихся в этом или прошлых
+    запусках, берутся из него (кроме color_mode = 'palette' и
+    ocr_mode = 'page', где результат зависит от всей страницы).
+
+    Возвращает (список списков цветов, список текстов, список флагов
+    "OCR пропущен") в порядке rects.
+    """
+    if params is None:
+        params = {}
+
+    color_digests, text_digests = _crop_digests(rects, image, roi_store)
+
+    with instrumentation.timer("colors"):
+        color_context = _color_context(image, params)
+        colors = _rect_colors(rects, image, params, color_context, roi_store, color_digests)
+
+    text_index = _text_context(image, params)
+    with instrumentation.timer("ocr"):
+        texts, skipped = _rect_texts(rects, image, params, text_index, roi_store, text_digests)
+
+    return colors, texts, skipped
+
+
+def iter_analyzed_rects(rects, image, params=None, chunk_size=16, roi_store=None):
+    """
+    То же, что analyze_rects, но по частям: прямоугольники обрабатываются
+    группами по chunk_size, и после каждой группы выдаются кортежи
+    (индекс в rects, цвета, текст, OCR пропущен). Палитра, таблицы сумм и
+    индекс префильтра текста строятся один раз.
+
+    В режиме ocr_mode = 'page' OCR страницы выполняется один раз до первой
+    группы (текст раздаётся блокам только после полного прохода).
+    """
+    if params is None:
+        params = {}
+
+    with instrumentation.timer("colors"):
+        color_context = _color_context(image, params)
+    text_index = _text_context(image, params)
+
+    page_texts = None
+    if params.get("ocr_mode", "batched") == "page":
+        with instrumentation.timer("ocr"):
+            page_texts, _ = _rect_texts(rects, image, params)
+
+    for start in range(0, len(rects), chunk_size):
+        chunk = rects[start:start + chunk_size]
+        color_digests, text_digests = _crop_digests(chunk, image, roi_store)
+        with instrumentation.timer("colors"):
+            colors = _rect_colors(chunk, image, params, color_context, roi_store, color_digests)
+        if page_texts is not None:
+            texts, skipped = page_texts[start:start + chunk_size], [False] * len(chunk)
+        else:
+            with instrumentation.timer("ocr"):
+                texts, skipped = _rect_texts(chunk, image, params, text_index, roi_store, text_digests)
+        for offset, (block_colors, text, skip) in enumerate(zip(colors, texts, skipped)):
+            yield start + offset, block_colors, text, skip
+
+
+def detect_block_colors(rects, image, params=None):
+    """
+    Цвета фона для списка прямоугольников (x1, y1, x2, y2) - стадия цветов
+    analyze_rects (color_mode, solid_fast_path, analysis_workers и т.д.)
+    без хранилища фрагментов. Возвращает список списков цветов в порядке rects.
+    """
+    if params is None:
+        params = {}
+    return _rect_colors(rects, image, params, _color_context(image, params))
+
+
+def read_block_texts(rects, image, params=None):
+    """
+    Текст для списка прямоугольников - стадия OCR analyze_rects (ocr_mode,
+    analysis_workers, analysis_max_inflight) без префильтра текста и
+    хранилища фрагментов. Возвращает список текстов в порядке rects.
+    """
+    if params is None:
+        params = {}
+    return _read_texts(rects, image, params)
+
+
+def _color_context(image, params):
+    """Индексы, которые строятся один раз на изображение: (палитра или None, таблицы сумм или None)."""
+    # В режиме "palette" изображение квантуется один раз, цвета блоков берутся из палитры
+    palette_index = None
+    if params.get("color_mode", "kmeans") == "palette":
+        palette_index = PaletteIndex(
+            image,
+            n_colors=params.get("palette_size", 16),
+            seed=params.get("color_seed", 0)
+        )
+
+    # Таблицы сумм для быстрого пути однотонных блоков (строятся один раз на изображение)
+    color_stats = None
+    if params.get("solid_fast_path", True):
+        color_stats = ColorStatsIndex(image)
+    return palette_index, color_stats
+
+
+def _text_context(image, params):
+    """Индекс префильтра текста (один раз на изображение) или None, если префильтр не используется."""
+    # В режиме "page" OCR - один проход по странице, пропускать нечего
+    if not params.get("text_prefilter", False) or params.get("ocr_mode", "batched") == "page":
+        return None
+    with instrumentation.timer("text_prefilter"):
+        return TextPresenceIndex(image)
+
+
+def _crop_digests(rects, image, roi_store):
+    """
+    Хеши содержимого прямоугольников: (для цветов - crop_digest, для OCR -
+    text_crop_digest) или (None, None), если хранилище фрагментов не
+    используется. ROI для OCR отличается от ROI для цветов только у блоков,
+    касающихся правого или нижнего края, остальные хешируются один раз.
+    """
+    if roi_store is None:
+        return None, None
+    h, w = image.shape[:2]
+    with instrumentation.timer("roi_hash"):
+        color_digests = [crop_digest(image, rect) for rect in rects]
+        text_digests = [
+            text_crop_digest(image, rect) if rect[2] >= w or rect[3] >= h else digest
+            for rect, digest in zip(rects, color_digests)
+        ]
+    return color_digests, text_digests
+
+
+def _stored(roi_store, kind, digests, n, compute):
+    """
+    Результаты для n элементов: найденные в хранилище фрагментов по
+    хешу и compute(индексы) для остальных (одинаковые фрагменты считаются
+    один раз). Новые результаты записываются в хранилище.
+    """
+    if roi_store is None or kind is None:
+        return compute(list(range(n)))
+
+    found = roi_store.get_many(kind, digests)
+    values = [found.get(digest) for digest in digests]
+    instrumentation.count("roi_store_hits", sum(digest in found for digest in digests), kind=kind.split(":")[0])
+
+    # Первое вхождение каждого нового хеша (фрагменты без хеша - все)
+    first, repeats = {}, []
+    for i, digest in enumerate(digests):
+        if digest in found:
+            continue
+        if digest is None or digest not in first:
+            first[digest if digest is not None else ("none", i)] = i
+        else:
+            repeats.append((i, first[digest]))
+    missing = list(first.values())
+    instrumentation.count("roi_store_misses", len(missing), kind=kind.split(":")[0])
+
+    for i, value in zip(missing, compute(missing)):
+        values[i] = value
+    for i, source in repeats:
+        values[i] = values[source]
+    roi_store.put_many(kind, {digests[i]: values[i] for i in missing if digests[i] is not None})
+    return values
+
+
+def block_seed(color_seed, digest):
+    """
+    Seed выборки пикселей и KMeans блока: зависит только от color_seed и
+    содержимого блока (digest - crop_digest или None для пустой области).
+    Одинаковые фрагменты получают одинаковые цвета, где бы они ни находились,
+    поэтому результат из хранилища фрагментов совпадает с пересчитанным.
+    """
+    entropy = [int(color_seed) & 0xFFFFFFFF]
+    if digest is not None:
+        entropy.append(int(digest, 16))
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def _rect_colors(rects, image, params, color_context, roi_store=None, digests=None):
+    """Цвета фона для списка прямоугольников."""
+    palette_index, color_stats = color_context
+    solid_fast_path = color_stats is not None
+    solid_threshold = params.get("solid_std_threshold", 6.0)
+    color_seed = params.get("color_seed", 0)
+    workers = params.get("analysis_workers", 1)
+
+    def detect(i):
+        if palette_index is not None:
+            bg_info = detect_colors_palette_rect(*rects[i], palette_index, stats=color_stats,
+                                                 solid_threshold=solid_threshold)
+        else:
+            # Хеш блока нужен только для seed KMeans: без хранилища он считается
+            # лениво, однотонные блоки (быстрый путь) его не вычисляют
+            bg_info = detect_colors_rect(*rects[i], image, stats=color_stats, solid_threshold=solid_threshold,
+                                         seed=lambda: block_seed(color_seed, digests[i] if digests is not None
+                                                                 else crop_digest(image, rects[i])))
+        return bg_info["colors"]
+
+    def compute(indices):
+        # Определяем фон (пулом потоков, если analysis_workers > 1)
+        with single_threaded_kernels(workers):
+            return list(ordered_map(detect, indices, workers, params.get("analysis_max_inflight", 0)))
+
+    # Цвета по палитре зависят от всего изображения - в хранилище не попадают
+    kind = None
+    if palette_index is None:
+        kind = f"colors:kmeans:{int(solid_fast_path)}:{solid_threshold}:{color_seed}"
+    return _stored(roi_store, kind, digests, len(rects), compute)
+
+
+def _rect_texts(rects, image, params, text_index=None, roi_store=None, digests=None):
+    """
+    Текст для списка прямоугольников (в соответствии с ocr_mode) и флаги
+    пропуска OCR. Если задан text_index, в OCR отправляются только блоки
+    с оценкой не ниже text_prefilter_threshold, остальные получают "".
+    """
+    skipped = [False] * len(rects)
+    if text_index is not None:
+        threshold = params.get("text_prefilter_threshold", 40)
+        skipped = [not text_index.has_text(*rect, threshold) for rect in rects]
+        instrumentation.count("ocr_skipped", sum(skipped))
+    ocr_rects = [rect for rect, skip in zip(rects, skipped) if not skip]
+
+    ocr_mode = params.get("ocr_mode", "batched")
+    if roi_store is not None and ocr_mode != "page":
+        ocr_digests = [digest for digest, skip in zip(digests, skipped) if not skip]
+        # Если все блоки пропущены или найдены в хранилище, модель OCR не загружается
+        ocr_texts = _stored(roi_store, f"text:{ocr_mode}", ocr_digests, len(ocr_rects),
+                            lambda indices: _read_texts([ocr_rects[i] for i in indices], image, params)
+                            if indices else [])
+    else:
+        ocr_texts = _read_texts(ocr_rects, image, params) if ocr_rects else []
+
+    ocr_texts = iter(ocr_texts)
+    return ["" if skip else next(ocr_texts) for skip in skipped], skipped
+
+
+def _read_texts(rects, image, params):
+    """Текст для списка прямоугольников (в соответствии с ocr_mode)."""
+    ocr_mode = params.get("ocr_mode", "batched")
+    workers = params.get("analysis_workers", 1)
+    max_inflight = params.get("analysis_max_inflight", 0)
+    if ocr_mode == "batched":
+        # Пакетный OCR всех блоков (ROI сгруппированы по размеру)
+        return read_text_batched(rects, image, workers=workers, max_inflight=max_inflight)
+    if ocr_mode == "page":
+        # Один OCR-проход по всей странице, текст раздаётся блокам по вложенности
+        texts, _ = read_text_page(rects, image)
+        return texts
+    # Распознаем текст каждого блока отдельно
+    return list(ordered_map(lambda rect: extract_text_rect(*rect, image)["text"], rects, workers, max_inflight))
+
+
+def analyze_blocks(result_json, image, params=None, roi_store=None):
+    """
+    Для каждого блока дерева (кроме корневого block_00) определяет цвета и
+    распознаёт текст. Результат ({"colors": [...], "text": "..."})
+    записывается в словари блоков, блоки, пропущенные префильтром текста,
+    получают "ocr_skipped": true. Параметры и roi_store - см. analyze_rects.
+    """
+    entries = [data for _, data in iter_blocks(result_json["block_00"]["children"])]
+    colors, texts, skipped = analyze_rects([block_bounds(data) for data in entries], image, params, roi_store)
+    for data, block_colors, text, skip in zip(entries, colors, texts, skipped):
+        data["colors"] = block_colors
+        data["text"] = text
+        data.pop("ocr_skipped", None)
+        if skip:
+            data["ocr_skipped"] = True
+    return result_json
+
+
+def analyze_table(table, image, params=None, roi_store=None):
+    """
+    То же, что analyze_blocks, но для BlockTable: цвета и текст
+    записываются в столбцы table.colors / table.text, флаг "ocr_skipped" -
+    в table.extras.
+    """
+    rows = [i for i in range(len(table)) if table.parent[i] != -1]
+    colors, texts, skipped = analyze_rects([table.bounds(i) for i in rows], image, params, roi_store)
+    for i, block_colors, text, skip in zip(rows, colors, texts, skipped):
+        table.colors[i] = block_colors
+        table.text[i] = text
+        table.extras[i] = with_ocr_skipped(table.extras[i], skip)
+    return table
+
+
+def with_ocr_skipped(extra, skipped):
+    """Прочие поля блока (extras BlockTable) с флагом "ocr_skipped" (хранится только у пропущенных блоков)."""
+    extra = {k: v for k, v in (extra or {}).items() if k != "ocr_skipped"}
+    if skipped:
+        extra["ocr_skipped"] = True
+    return extra or None
+
+
+def _record_first_request(started):
+    """Время первого запроса процесса (включает ленивые импорты и загрузку моделей)."""
+    global _first_request_done
+    if not _first_request_done:
+        _first_request_done = True
+        instrumentation.startup_gauge("first_request_seconds", time.perf_counter() - started)
+
+
+def process_image(image, params=None, roi_store=None):
+    """
+    Сегментирует изображение и анализирует все найденные блоки.
+    Возвращает JSON-дерево блоков с цветами и текстом.
+    roi_store - хранилище результатов по фрагментам (см. analyze_rects).
+    """
+    started = time.perf_counter()
+    result_json = find_blocks_and_build_tree(image, params)
+    analyze_blocks(result_json, image, params, roi_store)
+    _record_first_request(started)
+    return result_json
+
+
+def process_image_table(image, params=None, roi_store=None):
+    """
+    То же, что process_image, но результат - BlockTable
+    (JSON-дерево можно получить через table.to_tree()).
+    """
+    started = time.perf_counter()
+    table = find_blocks_table(image, params)
+    analyze_table(table, image, params, roi_store)
+    _record_first_request(started)
+    return table
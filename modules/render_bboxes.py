@@ -2,6 +2,10 @@ import cv2
 import json
 import numpy as np
 
+from modules import instrumentation
+from modules.block_table import BlockTable
+from modules.result_binary import load_result
+
 # Если ваши данные JSON находятся в файле 'output-coordinates.json':
 JSON_FILE = 'output-coordinates.json'
 # Исходное изображение (как в примере, используем website_template_3.png):
@@ -49,7 +53,23 @@ def draw_block_recursively(image, block_dict, block_name, color, thickness):
     for child_name, child_dict in children.items():
         draw_block_recursively(image, child_dict, child_name, color=color, thickness=thickness)
 
+def draw_block_table(image, table, color, thickness):
+    """
+    Рисует все блоки BlockTable (в том же порядке, что и draw_block_recursively:
+    родитель, затем его дети).
+    """
+    corners = np.stack([table.x, table.y, table.x + table.w, table.y + table.h], axis=1)
+    for i, name in enumerate(table.names):
+        x1, y1, x2, y2 = (int(v) for v in corners[i])
+        coords_array = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.int32)
+        cv2.polylines(image, [coords_array], isClosed=True, color=color, thickness=thickness)
+        cv2.putText(image, name, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+
 def annotate_image(image, json_data, color=(0, 255, 0), thickness=2): # можно другой цвет и толщину
+    with instrumentation.timer("render"):
+        return _annotate_image(image, json_data, color, thickness)
+
+def _annotate_image(image, json_data, color, thickness):
     # 1. Загружаем изображение
     if image is None:
         raise FileNotFoundError(f"Не удалось открыть изображение {IMAGE_FILE}")
@@ -57,10 +77,86 @@ def annotate_image(image, json_data, color=(0, 255, 0), thickness=2): # можн
     # Создадим копию, чтобы не портить оригинал
     annotated = image.copy()
 
+    # Путь к файлу результата (.npz читается сразу в BlockTable)
+    json_data = load_result(json_data)
+
+    # Колоночное дерево (BlockTable) рисуется без преобразования в словари
+    if isinstance(json_data, BlockTable):
+        draw_block_table(annotated, json_data, color, thickness)
+        return annotated
+
     # Предположим, что у нас структура вида {"block_00": { ... }}
     block_00_dict = json_data.get("block_00", {})
     
     # 3. Рисуем block_00 и всех детей
     draw_block_recursively(annotated, block_00_dict, "block_00", color, thickness)
 
-    return annotated
\ No newline at end of file
+    return annotated
+
+# Цвета контуров по глубине вложенности (BGR), по кругу
+DEPTH_COLORS = (
+    (255, 0, 127), (0, 160, 255), (0, 200, 0), (200, 0, 200), (0, 0, 230), (200, 160, 0),
+)
+
+# Шаг сетки занятости для размещения подписей, пиксели
+_LABEL_CELL = 4
+
+
+def render_annotations(image, json_data, thickness=1, depth_colors=DEPTH_COLORS, labels=True, font_scale=0.5):
+    """
+    Быстрая отрисовка всех блоков: прямоугольники собираются в один массив
+    и рисуются одним вызовом cv2.polylines на каждый цвет глубины
+    (block_00 - глубина 0). Подписи размещаются без наложения: для каждого
+    блока (родители раньше детей) пробуются позиции над левым верхним углом,
+    внутри у верхнего края, под нижним краем и внутри у нижнего края; если
+    все заняты уже размещёнными подписями, подпись пропускается.
+
+    json_data - JSON-дерево, BlockTable или путь к файлу результата (.json / .npz).
+    """
+    with instrumentation.timer("render"):
+        table = load_result(json_data)
+        if not isinstance(table, BlockTable):
+            table = BlockTable.from_tree(table)
+
+        annotated = image.copy()
+        depth = table.depth()
+        x1, y1 = table.x, table.y
+        x2, y2 = table.x + table.w, table.y + table.h
+        corners = np.stack([
+            np.stack([x1, y1], axis=1), np.stack([x2, y1], axis=1),
+            np.stack([x2, y2], axis=1), np.stack([x1, y2], axis=1),
+        ], axis=1).astype(np.int32)  # (N, 4, 2)
+
+        n_colors = len(depth_colors)
+        for k in range(min(n_colors, int(depth.max()) + 1 if len(depth) else 0)):
+            rows = np.flatnonzero(depth % n_colors == k)
+            cv2.polylines(annotated, list(corners[rows]), isClosed=True, color=depth_colors[k], thickness=thickness)
+
+        if labels:
+            _draw_labels(annotated, table, depth, depth_colors, font_scale)
+        return annotated
+
+
+def _draw_labels(image, table, depth, depth_colors, font_scale):
+    h, w = image.shape[:2]
+    occupied = np.zeros((h // _LABEL_CELL + 1, w // _LABEL_CELL + 1), dtype=bool)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    for i, name in enumerate(table.names):
+        (tw, th), baseline = cv2.getTextSize(name, font, font_scale, 1)
+        x1, y1 = int(table.x[i]), int(table.y[i])
+        x2, y2 = x1 + int(table.w[i]), y1 + int(table.h[i])
+        # Левый нижний угол текста (как в cv2.putText) для каждой позиции
+        for tx, ty in ((x1, y1 - 5), (x1 + 2, y1 + th + 3), (x1, y2 + th + 3), (x1 + 2, y2 - baseline - 3)):
+            tx = min(max(tx, 0), max(w - tw, 0))
+            top, bottom = ty - th, ty + baseline
+            if top < 0 or bottom > h:
+                continue
+            cells = (slice(top // _LABEL_CELL, bottom // _LABEL_CELL + 1),
+                     slice(tx // _LABEL_CELL, (tx + tw) // _LABEL_CELL + 1))
+            if occupied[cells].any():
+                continue
+            occupied[cells] = True
+            cv2.putText(image, name, (tx, ty), font, font_scale,
+                        depth_colors[depth[i] % len(depth_colors)], 1, cv2.LINE_AA)
+            break
@@ -0,0 +1,152 @@
+# result_binary.py
+"""
+Компактный двоичный формат результата (.npz) для BlockTable.
+
+Координаты и связи дерева хранятся массивами NumPy, строки - в отдельной
+таблице: имена и тексты блоков склеены в один UTF-8 буфер (uint8),
+границы строк задаются массивом смещений. Цвета и прочие поля блока
+(extras) - один JSON-документ (два списка длины N) в отдельном буфере.
+Массивов в файле немного, так как каждый массив .npz читается отдельно.
+
+Массивы файла:
+    format_version    (1,) int32
+    rows              (N, 7) int32 - x, y, w, h, parent, first_child, next_sibling
+    strings_data      (M,) uint8 - склеенные UTF-8 строки: N имён, затем N текстов
+    strings_offsets   (2N + 1,) int64
+    text_present      (N,) bool - False, если текст не распознавался (None)
+    json_data         (K,) uint8 - UTF-8 JSON [colors, extras]
+
+Преобразование JSON <-> .npz без потерь: при сохранении JSON-дерева
+проверяется, что оно восстанавливается из таблицы один в один (координаты
+блоков - прямоугольники, как их строит сегментация).
+
+Преобразование файлов:
+    python -m modules.result_binary output-coordinates.json result.npz
+    python -m modules.result_binary result.npz output-coordinates.json
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from modules.block_table import BlockTable
+
+FORMAT_VERSION = 1
+
+
+def _pack_strings(values):
+    """Список строк -> (буфер uint8, смещения int64)."""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data, offsets):
+    buffer = data.tobytes()
+    bounds = offsets.tolist()
+    return [buffer[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+
+def save_table(table, path, compressed=True):
+    """Сохраняет BlockTable в .npz (np.savez_compressed или np.savez)."""
+    rows = np.stack([table.x, table.y, table.w, table.h,
+                     table.parent, table.first_child, table.next_sibling], axis=1).astype(np.int32)
+    strings_data, strings_offsets = _pack_strings(
+        table.names + [t if t is not None else "" for t in table.text]
+    )
+    json_doc = json.dumps([table.colors, [e or None for e in table.extras]], ensure_ascii=False)
+
+    with open(path, "wb") as f:
+        (np.savez_compressed if compressed else np.savez)(
+            f,
+            format_version=np.array([FORMAT_VERSION], dtype=np.int32),
+            rows=rows,
+            strings_data=strings_data,
+            strings_offsets=strings_offsets,
+            text_present=np.array([t is not None for t in table.text], dtype=bool),
+            json_data=np.frombuffer(json_doc.encode("utf-8"), dtype=np.uint8),
+        )
+
+
+def load_table(path):
+    """Загружает BlockTable из .npz."""
+    with np.load(path) as npz:
+        version = int(npz["format_version"][0])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия формата {version} в {path}")
+
+        rows = npz["rows"]
+        strings = _unpack_strings(npz["strings_data"], npz["strings_offsets"])
+        text_present = npz["text_present"].tolist()
+        colors, extras = json.loads(npz["json_data"].tobytes().decode("utf-8"))
+
+    n = len(rows)
+    text = [t if present else None for t, present in zip(strings[n:], text_present)]
+    return BlockTable(strings[:n], *(rows[:, k] for k in range(7)), colors=colors, text=text, extras=extras)
+
+
+def save_tree(tree, path, compressed=True):
+    """
+    Сохраняет JSON-дерево {"block_00": {...}} в .npz.
+    ValueError, если дерево нельзя восстановить без потерь
+    (например, координаты блока - не прямоугольник).
+    """
+    table = BlockTable.from_tree(tree)
+    if table.to_tree() != tree:
+        raise ValueError("Дерево нельзя сохранить без потерь: координаты блоков должны быть прямоугольниками")
+    save_table(table, path, compressed)
+    return table
+
+
+def load_tree(path):
+    """Загружает .npz и возвращает JSON-дерево {"block_00": {...}}."""
+    return load_table(path).to_tree()
+
+
+def json_to_npz(json_path, npz_path, compressed=True):
+    with open(json_path, "r", encoding="utf-8") as f:
+        save_tree(json.load(f), npz_path, compressed)
+
+
+def npz_to_json(npz_path, json_path, indent=2):
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(load_tree(npz_path), f, ensure_ascii=False, indent=indent)
+
+
+def load_result(source):
+    """
+    Результат из JSON-дерева, BlockTable или пути к файлу (.npz или .json).
+    Для .npz возвращается BlockTable, для .json - JSON-дерево.
+    """
+    if isinstance(source, (dict, BlockTable)):
+        return source
+    path = str(source)
+    if path.endswith(".npz"):
+        return load_table(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Преобразование результата JSON <-> .npz")
+    parser.add_argument("src", help="исходный файл (.json или .npz)")
+    parser.add_argument("dst", help="файл результата (.npz или .json)")
+    parser.add_argument("--no-compress", action="store_true", help="сохранить .npz без сжатия")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.src.endswith(".npz"):
+            npz_to_json(args.src, args.dst)
+        else:
+            json_to_npz(args.src, args.dst, compressed=not args.no_compress)
+    except (ValueError, OSError) as e:
+        print(f"Преобразование не удалось: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
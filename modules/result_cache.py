@@ -0,0 +1,154 @@
+# result_cache.py
+"""
+Дисковый кеш результатов обработки изображений.
+
+Ключ - хеш байтов изображения и канонизированного словаря параметров
+(defaults.json + изменения из панели управления). Значение - итоговое
+JSON-дерево блоков с цветами и текстом. Размер кеша ограничен, при
+переполнении удаляются давно не использованные записи (LRU).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
+# Меняется при изменении формата результата, чтобы не читать устаревшие записи
+CACHE_VERSION = 1
+
+
+def make_cache_key(image, params):
+    """
+    Ключ кеша: blake2b от байтов изображения и параметров.
+
+    :param image: байты файла изображения или np.ndarray (декодированное изображение).
+    :param params: словарь параметров обработки.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"v{CACHE_VERSION}".encode("ascii"))
+    if isinstance(image, np.ndarray):
+        h.update(f"{image.shape}{image.dtype}".encode("ascii"))
+        h.update(np.ascontiguousarray(image).data)
+    else:
+        h.update(bytes(image))
+    h.update(json.dumps(params or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Кеш результатов в каталоге cache_dir: по одному JSON-файлу на ключ.
+
+    Размер и порядок использования (LRU) берутся из самого каталога:
+    размер файлов и время модификации (обновляется при каждом чтении).
+    Поэтому один каталог могут использовать несколько процессов
+    (batch_cli --workers, Streamlit): ограничение max_bytes действует на
+    весь кеш, а вытеснение выполняется под файловой блокировкой каталога.
+    """
+
+    def __init__(self, cache_dir=".layout_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    @contextmanager
+    def _lock(self):
+        """Исключительная блокировка каталога (между процессами - через fcntl)."""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entries(self):
+        """Записи каталога [(mtime, key, размер)], от давно использованных к недавним."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # удалена другим процессом
+                entries.append((st.st_mtime, entry.name[:-5], st.st_size))
+        entries.sort()
+        return entries
+
+    def get(self, key):
+        """Возвращает сохранённый результат или None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Сохраняет результат и при необходимости вытесняет старые записи."""
+        data = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock():
+            self._evict()
+
+    def _evict(self):
+        # Выполняется под блокировкой каталога: размеры и порядок - по файлам
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Счётчики попаданий, промахов и вытеснений (этого процесса) + текущий размер кеша."""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+        }
@@ -0,0 +1,202 @@
+# roi_store.py
+"""
+Дисковое хранилище результатов анализа фрагментов (ROI) между запусками.
+
+Шапки, подвалы, меню и кнопки повторяются пиксель в пиксель на тысячах
+скриншотов. Ключ записи - хеш содержимого фрагмента (blake2b байтов ROI и
+его размеров) и "вид" результата: например, "text:batched" для OCR или
+"colors:kmeans:..." для цветов (в вид входят параметры, от которых зависит
+результат). Значение - JSON (текст блока или список цветов).
+
+Хранилище - один файл SQLite в режиме WAL: его можно открывать из
+нескольких процессов одновременно (batch_cli --workers, Streamlit).
+Размер ограничен max_bytes, при переполнении удаляются давно не
+использованные записи (LRU по времени последнего обращения).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Меняется при изменении формата значений или хешей, чтобы не читать устаревшие записи
+STORE_VERSION = 2
+
+# Ограничение SQLite на число параметров запроса (с запасом)
+_BATCH = 500
+
+
+def crop_digest(image, rect):
+    """
+    Хеш содержимого прямоугольника (x1, y1, x2, y2) изображения - ровно той
+    области, по которой определяются цвета (image[y1:y2, x1:x2], границы
+    обрезаются по размеру изображения). None - пустая область.
+    """
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = rect
+    return _roi_digest(image, max(0, min(x1, w)), max(0, min(y1, h)), max(0, min(x2, w)), max(0, min(y2, h)))
+
+
+def text_crop_digest(image, rect):
+    """
+    То же, что crop_digest, но для ROI, который отправляется в OCR: там
+    x2 / y2 ограничены последним столбцом / строкой изображения
+    (см. text_recognition_processing._rect_roi). Отличается от crop_digest
+    только для блоков, касающихся правого или нижнего края.
+    """
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = rect
+    return _roi_digest(image, max(0, min(x1, w - 1)), max(0, min(y1, h - 1)),
+                       max(0, min(x2, w - 1)), max(0, min(y2, h - 1)))
+
+
+def _roi_digest(image, x1, y1, x2, y2):
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    roi = image[y1:y2, x1:x2]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{roi.shape}{roi.dtype}".encode("ascii"))
+    digest.update(np.ascontiguousarray(roi).data)
+    return digest.hexdigest()
+
+
+class RoiStore:
+    """
+    Хранилище результатов по хешам фрагментов (SQLite, WAL).
+
+    Обращения к базе выполняются пакетами (get_many / put_many): один
+    запрос и одна транзакция на группу блоков, а не на блок.
+    """
+
+    def __init__(self, path=".roi_store.sqlite", max_bytes=256 * 1024 * 1024, timeout=30.0):
+        """
+        :param path: файл базы SQLite (создаётся при первом обращении).
+        :param max_bytes: ограничение суммарного размера значений (байт).
+        :param timeout: сколько ждать освобождения базы другим процессом (с).
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rois ("
+            " kind TEXT NOT NULL, digest TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (kind, digest)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rois_last_used ON rois (last_used)")
+
+    def _kind(self, kind):
+        return f"v{STORE_VERSION}:{kind}"
+
+    def get_many(self, kind, digests):
+        """
+        Сохранённые значения для списка хешей (None пропускаются).
+        Возвращает dict {digest: значение} только для найденных записей.
+        """
+        wanted = list(dict.fromkeys(d for d in digests if d is not None))
+        found = {}
+        with self._lock:
+            for start in range(0, len(wanted), _BATCH):
+                chunk = wanted[start:start + _BATCH]
+                rows = self._db.execute(
+                    f"SELECT digest, value FROM rois WHERE kind = ? AND digest IN ({','.join('?' * len(chunk))})",
+                    [self._kind(kind), *chunk],
+                ).fetchall()
+                found.update((digest, json.loads(value)) for digest, value in rows)
+            if found:
+                # Время обращения - отдельной короткой транзакцией на запись
+                # (чтение не держит блокировку базы)
+                self._write(
+                    "UPDATE rois SET last_used = ? WHERE kind = ? AND digest = ?",
+                    [(time.time(), self._kind(kind), digest) for digest in found],
+                )
+
+        self.hits[kind] = self.hits.get(kind, 0) + len(found)
+        self.misses[kind] = self.misses.get(kind, 0) + len(wanted) - len(found)
+        return found
+
+    def put_many(self, kind, values):
+        """Сохраняет {digest: значение} и при необходимости вытесняет старые записи."""
+        now = time.time()
+        rows = []
+        for digest, value in values.items():
+            if digest is None:
+                continue
+            data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+            rows.append((self._kind(kind), digest, data, len(data.encode("utf-8")) + len(digest), now))
+        if not rows:
+            return
+
+        with self._lock:
+            self._write("INSERT OR REPLACE INTO rois VALUES (?, ?, ?, ?, ?)", rows, evict=True)
+
+    def _write(self, sql, rows, evict=False):
+        # BEGIN IMMEDIATE: блокировка на запись берётся сразу (с ожиданием timeout),
+        # а не при первой записи внутри транзакции
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(sql, rows)
+            if evict:
+                self._evict()
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _evict(self):
+        # Выполняется внутри транзакции записи: другие процессы не пишут одновременно
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM rois").fetchone()[0]
+        while total > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT kind, digest, size FROM rois ORDER BY last_used LIMIT ?", (_BATCH,)
+            ).fetchall()
+            if not oldest:
+                break
+            removed = []
+            for kind, digest, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                removed.append((kind, digest))
+                total -= size
+            self._db.executemany("DELETE FROM rois WHERE kind = ? AND digest = ?", removed)
+            self.evictions += len(removed)
+
+    def stats(self):
+        """Попадания и промахи (по видам и всего) с момента reset_stats + размер хранилища."""
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM rois").fetchone()
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "by_kind": {
+                kind: {"hits": self.hits.get(kind, 0), "misses": self.misses.get(kind, 0)}
+                for kind in sorted(set(self.hits) | set(self.misses))
+            },
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def reset_stats(self):
+        """Обнуляет счётчики (например, перед обработкой очередного изображения)."""
+        self.hits, self.misses, self.evictions = {}, {}, 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,130 @@
+# segmentation_dag.py
+"""
+Мемоизация стадий сегментации для быстрого перебора параметров.
+
+Сегментация (modules/opencv_processing.py) разбита на стадии
+grayscale -> threshold -> morphology -> contours -> tree. Результат каждой
+стадии кешируется по ключу из параметров, от которых зависят она и все
+предыдущие стадии (см. stage_params). Поэтому изменение, например,
+min_block_width или max_area пересчитывает только последнюю стадию, а
+изменение morphology_kernel_size - морфологию и всё, что после неё.
+"""
+
+import itertools
+from collections import Counter, OrderedDict
+
+from modules import instrumentation
+from modules.opencv_processing import (
+    STAGES, stage_params, to_grayscale, threshold_image, apply_morphology,
+    find_contours, build_block_table, build_mask, mask_in_one_pass
+)
+
+
+class SegmentationMemo:
+    """
+    Кеш промежуточных результатов сегментации одного изображения.
+
+    Для каждой стадии (кроме последней - построения дерева, которая дешёвая
+    и возвращает изменяемый словарь) хранится не более max_entries
+    результатов (LRU).
+    """
+
+    def __init__(self, image, max_entries=16):
+        self.image = image
+        self.max_entries = max_entries
+        self._cache = {stage: OrderedDict() for stage in STAGES[:-1]}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _cached(self, stage, key, compute):
+        cache = self._cache[stage]
+        if key in cache:
+            cache.move_to_end(key)
+            self.hits[stage] += 1
+            return cache[key]
+
+        self.misses[stage] += 1
+        value = compute()
+        cache[key] = value
+        if len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return value
+
+    def run(self, params=None):
+        """То же, что find_blocks_and_build_tree(image, params), но с переиспользованием стадий."""
+        return self.run_table(params).to_tree()
+
+    def run_table(self, params=None):
+        """То же, что find_blocks_table(image, params), но с переиспользованием стадий."""
+        if params is None:
+            params = {}
+
+        key = ()
+        with instrumentation.timer("segmentation_mask"):
+            key += stage_params("grayscale", params)
+            if mask_in_one_pass(self.image, params):
+                gray = self._cached("grayscale", key, lambda: to_grayscale(self.image))
+
+                key += stage_params("threshold", params)
+                thresh = self._cached("threshold", key, lambda: threshold_image(gray, params))
+
+                key += stage_params("morphology", params)
+                morph = self._cached("morphology", key, lambda: apply_morphology(thresh, params))
+            else:
+                # Полосы (tile_height) или pyramid_cell: маска та же, что и за один
+                # проход, но полноразмерные grayscale и бинаризация не хранятся
+                key += stage_params("threshold", params) + stage_params("morphology", params)
+                morph = self._cached("morphology", key, lambda: build_mask(self.image, params))
+
+        with instrumentation.timer("segmentation_contours"):
+            key += stage_params("contours", params)
+            contours, hierarchy = self._cached("contours", key, lambda: find_contours(morph, params))
+
+        with instrumentation.timer("segmentation_tree"):
+            self.misses["tree"] += 1
+            return build_block_table(contours, hierarchy, self.image.shape, params)
+
+    def stats(self):
+        """Попадания и промахи по стадиям."""
+        return {stage: {"hits": self.hits[stage], "misses": self.misses[stage]} for stage in STAGES}
+
+
+def expand_grid(param_grid, base_params=None):
+    """
+    Разворачивает сетку параметров в список наборов.
+
+    :param param_grid: словарь {параметр: [значения]} (декартово произведение)
+                       или список словарей с готовыми наборами.
+    :param base_params: параметры по умолчанию (например, из defaults.json).
+    """
+    base_params = dict(base_params or {})
+    if isinstance(param_grid, dict):
+        names = list(param_grid)
+        return [
+            {**base_params, **dict(zip(names, values))}
+            for values in itertools.product(*(param_grid[name] for name in names))
+        ]
+    return [{**base_params, **p} for p in param_grid]
+
+
+def sweep(image, param_grid, base_params=None, memo=None):
+    """
+    Сегментирует изображение для каждого набора параметров из сетки,
+    разделяя общие промежуточные результаты между наборами.
+
+    Наборы обрабатываются в порядке, сгруппированном по ключам ранних стадий,
+    чтобы LRU-кеш стадий не вытеснял нужные результаты.
+
+    Возвращает (список (params, tree) в исходном порядке сетки, SegmentationMemo).
+    """
+    param_sets = expand_grid(param_grid, base_params)
+    if memo is None:
+        memo = SegmentationMemo(image)
+
+    def order_key(i):
+        return tuple(repr(stage_params(stage, param_sets[i])) for stage in STAGES)
+
+    results = [None] * len(param_sets)
+    for i in sorted(range(len(param_sets)), key=order_key):
+        results[i] = (param_sets[i], memo.run(param_sets[i]))
+    return results, memo
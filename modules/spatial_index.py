@@ -0,0 +1,54 @@
+# spatial_index.py
+"""
+Простой пространственный индекс (равномерная сетка) по прямоугольникам блоков.
+Позволяет быстро найти блоки, содержащие точку или пересекающие прямоугольник,
+без перебора всех блоков.
+"""
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Индекс по прямоугольникам (x1, y1, x2, y2).
+
+    Каждый прямоугольник регистрируется во всех ячейках сетки размера
+    cell_size x cell_size, которые он покрывает. Запрос проверяет только
+    прямоугольники из затронутых ячеек.
+    """
+
+    def __init__(self, boxes, cell_size=256):
+        """
+        :param boxes: массив (N, 4) или список [x1, y1, x2, y2].
+        :param cell_size: размер ячейки сетки в пикселях.
+        """
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.cell_size = cell_size
+        self.cells = {}
+
+        for i, (x1, y1, x2, y2) in enumerate(self.boxes.tolist()):
+            for cy in range(y1 // cell_size, y2 // cell_size + 1):
+                for cx in range(x1 // cell_size, x2 // cell_size + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def _candidates(self, x1, y1, x2, y2):
+        cs = self.cell_size
+        found = set()
+        for cy in range(int(y1) // cs, int(y2) // cs + 1):
+            for cx in range(int(x1) // cs, int(x2) // cs + 1):
+                found.update(self.cells.get((cx, cy), ()))
+        return np.fromiter(sorted(found), dtype=np.int64, count=len(found))
+
+    def query_point(self, x, y):
+        """Индексы прямоугольников, содержащих точку (x, y)."""
+        idx = self._candidates(x, y, x, y)
+        b = self.boxes[idx]
+        mask = (b[:, 0] <= x) & (x <= b[:, 2]) & (b[:, 1] <= y) & (y <= b[:, 3])
+        return idx[mask]
+
+    def query_box(self, x1, y1, x2, y2):
+        """Индексы прямоугольников, пересекающих прямоугольник (x1, y1, x2, y2)."""
+        idx = self._candidates(x1, y1, x2, y2)
+        b = self.boxes[idx]
+        mask = (b[:, 0] < x2) & (x1 < b[:, 2]) & (b[:, 1] < y2) & (y1 < b[:, 3])
+        return idx[mask]
@@ -1,54 +1,282 @@
 # text_recognition_processing.py
+import threading
+import time
+
 import cv2
-import easyocr
 import numpy as np
 
+from modules import instrumentation
+from modules.block_tree import iter_blocks, block_bounds
+from modules.parallel import ordered_map
+from modules.spatial_index import GridIndex
+
 # Инициализация модели при первом вызове
 _reader = None
+# Модель создаётся один раз, даже если OCR запущен из нескольких потоков
+_reader_lock = threading.Lock()
 
-def init_reader():
+def init_reader(model_storage_directory='./model_storage', download_enabled=True):
+    """
+    Создаёт EasyOCR Reader (один раз на процесс).
+    download_enabled=False - работа без сети: модели берутся только из
+    model_storage_directory (если их там нет, EasyOCR выбросит исключение).
+    """
     global _reader
-    if _reader is None:
+    if _reader is not None:
+        return
+    with _reader_lock:
+        if _reader is not None:
+            return
+        # easyocr (и torch) импортируются только при первой необходимости
+        started = time.perf_counter()
+        import easyocr
+        instrumentation.startup_gauge("import_seconds", time.perf_counter() - started, module="easyocr")
+
+        started = time.perf_counter()
         _reader = easyocr.Reader(
             ['ru', 'en'],  # Поддерживаемые языки
             gpu=False,      # Для использования CPU установите False
-            model_storage_directory='./model_storage',
-            download_enabled=True
+            model_storage_directory=model_storage_directory,
+            download_enabled=download_enabled
         )
+        instrumentation.startup_gauge("model_load_seconds", time.perf_counter() - started, model="easyocr")
 
-def extract_text(block_dict, image):
+def _block_roi(block_dict, image):
     """
-    Извлекает текст из блока с помощью EasyOCR
+    Вырезает ROI блока из изображения (BGR) с проверкой границ.
+    Возвращает None, если область пустая.
     """
-    init_reader()
-    
-    coords = block_dict["coordinatesXY"]
-    
-    # Получаем ограничивающий прямоугольник
-    x_values = [p[0] for p in coords]
-    y_values = [p[1] for p in coords]
-    x1, x2 = int(min(x_values)), int(max(x_values))
-    y1, y2 = int(min(y_values)), int(max(y_values))
-    
+    return _rect_roi(*block_bounds(block_dict), image)
+
+def _rect_roi(x1, y1, x2, y2, image):
+    """Как _block_roi, но для прямоугольника (x1, y1, x2, y2)."""
     # Проверка валидности координат
     h, w = image.shape[:2]
     x1 = max(0, min(x1, w-1))
     x2 = max(0, min(x2, w-1))
     y1 = max(0, min(y1, h-1))
     y2 = max(0, min(y2, h-1))
-    
+
     if x2 <= x1 or y2 <= y1:
+        return None
+
+    return image[y1:y2, x1:x2]
+
+def extract_text(block_dict, image):
+    """
+    Извлекает текст из блока с помощью EasyOCR
+    """
+    return extract_text_rect(*block_bounds(block_dict), image)
+
+def extract_text_rect(x1, y1, x2, y2, image):
+    """То же, что extract_text, но для прямоугольника (x1, y1, x2, y2)."""
+    init_reader()
+
+    roi = _rect_roi(x1, y1, x2, y2, image)
+    if roi is None:
         return {"text": ""}
-    
-    # Вырезаем ROI и конвертируем в RGB
-    roi = image[y1:y2, x1:x2]
+
+    instrumentation.count("ocr_crops")
+    instrumentation.count("ocr_crop_pixels", roi.shape[0] * roi.shape[1])
+
+    # Конвертируем в RGB
     roi_rgb = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
-    
+
     # Распознавание текста
     results = _reader.readtext(roi_rgb, paragraph=True)
-    
+
     # Собираем все тексты
     texts = [detection[1] for detection in results]
     full_text = "\n".join(texts)
-    
-    return {"text": full_text.strip()}
\ No newline at end of file
+
+    return {"text": full_text.strip()}
+
+def _bucket_dim(size, min_step):
+    """
+    Округляет размер стороны вверх до границы "корзины".
+    Шаг корзины растёт вместе с размером (~1/8 от ближайшей степени двойки),
+    поэтому паддинг не превышает ~25% стороны даже для больших блоков.
+    """
+    step = max(min_step, 1 << max(0, size.bit_length() - 3))
+    return -(-size // step) * step
+
+def _pad_to(roi_rgb, height, width):
+    """
+    Дополняет ROI справа и снизу до (height, width) цветом фона,
+    взятым как медиана пикселей рамки ROI. Координаты текста при этом
+    не смещаются.
+    """
+    h, w = roi_rgb.shape[:2]
+    if h == height and w == width:
+        return roi_rgb
+    border = np.concatenate([roi_rgb[0], roi_rgb[-1], roi_rgb[:, 0], roi_rgb[:, -1]])
+    fill = [int(v) for v in np.median(border, axis=0)]
+    return cv2.copyMakeBorder(
+        roi_rgb, 0, height - h, 0, width - w,
+        cv2.BORDER_CONSTANT, value=fill
+    )
+
+def extract_text_batched(blocks, image, bucket_step=32, batch_size=8):
+    """
+    Пакетное распознавание текста сразу для всех блоков дерева.
+
+    ROI всех блоков (включая вложенных детей) группируются по размеру:
+    каждая сторона округляется вверх до "корзины" (см. _bucket_dim), ROI
+    одной корзины дополняются до общего размера и прогоняются через
+    EasyOCR (детекция CRAFT + распознавание) одним вызовом readtext_batched,
+    не более batch_size изображений за раз.
+
+    Параметры:
+    - blocks: словарь блоков, например result_json["block_00"]["children"]
+    - image: исходное изображение в BGR
+    - bucket_step: минимальный шаг округления размеров ROI (px)
+    - batch_size: максимальное кол-во ROI в одном вызове EasyOCR
+
+    Результат записывается в те же словари блоков ({"text": ...}),
+    структура JSON не меняется. Возвращает кол-во обработанных блоков.
+    """
+    entries = [data for _, data in iter_blocks(blocks)]
+    texts = read_text_batched([block_bounds(data) for data in entries], image, bucket_step, batch_size)
+    for data, text in zip(entries, texts):
+        data["text"] = text
+    return len(entries)
+
+def read_text_batched(rects, image, bucket_step=32, batch_size=8, workers=1, max_inflight=None):
+    """
+    Пакетное распознавание текста для списка прямоугольников (x1, y1, x2, y2),
+    см. extract_text_batched. Возвращает список текстов в порядке rects.
+    workers > 1 - пакеты распознаются параллельно пулом потоков (не больше
+    max_inflight пакетов в работе, см. modules.parallel.ordered_map).
+    """
+    init_reader()
+
+    texts = [""] * len(rects)
+    buckets = {}
+    for i, rect in enumerate(rects):
+        roi = _rect_roi(*rect, image)
+        if roi is None:
+            continue
+        h, w = roi.shape[:2]
+        bucket = (_bucket_dim(h, bucket_step), _bucket_dim(w, bucket_step))
+        buckets.setdefault(bucket, []).append((i, roi))
+
+    def read_batch(task):
+        (bucket_h, bucket_w), chunk = task
+        batch = [
+            _pad_to(cv2.cvtColor(roi, cv2.COLOR_BGR2RGB), bucket_h, bucket_w)
+            for _, roi in chunk
+        ]
+        instrumentation.count("ocr_crops", len(batch))
+        instrumentation.count("ocr_crop_pixels", len(batch) * bucket_h * bucket_w)
+        return _reader.readtext_batched(batch, paragraph=True)
+
+    tasks = [
+        (bucket, items[start:start + batch_size])
+        for bucket, items in buckets.items()
+        for start in range(0, len(items), batch_size)
+    ]
+    for (_, chunk), results in zip(tasks, ordered_map(read_batch, tasks, workers, max_inflight)):
+        for (i, _), result in zip(chunk, results):
+            texts[i] = "\n".join(detection[1] for detection in result).strip()
+
+    return texts
+
+def _read_page_lines(image_rgb, band_height, band_overlap):
+    """
+    Детекция и распознавание строк текста на всём изображении.
+
+    Высокие страницы обрабатываются горизонтальными полосами с перекрытием
+    (CRAFT всё равно уменьшает вход до canvas_size). Строка засчитывается той
+    полосе, в "собственной" части которой лежит её центр (граница проходит
+    по середине перекрытия), поэтому строки из зоны перекрытия не дублируются.
+
+    Возвращает список (x1, y1, x2, y2, text) в координатах изображения.
+    """
+    h = image_rgb.shape[0]
+    lines = []
+    top = 0
+    while top < h:
+        bottom = min(h, top + band_height + band_overlap)
+        # "Собственная" часть полосы - середина перекрытий с соседями
+        own_top = 0 if top == 0 else top + band_overlap // 2
+        own_bottom = h if bottom == h else top + band_height + band_overlap // 2
+
+        instrumentation.count("ocr_crops")
+        instrumentation.count("ocr_crop_pixels", (bottom - top) * image_rgb.shape[1])
+        for box, text, _ in _reader.readtext(image_rgb[top:bottom], paragraph=False):
+            xs = [p[0] for p in box]
+            ys = [p[1] + top for p in box]
+            cy = (min(ys) + max(ys)) / 2
+            if own_top <= cy < own_bottom:
+                lines.append((min(xs), min(ys), max(xs), max(ys), text))
+
+        if bottom == h:
+            break
+        top += band_height
+
+    return lines
+
+def _join_lines(lines):
+    """
+    Собирает строки блока в текст: строки, перекрывающиеся по вертикали,
+    объединяются через пробел (слева направо), ряды - через перевод строки.
+    """
+    rows = []
+    for x1, y1, x2, y2, text in sorted(lines, key=lambda l: ((l[1] + l[3]) / 2, l[0])):
+        if rows and (y1 + y2) / 2 <= rows[-1][0]:
+            row = rows[-1]
+            row[0] = max(row[0], y2)
+            row[1].append((x1, text))
+        else:
+            rows.append([y2, [(x1, text)]])
+    return "\n".join(" ".join(t for _, t in sorted(row[1])) for row in rows).strip()
+
+def extract_text_page(blocks, image, band_height=2048, band_overlap=128, cell_size=256):
+    """
+    Распознавание текста одним проходом по всей странице.
+
+    Детекция и распознавание выполняются один раз на изображении целиком
+    (см. _read_page_lines), затем каждая строка приписывается всем блокам,
+    содержащим её центр. Поиск блоков идёт через пространственный индекс
+    по "coordinatesXY", поэтому стоимость OCR зависит от площади страницы,
+    а не от глубины дерева.
+
+    Параметры:
+    - blocks: словарь блоков, например result_json["block_00"]["children"]
+    - image: исходное изображение в BGR
+    - band_height, band_overlap: высота полосы и перекрытие для высоких страниц
+    - cell_size: размер ячейки пространственного индекса (px)
+
+    Результат записывается в поле "text" каждого блока.
+    Возвращает кол-во распознанных строк.
+    """
+    entries = [data for _, data in iter_blocks(blocks)]
+    texts, line_count = read_text_page([block_bounds(data) for data in entries], image,
+                                       band_height, band_overlap, cell_size)
+    for data, text in zip(entries, texts):
+        data["text"] = text
+    return line_count
+
+def read_text_page(rects, image, band_height=2048, band_overlap=128, cell_size=256):
+    """
+    Распознавание текста одним проходом по странице для списка прямоугольников
+    (x1, y1, x2, y2), см. extract_text_page.
+    Возвращает (список текстов в порядке rects, кол-во распознанных строк).
+    """
+    if not rects:
+        return [], 0
+
+    init_reader()
+
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    lines = _read_page_lines(image_rgb, band_height, band_overlap)
+
+    index = GridIndex(rects, cell_size=cell_size)
+    lines_by_block = [[] for _ in rects]
+    for line in lines:
+        cx = (line[0] + line[2]) / 2
+        cy = (line[1] + line[3]) / 2
+        for i in index.query_point(cx, cy):
+            lines_by_block[i].append(line)
+
+    return [_join_lines(block_lines) for block_lines in lines_by_block], len(lines)
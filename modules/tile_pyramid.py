@@ -0,0 +1,96 @@
+# tile_pyramid.py
+"""
+Пирамида тайлов для просмотра больших изображений (аннотированных страниц
+высотой в десятки тысяч пикселей) вместо одного огромного PNG.
+
+Уровень 0 - исходное разрешение, каждый следующий уменьшен вдвое, пока
+изображение не поместится в один тайл. Структура каталога:
+    <out_dir>/pyramid.json          - размеры, tile_size, число уровней, формат
+    <out_dir>/<level>/<col>_<row>.<format>
+
+Просмотрщик читает только тайлы, попавшие в видимую область (read_viewport).
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+META_FILE = "pyramid.json"
+
+
+def level_shape(height, width, level):
+    """Размер (h, w) уровня level (каждый уровень уменьшен вдвое, с округлением вверх)."""
+    scale = 1 << level
+    return -(-height // scale), -(-width // scale)
+
+
+def write_tile_pyramid(image, out_dir, tile_size=512, fmt="png", workers=None):
+    """
+    Записывает пирамиду тайлов изображения в out_dir.
+    Тайлы одного уровня кодируются параллельно (cv2.imwrite отпускает GIL).
+    Возвращает метаданные (содержимое pyramid.json).
+    """
+    height, width = image.shape[:2]
+    n_levels = 1
+    while max(level_shape(height, width, n_levels - 1)) > tile_size:
+        n_levels += 1
+
+    meta = {"width": width, "height": height, "tile_size": tile_size, "levels": n_levels, "format": fmt}
+    level_image = image
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for level in range(n_levels):
+            if level > 0:
+                h, w = level_shape(height, width, level)
+                level_image = cv2.resize(level_image, (w, h), interpolation=cv2.INTER_AREA)
+            level_dir = os.path.join(out_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+
+            h, w = level_image.shape[:2]
+            jobs = [
+                pool.submit(cv2.imwrite, os.path.join(level_dir, f"{col}_{row}.{fmt}"),
+                            level_image[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size])
+                for row in range(-(-h // tile_size))
+                for col in range(-(-w // tile_size))
+            ]
+            for job in jobs:
+                job.result()
+
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_meta(pyramid_dir):
+    with open(os.path.join(pyramid_dir, META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_viewport(pyramid_dir, level, x, y, width, height, meta=None):
+    """
+    Видимая область уровня level: прямоугольник (x, y, width, height)
+    в координатах этого уровня. С диска читаются только пересекающиеся тайлы.
+    """
+    if meta is None:
+        meta = load_meta(pyramid_dir)
+    tile_size = meta["tile_size"]
+    level_h, level_w = level_shape(meta["height"], meta["width"], level)
+    x, y = max(0, min(x, level_w - 1)), max(0, min(y, level_h - 1))
+    width, height = min(width, level_w - x), min(height, level_h - y)
+
+    viewport = None
+    for row in range(y // tile_size, (y + height - 1) // tile_size + 1):
+        for col in range(x // tile_size, (x + width - 1) // tile_size + 1):
+            tile = cv2.imread(os.path.join(pyramid_dir, str(level), f"{col}_{row}.{meta['format']}"), cv2.IMREAD_COLOR)
+            if tile is None:
+                continue
+            if viewport is None:
+                viewport = np.zeros((height, width, tile.shape[2]), dtype=tile.dtype)
+            # Пересечение тайла с видимой областью (в координатах уровня)
+            tx, ty = col * tile_size, row * tile_size
+            x1, y1 = max(x, tx), max(y, ty)
+            x2, y2 = min(x + width, tx + tile.shape[1]), min(y + height, ty + tile.shape[0])
+            viewport[y1 - y:y2 - y, x1 - x:x2 - x] = tile[y1 - ty:y2 - ty, x1 - tx:x2 - tx]
+    return viewport
@@ -0,0 +1,112 @@
+# warmup.py
+"""
+Прогрев процесса перед первым запросом: импорт тяжёлых библиотек,
+загрузка модели EasyOCR и самопроверка конвейера на синтетическом
+изображении. После warmup() время первого настоящего запроса не включает
+загрузку моделей.
+
+Время импорта, загрузки модели и первого запроса записываются как
+метрики запуска (instrumentation.startup_gauge).
+
+Запуск из командной строки (код возврата 1, если самопроверка не прошла):
+    python -m modules.warmup --model-dir ./model_storage --offline
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from modules import instrumentation
+
+# Текст синтетического изображения для самопроверки OCR
+SELF_TEST_TEXT = "Layout 2025"
+
+
+def _timed_import(module_name):
+    started = time.perf_counter()
+    importlib.import_module(module_name)
+    seconds = time.perf_counter() - started
+    instrumentation.startup_gauge("import_seconds", seconds, module=module_name)
+    return seconds
+
+
+def self_test_image():
+    """Белое изображение с рамкой-блоком и строкой текста внутри (BGR)."""
+    image = np.full((240, 480, 3), 255, dtype=np.uint8)
+    cv2.rectangle(image, (40, 40), (440, 200), (0, 0, 0), 2)
+    cv2.putText(image, SELF_TEST_TEXT, (90, 135), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3, cv2.LINE_AA)
+    return image
+
+
+def warmup(model_storage_directory="./model_storage", download_enabled=True, self_test=True, params=None):
+    """
+    Импортирует scikit-learn, загружает EasyOCR и (если self_test) прогоняет
+    сегментацию, определение цветов и OCR на self_test_image().
+
+    Возвращает отчёт:
+    {"imports": {модуль: с}, "model_load_s": с, "self_test": {...}, "total_s": с}
+    Если самопроверка не нашла блоков или текста - RuntimeError.
+    """
+    from modules.text_recognition_processing import init_reader
+
+    started = time.perf_counter()
+    report = {"imports": {"sklearn.cluster": round(_timed_import("sklearn.cluster"), 3)}}
+
+    # init_reader сам записывает время импорта easyocr и загрузки модели
+    load_started = time.perf_counter()
+    init_reader(model_storage_directory=model_storage_directory, download_enabled=download_enabled)
+    report["model_load_s"] = round(time.perf_counter() - load_started, 3)
+
+    if self_test:
+        # Конвейер вызывается по стадиям, а не через process_image, чтобы
+        # самопроверка не считалась "первым запросом"
+        from modules.opencv_processing import find_blocks_and_build_tree
+        from modules.pipeline import analyze_blocks
+
+        test_started = time.perf_counter()
+        image = self_test_image()
+        result_json = find_blocks_and_build_tree(image, params)
+        analyze_blocks(result_json, image, params)
+        blocks = list(result_json["block_00"]["children"].values())
+        text = " ".join(block.get("text", "") for block in blocks).strip()
+        seconds = time.perf_counter() - test_started
+        instrumentation.startup_gauge("self_test_seconds", seconds)
+
+        report["self_test"] = {
+            "ok": bool(blocks) and bool(text),
+            "seconds": round(seconds, 3),
+            "blocks": len(blocks),
+            "text": text,
+        }
+
+    report["total_s"] = round(time.perf_counter() - started, 3)
+    instrumentation.startup_gauge("warmup_seconds", report["total_s"])
+
+    if self_test and not report["self_test"]["ok"]:
+        raise RuntimeError(f"Самопроверка конвейера не прошла: {report['self_test']}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Прогрев и самопроверка моделей Layout Mapper")
+    parser.add_argument("--model-dir", default="./model_storage", help="каталог моделей EasyOCR")
+    parser.add_argument("--offline", action="store_true", help="не скачивать модели (только --model-dir)")
+    parser.add_argument("--no-self-test", action="store_true", help="только загрузить модели")
+    args = parser.parse_args(argv)
+
+    try:
+        report = warmup(args.model_dir, download_enabled=not args.offline, self_test=not args.no_self_test)
+    except (RuntimeError, ImportError, OSError) as e:
+        print(f"Прогрев не удался: {e}")
+        return 1
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,161 @@
 """
 yolo_processing.py
-Пример использования YOLO (ultralytics) для детекции элементов.
+Детекция элементов с помощью YOLO (ultralytics).
+
+Модели загружаются один раз на процесс и кешируются по пути к весам
+(get_model). Изображения можно передавать списком (пакетный inference),
+а высокие страницы - разбивать на перекрывающиеся полосы
+(detect_elements_tiled): детекции полос переводятся в координаты страницы
+и объединяются NMS между полосами.
+
+Результат детекции - словарь массивов NumPy:
+    {
+      "boxes": (N, 4) float32 [x1, y1, x2, y2],
+      "scores": (N,) float32,
+      "class_ids": (N,) int32,
+      "names": {class_id: class_name}
+    }
 """
 
+import threading
+
 import numpy as np
 import cv2
-# Для примера используем ultralytics
-# pip install ultralytics
-from ultralytics import YOLO
+
+# pip install ultralytics (импортируется при первой загрузке модели)
+
+# model_path -> загруженная модель YOLO
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model_path='yolov8n.pt'):
+    """Возвращает модель YOLO из кеша процесса (загружает при первом обращении)."""
+    with _models_lock:
+        model = _models.get(model_path)
+        if model is None:
+            from ultralytics import YOLO
+            model = _models[model_path] = YOLO(model_path)
+        return model
+
+
+def clear_model_cache():
+    with _models_lock:
+        _models.clear()
+
+
+def _empty_detections(names=None):
+    return {
+        "boxes": np.zeros((0, 4), dtype=np.float32),
+        "scores": np.zeros(0, dtype=np.float32),
+        "class_ids": np.zeros(0, dtype=np.int32),
+        "names": dict(names or {}),
+    }
+
+
+def _result_to_arrays(result, names):
+    """Боксы одного результата ultralytics -> массивы (без поэлементных циклов)."""
+    boxes = result.boxes
+    return {
+        "boxes": boxes.xyxy.cpu().numpy().astype(np.float32),
+        "scores": boxes.conf.cpu().numpy().astype(np.float32),
+        "class_ids": boxes.cls.cpu().numpy().astype(np.int32),
+        "names": names,
+    }
+
+
+def detect_elements_batch(images, model_path='yolov8n.pt', conf_threshold=0.5, batch_size=8, imgsz=640):
+    """
+    Пакетная детекция на списке изображений (BGR), не более batch_size за вызов модели.
+    Возвращает список словарей массивов (см. описание модуля) в порядке images.
+    """
+    model = get_model(model_path)
+    names = dict(model.names)
+
+    detections = []
+    for start in range(0, len(images), batch_size):
+        chunk = list(images[start:start + batch_size])
+        results = model.predict(source=chunk, conf=conf_threshold, imgsz=imgsz, device="cpu", verbose=False)
+        detections.extend(_result_to_arrays(result, names) for result in results)
+    return detections
+
+
+def tile_tops(height, tile_height, overlap):
+    """Верхние границы полос высотой tile_height с перекрытием overlap (последняя - у нижнего края)."""
+    if height <= tile_height:
+        return [0]
+    step = max(1, tile_height - overlap)
+    tops = list(range(0, height - tile_height, step))
+    tops.append(height - tile_height)
+    return tops
+
+
+def merge_tile_detections(tile_detections, tops, tile_height, image_height, overlap, iou_threshold=0.5):
+    """
+    Переводит детекции полос в координаты страницы и объединяет их.
+
+    Бокс, упирающийся во внутренний край полосы, обрезан этим краем; если он
+    не выше перекрытия, соседняя полоса видит объект целиком, поэтому такой
+    бокс отбрасывается. Оставшиеся дубликаты из зоны перекрытия убираются
+    NMS отдельно по каждому классу (cv2.dnn.NMSBoxesBatched).
+    """
+    names = {}
+    boxes, scores, class_ids = [], [], []
+    edge = 2.0
+    for det, top in zip(tile_detections, tops):
+        names.update(det["names"])
+        b = det["boxes"]
+        if len(b) == 0:
+            continue
+        bottom = min(top + tile_height, image_height)
+        cut_top = b[:, 1] <= edge if top > 0 else np.zeros(len(b), dtype=bool)
+        cut_bottom = b[:, 3] >= (bottom - top) - edge if bottom < image_height else np.zeros(len(b), dtype=bool)
+        small = (b[:, 3] - b[:, 1]) <= overlap
+        keep = ~((cut_top | cut_bottom) & small)
+
+        b = b[keep].copy()
+        b[:, [1, 3]] += top
+        boxes.append(b)
+        scores.append(det["scores"][keep])
+        class_ids.append(det["class_ids"][keep])
+
+    if not boxes:
+        return _empty_detections(names)
+
+    boxes = np.concatenate(boxes)
+    scores = np.concatenate(scores)
+    class_ids = np.concatenate(class_ids)
+    if len(boxes) == 0:
+        return _empty_detections(names)
+
+    xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+    keep = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), class_ids.tolist(), 0.0, iou_threshold)
+    keep = np.sort(np.asarray(keep, dtype=np.int64).reshape(-1))
+    return {"boxes": boxes[keep], "scores": scores[keep], "class_ids": class_ids[keep], "names": names}
+
+
+def detect_elements_tiled(image, model_path='yolov8n.pt', conf_threshold=0.5, tile_height=None,
+                          overlap=None, iou_threshold=0.5, batch_size=8, imgsz=640):
+    """
+    Детекция на высокой странице: полосы высотой tile_height (по умолчанию -
+    ширина изображения, т.е. квадратные полосы) с перекрытием overlap
+    (по умолчанию 1/4 полосы) прогоняются через модель пакетами, затем
+    объединяются (merge_tile_detections).
+    """
+    h, w = image.shape[:2]
+    tile_height = min(h, tile_height or w)
+    overlap = tile_height // 4 if overlap is None else overlap
+
+    tops = tile_tops(h, tile_height, overlap)
+    tiles = [image[top:top + tile_height] for top in tops]
+    tile_detections = detect_elements_batch(tiles, model_path, conf_threshold, batch_size, imgsz)
+    return merge_tile_detections(tile_detections, tops, tile_height, h, overlap, iou_threshold)
+
 
 def detect_elements_with_yolo(image, model_path='yolov8n.pt', conf_threshold=0.5):
     """
-    Загружает модель YOLO, прогоняет изображение, возвращает список детектированных объектов.
-    
+    Прогоняет изображение через (кешированную) модель YOLO, возвращает список детектированных объектов.
+
     :param image: np.ndarray (BGR)
     :param model_path: путь к весам YOLO (или название модели)
     :param conf_threshold: порог уверенности
@@ -27,31 +170,22 @@ def detect_elements_with_yolo(image, model_path='yolov8n.pt', conf_threshold=0.5
        ...
      ]
     """
-    # Загружаем модель
-    model = YOLO(model_path)
-
-    # Прогоняем inference
-    results = model.predict(source=image, conf=conf_threshold)
+    det = detect_elements_batch([image], model_path, conf_threshold)[0]
+    return detections_to_list(det)
 
-    detected = []
-    # results – объект ultralytics, обычно results[0] – список боксов
-    boxes = results[0].boxes
-    names = model.names  # словарь или список с названиями классов
 
-    for box in boxes:
-        cls_id = int(box.cls[0].item())  # класс
-        conf   = float(box.conf[0].item())
-        # xyxy формат
-        x1, y1, x2, y2 = box.xyxy[0].tolist()
-        w = x2 - x1
-        h = y2 - y1
-        class_name = names[cls_id] if cls_id in names else f"class_{cls_id}"
-
-        detected.append({
+def detections_to_list(det):
+    """Словарь массивов -> список словарей в формате detect_elements_with_yolo."""
+    boxes = det["boxes"].astype(np.float64)
+    names = det["names"]
+    return [
+        {
             "class_id": cls_id,
-            "class_name": class_name,
+            "class_name": names.get(cls_id, f"class_{cls_id}"),
             "confidence": conf,
-            "bbox": [int(x1), int(y1), int(w), int(h)]
-        })
-
-    return detected
+            "bbox": [int(x1), int(y1), int(x2 - x1), int(y2 - y1)],
+        }
+        for (x1, y1, x2, y2), conf, cls_id in zip(
+            boxes.tolist(), det["scores"].tolist(), det["class_ids"].tolist()
+        )
+    ]
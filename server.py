@@ -0,0 +1,456 @@
+"""
+server.py
+Локальный HTTP-сервис заданий на asyncio (только стандартная библиотека).
+
+Пример:
+    python server.py --port 8765 --workers 2 --queue-size 16 --offline
+
+Задания выполняются пулом процессов; в каждом процессе EasyOCR Reader
+создаётся один раз при запуске (см. _init_worker), поэтому задания не
+платят за загрузку моделей. Очередь ограничена: если она заполнена,
+сервер отвечает 503 и клиент должен повторить запрос позже.
+
+API:
+    POST /jobs                 - изображение в теле запроса (image/png, image/jpeg)
+                                 и изменения параметров в ?params=<JSON>,
+                                 либо JSON {"image": "<base64>", "params": {...}}.
+                                 Ответ 202: {"job_id": ..., "status": "queued"}
+    GET  /jobs/<id>            - состояние задания (и "result" после завершения)
+    GET  /jobs/<id>/stream     - NDJSON-поток состояний до завершения задания
+    GET  /health               - размер очереди, кол-во процессов и заданий
+
+Параметры задания - defaults.json + присланные изменения (как в app.py).
+С --offline модели берутся только из --model-dir (по умолчанию ./model_storage),
+сеть не используется.
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+DEFAULTS_FILE = "defaults.json"
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Сколько ждать запуска всех процессов пула (загрузка моделей, прогрев), с
+WORKER_START_TIMEOUT = 600
+
+HTTP_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+
+# Барьер запуска пула (см. _worker_started), задаётся в _init_worker
+_start_barrier = None
+
+
+def _init_worker(threads_per_worker, model_dir, offline, warmup=False, start_barrier=None):
+    """
+    Инициализация процесса пула: ограничение потоков OpenCV/torch и загрузка
+    EasyOCR Reader один раз на процесс. С warmup=True дополнительно
+    выполняется самопроверка конвейера (modules.warmup).
+    """
+    global _start_barrier
+    _start_barrier = start_barrier
+    cv2.setNumThreads(threads_per_worker)
+
+    import torch
+    from modules.text_recognition_processing import init_reader
+    torch.set_num_threads(threads_per_worker)
+    if warmup:
+        from modules.warmup import warmup as warmup_models
+        warmup_models(model_storage_directory=model_dir, download_enabled=not offline)
+    else:
+        init_reader(model_storage_directory=model_dir, download_enabled=not offline)
+
+
+def _worker_started(timeout):
+    """
+    Задание запуска пула: ждёт на барьере, пока такое же задание не возьмут
+    все процессы. Пул создаёт новый процесс, только если нет свободного,
+    поэтому ни одно из workers заданий не завершится раньше, чем запущены
+    и инициализированы все workers процессов.
+    """
+    _start_barrier.wait(timeout)
+    return os.getpid()
+
+
+def run_job(image_bytes, params):
+    """Обрабатывает одно изображение в процессе пула. Возвращает JSON-дерево блоков."""
+    from modules.pipeline import process_image
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Не удалось декодировать изображение")
+    return process_image(image, params)
+
+
+class Job:
+    """Задание и его состояние: queued -> running -> done / error."""
+
+    def __init__(self, image_bytes, params):
+        self.id = uuid.uuid4().hex
+        self.image_bytes = image_bytes
+        self.params = params
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Заменяется новым событием при каждой смене состояния (см. JobServer._set_status)
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+    def to_dict(self, with_result=True):
+        data = {"job_id": self.id, "status": self.status}
+        if self.started is not None:
+            data["queued_s"] = round(self.started - self.created, 3)
+        if self.finished is not None:
+            data["run_s"] = round(self.finished - self.started, 3)
+        if self.error is not None:
+            data["error"] = self.error
+        if with_result and self.status == "done":
+            data["result"] = self.result
+        return data
+
+
+class JobServer:
+    """
+    Очередь заданий ограниченного размера + пул процессов с "тёплыми" моделями.
+    Кол-во одновременно выполняемых заданий равно кол-ву процессов.
+    """
+
+    def __init__(self, params, workers=1, queue_size=16, threads_per_worker=None,
+                 model_dir="./model_storage", offline=False, max_finished=1000, warmup=False):
+        self.params = params
+        self.workers = workers
+        self.queue_size = queue_size
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.model_dir = model_dir
+        self.offline = offline
+        self.max_finished = max_finished
+        self.warmup = warmup
+
+        self.jobs = {}
+        # Завершённые задания, от старых к новым (хранится не более max_finished)
+        self._finished = OrderedDict()
+        self._queue = None
+        self._pool = None
+        self._pool_lock = None
+        self.pool_restarts = 0
+        self._dispatchers = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pool_lock = asyncio.Lock()
+        self._pool = await self._start_pool()
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def _start_pool(self):
+        """
+        Новый пул процессов, в котором уже запущены все процессы.
+
+        Пул запускает процессы лениво - запускаем все сразу, чтобы модели
+        были загружены до первого задания (ошибка загрузки видна при старте).
+        """
+        context = multiprocessing.get_context()
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_init_worker,
+            initargs=(self.threads_per_worker, self.model_dir, self.offline, self.warmup,
+                      context.Barrier(self.workers))
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            pids = await asyncio.gather(*(
+                loop.run_in_executor(pool, _worker_started, WORKER_START_TIMEOUT) for _ in range(self.workers)
+            ))
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        if len(set(pids)) != self.workers:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise RuntimeError(f"запущено {len(set(pids))} процессов пула из {self.workers}")
+        return pool
+
+    async def _restart_pool(self, broken):
+        """
+        Заменяет пул, сломанный аварийным завершением процесса (BrokenProcessPool):
+        иначе все следующие задания завершались бы ошибкой до перезапуска сервера.
+        """
+        async with self._pool_lock:
+            if self._pool is not broken:
+                return  # уже заменён другим диспетчером
+            broken.shutdown(wait=False, cancel_futures=True)
+            try:
+                self._pool = await self._start_pool()
+            except Exception as e:
+                # Старый (сломанный) пул остаётся: следующее задание завершится
+                # ошибкой и повторит попытку
+                print(f"Не удалось перезапустить пул процессов: {e!r}", file=sys.stderr, flush=True)
+                return
+            self.pool_restarts += 1
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, image_bytes, overrides):
+        """Ставит задание в очередь. Если очередь заполнена - asyncio.QueueFull."""
+        job = Job(image_bytes, {**self.params, **(overrides or {})})
+        self._queue.put_nowait(job)
+        self.jobs[job.id] = job
+        return job
+
+    def _set_status(self, job, status):
+        job.status = status
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.started = time.time()
+            self._set_status(job, "running")
+            pool, broken = self._pool, False
+            try:
+                job.result = await loop.run_in_executor(pool, run_job, job.image_bytes, job.params)
+                status = "done"
+            except BrokenProcessPool as e:
+                # Процесс пула аварийно завершился (например, нехватка памяти):
+                # задание завершается ошибкой, пул пересоздаётся
+                job.error = repr(e)
+                status, broken = "error", True
+            except Exception as e:
+                job.error = repr(e)
+                status = "error"
+            job.finished = time.time()
+            job.image_bytes = None
+            self._set_status(job, status)
+            self._queue.task_done()
+            self._remember_finished(job)
+            if broken:
+                await self._restart_pool(pool)
+
+    def _remember_finished(self, job):
+        self._finished[job.id] = job
+        while len(self._finished) > self.max_finished:
+            old_id, _ = self._finished.popitem(last=False)
+            self.jobs.pop(old_id, None)
+
+    def health(self):
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "jobs": len(self.jobs),
+            "pool_restarts": self.pool_restarts,
+            "offline": self.offline,
+        }
+
+    # ==============================
+    # HTTP
+    # ==============================
+    async def handle(self, reader, writer):
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            try:
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                await self._respond(writer, 400, {"error": "bad request line"})
+                return
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            try:
+                length = int(headers.get("content-length") or 0)
+                if length < 0:
+                    raise ValueError
+            except ValueError:
+                await self._respond(writer, 400, {"error": "bad content-length"})
+                return
+            if length > MAX_BODY_BYTES:
+                await self._respond(writer, 413, {"error": f"body larger than {MAX_BODY_BYTES} bytes"})
+                return
+            body = await reader.readexactly(length) if length else b""
+
+            url = urlsplit(target)
+            await self._route(writer, method, url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _route(self, writer, method, path, query, headers, body):
+        parts = path.strip("/").split("/")
+
+        if path == "/health" and method == "GET":
+            await self._respond(writer, 200, self.health())
+        elif path == "/jobs" and method == "POST":
+            await self._post_job(writer, query, headers, body)
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                await self._respond(writer, 404, {"error": "unknown job"})
+            elif len(parts) == 2:
+                await self._respond(writer, 200, job.to_dict())
+            elif parts[2] == "stream":
+                await self._stream(writer, job)
+            else:
+                await self._respond(writer, 404, {"error": "not found"})
+        elif path in ("/health", "/jobs") or parts[0] == "jobs":
+            await self._respond(writer, 405, {"error": "method not allowed"})
+        else:
+            await self._respond(writer, 404, {"error": "not found"})
+
+    async def _post_job(self, writer, query, headers, body):
+        try:
+            if headers.get("content-type", "").startswith("application/json"):
+                payload = json.loads(body)
+                image_bytes = base64.b64decode(payload["image"], validate=True)
+                overrides = payload.get("params") or {}
+            else:
+                image_bytes = body
+                overrides = json.loads(query["params"][0]) if "params" in query else {}
+            if not image_bytes:
+                raise ValueError("empty image")
+            if not isinstance(overrides, dict):
+                raise ValueError("params must be a JSON object")
+        except (ValueError, KeyError, TypeError, binascii.Error) as e:
+            await self._respond(writer, 400, {"error": f"bad job request: {e}"})
+            return
+
+        try:
+            job = self.submit(image_bytes, overrides)
+        except asyncio.QueueFull:
+            await self._respond(writer, 503, {"error": "queue is full"}, {"Retry-After": "1"})
+            return
+        await self._respond(writer, 202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+    async def _stream(self, writer, job):
+        """NDJSON-поток: по строке на каждое изменение состояния, последняя - с результатом."""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        while True:
+            changed = job.changed
+            line = json.dumps(job.to_dict(with_result=job.done), ensure_ascii=False).encode("utf-8") + b"\n"
+            writer.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            await writer.drain()
+            if job.done:
+                break
+            await changed.wait()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _respond(self, writer, status, data, extra_headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(server, host, port):
+    await server.start()
+    http = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Сервер заданий: http://{host}:{port} (процессов: {server.workers}, очередь: {server.queue_size})",
+          flush=True)
+    try:
+        async with http:
+            await http.serve_forever()
+    finally:
+        await server.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-сервис заданий Layout Mapper")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--params", default=DEFAULTS_FILE, help="JSON с параметрами по умолчанию")
+    parser.add_argument("--workers", type=int, default=1, help="кол-во процессов с загруженными моделями")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="потоков OpenCV/torch на процесс (по умолчанию ядра / процессы)")
+    parser.add_argument("--queue-size", type=int, default=16, help="макс. кол-во ожидающих заданий (иначе 503)")
+    parser.add_argument("--max-finished", type=int, default=1000, help="сколько завершённых заданий хранить")
+    parser.add_argument("--model-dir", default="./model_storage", help="каталог моделей EasyOCR")
+    parser.add_argument("--offline", action="store_true", help="не скачивать модели (только --model-dir)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="самопроверка моделей в каждом процессе до приёма заданий")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Без defaults.json - параметры по умолчанию модулей; явно указанный
+    # --params должен существовать
+    params = {}
+    if os.path.exists(args.params):
+        with open(args.params, "r", encoding="utf-8") as f:
+            params = json.load(f)
+    elif args.params != DEFAULTS_FILE:
+        print(f"Файл параметров не найден: {args.params}")
+        return 1
+
+    server = JobServer(
+        params,
+        workers=max(1, args.workers),
+        queue_size=max(1, args.queue_size),
+        threads_per_worker=args.threads_per_worker,
+        model_dir=args.model_dir,
+        offline=args.offline,
+        max_finished=args.max_finished,
+        warmup=args.warmup,
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -130,6 +130,74 @@ def render_control_panel():
             key="approx_polygons"
         )
 
+        st.number_input(
+            "tile_height (обработка полосами, 0 - выключено)",
+            min_value=0, max_value=100000, step=256,
+            value=current_params.get("tile_height", 0),
+            key="tile_height"
+        )
+
+        st.number_input(
+            "pyramid_cell (от грубого к точному, 0 - выключено)",
+            min_value=0, max_value=256, step=4,
+            value=current_params.get("pyramid_cell", 0),
+            key="pyramid_cell"
+        )
+
+        st.selectbox(
+            "Режим OCR (ocr_mode)",
+            ["batched", "per_block", "page"],
+            index=["batched", "per_block", "page"].index(current_params.get("ocr_mode", "batched")),
+            key="ocr_mode"
+        )
+
+        st.selectbox(
+            "Определение цветов (color_mode)",
+            ["kmeans", "palette"],
+            index=["kmeans", "palette"].index(current_params.get("color_mode", "kmeans")),
+            key="color_mode"
+        )
+
+        st.number_input(
+            "Размер палитры (palette_size), если color_mode = palette",
+            min_value=2, max_value=64, step=1,
+            value=current_params.get("palette_size", 16),
+            key="palette_size"
+        )
+
+        st.checkbox(
+            "Быстрый путь для однотонных блоков (solid_fast_path)",
+            value=current_params.get("solid_fast_path", True),
+            key="solid_fast_path"
+        )
+
+        st.checkbox(
+            "Не отправлять в OCR блоки без текста (text_prefilter)",
+            value=current_params.get("text_prefilter", False),
+            key="text_prefilter"
+        )
+
+        st.number_input(
+            "text_prefilter_threshold (контурных пикселей текста в блоке)",
+            min_value=0, max_value=100000, step=10,
+            value=current_params.get("text_prefilter_threshold", 40),
+            key="text_prefilter_threshold"
+        )
+
+        st.number_input(
+            "analysis_workers (потоков анализа блоков)",
+            min_value=1, max_value=64, step=1,
+            value=current_params.get("analysis_workers", 1),
+            key="analysis_workers"
+        )
+
+        st.number_input(
+            "analysis_max_inflight (блоков в работе, 0 - 2 x analysis_workers)",
+            min_value=0, max_value=1024, step=1,
+            value=current_params.get("analysis_max_inflight", 0),
+            key="analysis_max_inflight"
+        )
+
         # Кнопка отправки формы
         if st.form_submit_button("Apply"):
             # Получаем ВСЕ параметры из session_state